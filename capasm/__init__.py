@@ -1,3 +1,22 @@
-from .assembler import capasm
-from .ncas import ncas
-from .captools import caplif, caplex, capglo, caprom, capconv
+#
+# Entry points of the CAPASM software suite. The module of an entry point
+# is imported when the entry point is called, so that e.g. caprom does
+# not load the assemblers. The console scripts refer to the modules of the
+# entry points directly. There is no entry point ncas here, because
+# capasm.ncas is the module of the ncas assembler, use capasm.ncas.ncas.
+#
+def _lazyEntryPoint(moduleName,functionName):
+   def entryPoint():
+      import importlib
+      module=importlib.import_module(moduleName,package=__name__)
+      return getattr(module,functionName)()
+   entryPoint.__name__=functionName
+   entryPoint.__qualname__=functionName
+   return entryPoint
+
+capasm=_lazyEntryPoint(".assembler","capasm")
+caplif=_lazyEntryPoint(".captools","caplif")
+caplex=_lazyEntryPoint(".captools","caplex")
+capglo=_lazyEntryPoint(".captools","capglo")
+caprom=_lazyEntryPoint(".captools","caprom")
+capconv=_lazyEntryPoint(".captools","capconv")
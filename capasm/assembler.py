@@ -80,7 +80,7 @@ from .capcommon import capasmError,BYTESTOSTORE,parseFunc,OPCODES, \
      clsObjWriter, clsListWriter, clsSourceReader, clsParserInfo, \
      clsParsedOperand, clsCodeInfo, clsInvalidOperand, clsParsedNumber, \
      clsParsedString, clsParsedLabel, clsParsedRegister, clsCodeGeneratorBase, \
-     clsParserBase
+     clsParserBase, clsAssemblerBase, clsAssemblyResult, clsDialect
 
 #
 # Parser ---------------------------------------------------------------
@@ -108,7 +108,7 @@ class clsParser(clsParserBase):
          self.addError(MESSAGE.E_NOTALLOWED_HERE)
       addrIndex=0
       if len(self.__scannedOperand__)==2:
-         if self.__scannedOperand__[0].string.upper()== "ROM":
+         if self.__scannedOperand__[0].upper()== "ROM":
             addrIndex=1
          else:
             self.addError(MESSAGE.E_ROM_EXPECTED)
@@ -133,12 +133,12 @@ class clsParser(clsParserBase):
          self.addError(MESSAGE.E_MISSING_LABEL)
          return []
 
-      label=self.__scannedLabel__.string
+      label=self.__scannedLabel__
       address=self.parseAddress(0)
 
       if address!=clsParserInfo.ILL_NUMBER:
          size=2
-         if self.__scannedOpcode__.string=="EQU":
+         if self.__scannedOpcode__=="EQU":
             if address < 256:
                size=1
             ret=SymDict.enter(label,clsSymDict.SYM_EQU,address, size,\
@@ -154,7 +154,7 @@ class clsParser(clsParserBase):
 #  Parse DEF and VAL
 #
    def pDef(self):
-      if self.__scannedOpcode__.string== "DEF":
+      if self.__scannedOpcode__== "DEF":
          self.__opcodeLen__=2
       else:
          self.__opcodeLen__=1
@@ -183,7 +183,7 @@ class clsParser(clsParserBase):
 #
 #     Determine mode
 #
-      if self.__scannedOperand__[0].string[0]=="=":
+      if self.__scannedOperand__[0][0]=="=":
 #
 #        JSB literal direct
 #
@@ -227,7 +227,7 @@ class clsParser(clsParserBase):
 #     and parse opcodes
 #
       if len(self.__opcode__)==3:       # ADB, ADM, SBB, SBM, CMB, CMM, ANM
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_IMMEDIATE
             if byteMode== clsParserInfo.BM_SINGLEBYTE:
                numberOfBytesToStore=1
@@ -251,7 +251,7 @@ class clsParser(clsParserBase):
                parsedOperand.append(self.parseAr())
       else:                            # ADBD, ADMD, SBBD, ANMD
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_DIRECT
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=2:
@@ -289,7 +289,7 @@ class clsParser(clsParserBase):
 #
       if len(self.__opcode__)==3:       # LDB, STB, LDM, STM
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_IMMEDIATE
             if byteMode== clsParserInfo.BM_SINGLEBYTE:
                numberOfBytesToStore=1
@@ -305,7 +305,7 @@ class clsParser(clsParserBase):
                self.__opcodeLen__+= ret[0] 
             parsedOperand.extend(ret[1])
 
-         elif self.__scannedOperand__[1].string[0] in "xX":
+         elif self.__scannedOperand__[1][0] in "xX":
             self.addError(MESSAGE.E_ILLADDRESSMODE)
 
          else:
@@ -317,7 +317,7 @@ class clsParser(clsParserBase):
 
       elif self.__opcode__[-1]=="D":         # LDBD, STBD, LDMD, STMD
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_DIRECT
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=2:
@@ -325,7 +325,7 @@ class clsParser(clsParserBase):
             else:
                parsedOperand.append(self.parseLabelOp(1))
 
-         elif self.__scannedOperand__[1].string[0] in "xX":
+         elif self.__scannedOperand__[1][0] in "xX":
             self.__addressMode__=clsParserInfo.AM_INDEX_DIRECT
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=3:
@@ -343,7 +343,7 @@ class clsParser(clsParserBase):
 
       elif self.__opcode__[-1]=="I":       # LDBI, STBI, LDMI, STMI
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_INDIRECT
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=2:
@@ -351,7 +351,7 @@ class clsParser(clsParserBase):
             else:
                parsedOperand.append(self.parseLabelOp(1))
 
-         elif self.__scannedOperand__[1].string[0] in "xX":
+         elif self.__scannedOperand__[1][0] in "xX":
             self.__addressMode__=clsParserInfo.AM_INDEX_INDIRECT
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=3:
@@ -386,15 +386,15 @@ class clsCodeGenerator(clsCodeGeneratorBase):
 #
 # This is the top level class for the entire assembler
 #
-class clsAssembler(object):
+class clsAssembler(clsAssemblerBase):
 
    def __init__(self):
        super().__init__()
 #
-#  extend the OPCODES dictionary with the capasm specific OPS
+#  capasm specific OPS which extend the OPCODES dictionary
 #
    def extendOpcodes(self):
-      OPCODES.extendDict( {
+      return {
       "RTN" : ["pNoPer","gdirect",0o236,0,0,False,False,False],
       "ABS"  : ["pAbs","gNil",0,1,2,False,False,False],
       "FIN"  : ["pFin","gNil",0,0,0,False,False,False],
@@ -423,11 +423,33 @@ class clsAssembler(object):
       "LNK"   : ["pInc","gNil",0,1,1,False,False,False],
       "HED"   : ["pHed","gHed",0,1,1,False,False,False],
       "LOC"   : ["pLoc","gGenZ",0,1,1,False,False,False],
-      })
+      }
+#
+#  Create the dialect object of capasm
+#
+   def createDialect(self):
+       return clsDialect("CAPASM",self.extendOpcodes(), \
+          parseFunc.CAPASM_DELIMITER, parseFunc.CAPASM_LABELMATCHSTRING, \
+          "!","!",'"', \
+          { clsSymDict.SYM_DAD: "DAD", \
+            clsSymDict.SYM_EQU: "EQU", \
+            clsSymDict.SYM_LCL: "LCL" })
+#
+#  Create parser and code generator objects
+#
+   def createParser(self,infile):
+       return clsParser(self.__globVar__,infile)
+
+   def createCodeGenerator(self):
+       return clsCodeGenerator(self.__globVar__)
 #
 #  Assemble method. The method takes the values of the command line
 #  switches and parameters. This method may be called multiple times
-#  with different parameters.
+#  with different parameters. If buildCache is a clsBuildCache object,
+#  the results are taken from or stored in the build cache. If depFileName
+#  or depJsonFileName are specified, a make compatible or a JSON dependency
+#  file is written. If profiler is a clsProfiler object, the phases of the 
+#  assembly are timed.
 #  Returns:
 #     False:  everything o.k.
 #     True:   errors in assembly
@@ -436,149 +458,45 @@ class clsAssembler(object):
    def assemble(self,sourceFileName,binFileName="",listFileName="", \
        referenceOpt=1, pageSize=66, pageWidth=80, \
        extendedChecks=False,  symNamLen=6,useHex=False, definedFlags=[], \
-       globalSymbolFile="none"):
-#
-#      initialize opcodes
-#
-       self.extendOpcodes()
-#
-#      initialize error condition
-#
-       hasError=False
-#
-#      Create global variables data object
-#
-       self.__globVar__=clsGlobVar()
-       self.__globVar__.useHex=useHex
-       self.__sourceFileName__= sourceFileName
-       self.__globalSymbolFile__= globalSymbolFile
-       self.__globVar__.progName="CAPASM"
-#
-#      Initalize basic parser functions
-#
-       parseFunc.DELIMITER='"'
-       parseFunc.LABELMATCHSTRING="[(^0-9)(\x20-\x7A|\|)][\x20-\x7A|\|]{0,"
-#
-#      Build file name of object file if not specified
-#
-       if binFileName=="":
-          self.__binFileName__= \
-               Path(self.__sourceFileName__).with_suffix(".bin").name
-       else:
-          self.__binFileName__=binFileName
-       self.__listFileName__= listFileName
-       self.__referenceOpt__= referenceOpt
-       self.__pageSize__= pageSize
-       self.__pageWidth__= pageWidth
-       self.__extendedChecks__= extendedChecks
-       self.__symNamLen__= symNamLen
-#
-#      Create symbol table object
-#
-       self.__globVar__.symDict=clsSymDict( self.__extendedChecks__, \
-            self.__globalSymbolFile__, \
-           { clsSymDict.SYM_DAD: "DAD", \
-             clsSymDict.SYM_EQU: "EQU", \
-             clsSymDict.SYM_LCL: "LCL" })
-#
-#      Create conditional assembly object
-#
-       self.__globVar__.condAssembly=clsConditionalAssembly(definedFlags)
-#
-#      Check if we run in regression test mode
-#
-       if os.getenv("CAPASMREGRESSIONTEST"):
-          self.__globVar__.isRegressionTest=True
-#
-#      get directory of source file
-#
-       self.__globVar__.sourceFileDirectory=\
-          str(Path(self.__sourceFileName__).parent)
-#
-#      Check extended checks mode
-#
-       if self.__extendedChecks__:
-          self.__globVar__.allowHashRLiteral=False
-#
-#      Set symbol name length
-#
-       self.__globVar__.symNamLen=self.__symNamLen__
-#
-#      Pass 1: scan and parse lines, accumulate results in the
-#      pass1Info list
-#
-       pass1Info=[]
-       infile=clsSourceReader(self.__sourceFileName__)
-       lineScanner=clsLineScanner("!","!",'"')
-       lineParser=clsParser(self.__globVar__,infile)
-
-       while not self.__globVar__.isFin:
-          line=infile.read()
-          if line is None:
-             if pass1Info:
-                pass1Info[-1].messages.append(MESSAGE.E_MISSING_FIN)
-                break
-             else:
-                MESSAGE.fatalError("Empty source file")
-#
-#         Scan line
-#
-          scannedLine=lineScanner.scanLine(line)
-#
-#         Parse line
-#
-          parsedLine=lineParser.parseLine(scannedLine,line)
-          pass1Info.append(parsedLine)
-#
-#         Increment PC and codeLen with length of instructions
-#
-          self.__globVar__.PC+=parsedLine.opcodeLen
-          self.__globVar__.codeLen+=parsedLine.opcodeLen
-
-       infile=None
-       lineScanner=None
-       lineParser=None
-#
-#      Passe 2: process content of pass1Info list, generate code,
-#      write code to binary output file and output information to 
-#      the list file
-#
-       objWriter=clsObjWriter(self.__binFileName__)
-       listWriter=clsListWriter(self.__globVar__,self.__listFileName__, \
-                  self.__pageSize__, self.__pageWidth__)
-       codeGenerator=clsCodeGenerator(self.__globVar__)
-
-       for parsedLine in pass1Info:
-#
-#         Generate code
-#
-          codeInfo=codeGenerator.generate(parsedLine)
-#
-#         Write code
-#
-          objWriter.writeCode(codeInfo,parsedLine)
-#
-#         Write listing
-#
-          listWriter.writeLine(parsedLine,codeInfo)
-
-       codeGenerator=None
-       objWriter=None
-
-       listWriter.writeSymbols(self.__referenceOpt__)
-       listWriter.writeStatistics()
-       listWriter=None
-#
-#      delete objectfile if any errors
-#
-       if self.__globVar__.errorCount>0:
-          os.remove(self.__binFileName__)
-          hasError=True
-       self.__globVar__=None
-#
-#      return error condition
+       globalSymbolFile="none", buildCache=None, depFileName="", \
+       depJsonFileName="", profiler=None):
+       self.initAssembly(sourceFileName,referenceOpt,pageSize,pageWidth, \
+          extendedChecks,symNamLen,useHex,definedFlags,globalSymbolFile)
+       return self.assembleFile(sourceFileName,binFileName,listFileName, \
+          buildCache,depFileName,depJsonFileName,profiler)
+#
+#  Check method. Check a source file for errors without writing an object
+#  or a list file. The method takes the same parameters as the assemble
+#  method.
+#  Returns a clsAssemblyResult object without code
+#  Raises capasmError on I/O error
 #
-       return hasError
+   def check(self,sourceFileName, \
+       referenceOpt=1, pageSize=66, pageWidth=80, \
+       extendedChecks=False,  symNamLen=6,useHex=False, definedFlags=[], \
+       globalSymbolFile="none"):
+       self.initAssembly(sourceFileName,referenceOpt,pageSize,pageWidth, \
+          extendedChecks,symNamLen,useHex,definedFlags,globalSymbolFile)
+       return self.checkFile(sourceFileName)
+#
+#  Assemble source code which is passed as string without any file I/O 
+#  and terminal output. The sourceFileName is only used for diagnostics
+#  and to build the names of include and link files which are passed to
+#  the includeResolver callable. The includeResolver returns the content
+#  of an include or link file as string or None, if the file does not
+#  exist. If listing is True, the result object contains the list file.
+#  Returns a clsAssemblyResult object
+#  Raises capasmError on fatal errors
+#
+   def assembleSource(self,sourceText,sourceFileName="source.asm", \
+       includeResolver=None,listing=False, \
+       referenceOpt=1, pageSize=66, pageWidth=80, \
+       extendedChecks=False,  symNamLen=6,useHex=False, definedFlags=[], \
+       globalSymbolFile="none"):
+       self.initAssembly(sourceFileName,referenceOpt,pageSize,pageWidth, \
+          extendedChecks,symNamLen,useHex,definedFlags,globalSymbolFile)
+       return self.assembleText(sourceText,sourceFileName,includeResolver, \
+          listing)
 #
 # custom arg checks ----------------------------------------------------
 #
@@ -617,7 +535,8 @@ def capasm():             # pragma: no cover
    "See https://github.com/bug400/capasm for details. "+CAPASM_VERSION)
    
    
-   argparser.add_argument("sourcefile",help="source code file (required)")
+   argparser.add_argument("sourcefile",nargs="*", \
+      help="source code file (required). Multiple files or file name patterns assemble in batch mode")
    argparser.add_argument("-b","--binfile",\
       help="binary object code file (default: sourcefilename with suffix .bin",\
       default="")
@@ -641,19 +560,107 @@ def capasm():             # pragma: no cover
    argparser.add_argument("-s","--symnamelength",\
                   help="maximum length of symbol names (default:6)", \
       type=int,default=6,choices=[6,7,8,9,10,11,12])
+   argparser.add_argument("-j","--jobs",type=int,default=1,\
+      help="number of parallel assembler processes in batch mode, 0: number of CPUs (default: 1)")
+   argparser.add_argument("--syntax-only",action='store_true', \
+      help="check source files only, do not write object or list files")
+   argparser.add_argument("--diagformat",choices=["gcc","json"], \
+      default="gcc", help="format of the diagnostics in syntax check mode: gcc: file:line: severity: message, json: JSON list (default: gcc)")
+   argparser.add_argument("--profile",action='store_true', \
+      help="print wall and cpu time of the assembler phases")
+   argparser.add_argument("--profilejson",default="", \
+      help="write wall and cpu time of the assembler phases to a JSON file")
+   argparser.add_argument("--depfile",default="", \
+      help="write make compatible dependency file (default: no dependency file)")
+   argparser.add_argument("--depjson",default="", \
+      help="write dependency file in JSON format (default: no dependency file)")
+   argparser.add_argument("--cachedir", \
+      default=os.getenv("CAPASM_CACHEDIR",""), \
+      help="directory of the build cache (default: $CAPASM_CACHEDIR, no cache if not set)")
+   argparser.add_argument("--cachemaxsize",type=int,default=100, \
+      help="maximum size of the build cache in MB (default: 100)")
+   argparser.add_argument("--cachemaxage",type=int,default=30, \
+      help="remove build cache entries not used for this number of days (default: 30)")
+   argparser.add_argument("--cachestats",action='store_true', \
+      help="print build cache statistics and exit")
+   argparser.add_argument("--cacheclear",action='store_true', \
+      help="remove all entries from the build cache and exit")
+   argparser.add_argument("--serve",nargs="?",const="",default=None, \
+      metavar="SOCKET", \
+      help="run as assembler server on a Unix domain socket (default: $CAPASM_SOCKET, capasm.sock in $XDG_RUNTIME_DIR or in the private directory capasm-<uid> in the temporary directory)")
    args= argparser.parse_args()
 #
+#  The build support is only needed if the command line is valid
+#
+   from .capbuild import clsBuildCache, clsBatchAssembler, \
+      expandSourceFiles, syntaxCheck, clsProfiler
+#
+#  Server mode
+#
+   if args.serve is not None:
+      from .capserver import serve
+      serve(args.serve)
+      return
+   buildCache=None
+   if args.cachedir!="":
+      buildCache=clsBuildCache(args.cachedir,args.cachemaxsize, \
+         args.cachemaxage)
+   if args.cachestats or args.cacheclear:
+      if buildCache is None:
+         argparser.error("no build cache directory specified")
+      if args.cacheclear:
+         buildCache.clear()
+      if args.cachestats:
+         buildCache.printStatistics()
+      return
+   if not args.sourcefile:
+      argparser.error("the following arguments are required: sourcefile")
+   sourceFiles=expandSourceFiles(args.sourcefile)
+   if len(sourceFiles) > 1 and (args.binfile!="" or args.listfile!="" or \
+      args.depfile!="" or args.depjson!="" or args.profile or \
+      args.profilejson!=""):
+      argparser.error("-b, -l, --depfile, --depjson, --profile and --profilejson are not allowed with more than one source file")
+#
+#  Options of the assemble and check methods
+#
+   options= { "referenceOpt": args.reference, \
+              "pageSize": args.pagesize, "pageWidth": args.width, \
+              "extendedChecks": args.check, \
+              "symNamLen": args.symnamelength, "useHex": args.hex, \
+              "definedFlags": args.define, \
+              "globalSymbolFile": args.globalsymbolfile }
+#
+#  Syntax check mode
+#
+   if args.syntax_only:
+      if syntaxCheck(clsAssembler,sourceFiles,options,args.diagformat):
+         sys.exit(1)
+      return
+   options["buildCache"]=buildCache
+#
+#  Batch mode: assemble all files with a pool of worker processes
+#
+   if len(sourceFiles) > 1:
+      batchAssembler=clsBatchAssembler(clsAssembler,args.jobs)
+      if batchAssembler.run(sourceFiles,options):
+         sys.exit(1)
+      return
+#
 #  Create assembler object and run it
 #
    capasm= clsAssembler()
+   profiler=None
+   if args.profile or args.profilejson!="":
+      profiler=clsProfiler()
    try:
-      ret=capasm.assemble(args.sourcefile,listFileName=args.listfile,\
-           binFileName=args.binfile, referenceOpt=args.reference, \
-           pageSize=args.pagesize,pageWidth=args.width, \
-           extendedChecks=args.check, \
-           symNamLen=args.symnamelength,useHex=args.hex,\
-           definedFlags=args.define, \
-           globalSymbolFile=args.globalsymbolfile)
+      ret=capasm.assemble(sourceFiles[0],listFileName=args.listfile,\
+           binFileName=args.binfile, depFileName=args.depfile, \
+           depJsonFileName=args.depjson, profiler=profiler, **options)
+      if profiler is not None:
+         if args.profile:
+            profiler.printReport()
+         if args.profilejson!="":
+            profiler.writeJson(args.profilejson)
    except capasmError as e:
       print(e.msg+" -- Assembler terminated")
       ret=True
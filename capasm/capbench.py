@@ -0,0 +1,575 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# This module contains the benchmark suite of the CAPASM software suite:
+# - generators for synthetic capasm and ncas source files of configurable
+#   size which cover the addressing modes, literal data lists, nested
+#   conditional assembly, ncas structured pseudo-ops and include chains
+# - a benchmark runner which times the entry points capasm, ncas, caplif
+#   and caprom including their startup time and writes the results to a
+#   JSON file
+# - comparison of the results with a previous run
+#
+# The equivalence checks against the former implementations are in
+# tools/capcheck.py of the repository.
+#
+# (c) 2020 Joachim Siebold
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#--------------------------------------------------------------------------
+#
+import argparse,sys,os,json,time,random,platform,subprocess,tempfile
+from .capcommon import capasmError, CAPASM_VERSION
+
+#
+# Format version of the benchmark result file
+#
+BENCHMARK_FORMAT_VERSION=1
+#
+# Modules of the entry points of the tools (see the console scripts)
+#
+TOOL_MODULES= { "capasm": "assembler", "ncas": "ncas", "caplif": "captools",
+                "caprom": "captools" }
+#
+# The benchmark processes report their peak memory (resident set size in KB)
+# with this marker as the last line of the error output
+#
+PEAK_MEMORY_MARKER="capbench peak memory:"
+PEAK_MEMORY_SCRIPT="""
+def reportPeakMemory():
+   try:
+      import resource
+   except ImportError:
+      return
+   maxRss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+   if sys.platform=="darwin":
+      maxRss//=1024
+   sys.stderr.write("\\n%s "+str(maxRss)+"\\n")
+import atexit
+atexit.register(reportPeakMemory)
+""" % PEAK_MEMORY_MARKER
+
+#
+# Source generator base class --------------------------------------------
+#
+# The generator writes a main source file and a chain of include files.
+# Each include file includes the next one up to the maximum include depth
+# of the assemblers. The code is split into blocks with unique labels.
+# Labels are only referenced by relative jumps and differences of labels
+# within a block, so the sources assemble without errors even if the
+# code exceeds 64 KB. Absolute addresses are taken from symbols defined
+# in the first include file. The sources are reproducible for a given seed.
+#
+class clsSourceGenerator(object):
+
+   MAX_INCLUDE_DEPTH=3
+
+   def __init__(self,numLines,includeDepth=3,seed=1):
+      super().__init__()
+      self.__numLines__=numLines
+      self.__includeDepth__=min(includeDepth, \
+         clsSourceGenerator.MAX_INCLUDE_DEPTH)
+      self.__seed__=seed
+#
+#  Generate the source files in directory, returns the file name of the
+#  main source file
+#
+   def generate(self,directory,name):
+      rnd=random.Random(self.__seed__)
+      os.makedirs(directory,exist_ok=True)
+      blockNumber=0
+#
+#     include files: each file has a few definitions and code blocks
+#     and includes the next file
+#
+      includeNames=["{:s}{:d}.inc".format(name,i+1) for i in \
+         range(self.__includeDepth__)]
+      includeLines=0
+      for i,includeName in enumerate(includeNames):
+         lines=[]
+         lines.extend(self.comment("include file {:d}".format(i+1)))
+         if i==0:
+            lines.extend(self.definitions())
+         for j in range(2):
+            lines.extend(self.block(blockNumber,rnd))
+            blockNumber+=1
+         if i+1 < len(includeNames):
+            lines.append(self.include(includeNames[i+1]))
+         self.writeFile(os.path.join(directory,includeName),lines)
+         includeLines+=len(lines)
+#
+#     main file: header, include chain, code blocks until the number of
+#     lines is reached and trailer
+#
+      lines=[]
+      lines.extend(self.header(name))
+      if includeNames:
+         lines.append(self.include(includeNames[0]))
+      else:
+         lines.extend(self.definitions())
+      trailer=self.trailer()
+      while len(lines)+includeLines+len(trailer) < self.__numLines__:
+         lines.extend(self.block(blockNumber,rnd))
+         blockNumber+=1
+      lines.extend(trailer)
+      fileName=os.path.join(directory,name+".asm")
+      self.writeFile(fileName,lines)
+      return fileName
+
+   def writeFile(self,fileName,lines):
+      with open(fileName,"w") as f:
+         f.write("\n".join(lines))
+         f.write("\n")
+#
+#  Unique label of a block
+#
+   def label(self,blockNumber,suffix):
+      digits="0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+      s=""
+      n=blockNumber
+      for i in range(4):
+         s=digits[n % 36]+s
+         n//=36
+      return "B"+s+suffix
+
+#
+# capasm source generator ------------------------------------------------
+#
+class clsCapasmGenerator(clsSourceGenerator):
+
+   def __init__(self,numLines,includeDepth=3,seed=1):
+      super().__init__(numLines,includeDepth,seed)
+
+   def comment(self,text):
+      return ["! "+text]
+
+   def include(self,fileName):
+      return '        INC "'+fileName+'"'
+
+   def header(self,name):
+      return ["        NAM "+name[:6].upper(),
+              "        SET FLAG1",
+              "        CLR FLAG2"]
+
+   def definitions(self):
+      return ["BUFADR  DAD 177000",
+              "ONEB    DAD 37213",
+              "PTR     DAD 177400",
+              "CNT     EQU 12",
+              "MASK    EQU 377"]
+
+   def trailer(self):
+      return ["        RTN",
+              "        FIN"]
+
+   def block(self,n,rnd):
+      la=self.label(n,"A")
+      lb=self.label(n,"B")
+      lz=self.label(n,"Z")
+      r1=rnd.choice(["R40","R50","R60"])
+      r2=rnd.choice(["R44","R54","R64"])
+      w1=rnd.choice(["R46","R56","R66"])
+      b1=rnd.choice(["R32","R33","R36","R37"])
+      lines=[ "! block {:d}".format(n),
+         la+"  LDB "+b1+",=CNT          ! literal immediate",
+         "        LDM "+r1+",=1,2,3,4,5,6,7,{:o}".format(rnd.randint(0,255)),
+         "        LDMD "+r2+",=BUFADR     ! literal direct",
+         "        LDBI R36,=PTR",
+         "        STMD "+r1+",X34,BUFADR   ! index",
+         "        STBD "+b1+",X34,PTR",
+         "        LDMI "+r1+",=PTR         ! literal indirect",
+         "        ADM "+r1+","+r2+"         ! register",
+         "        ADB "+b1+",=7",
+         "        ADMD "+r1+",=BUFADR",
+         "        SBM "+r1+","+r2,
+         "        CMM "+w1+",=20,0",
+         "        ANM "+r1+","+r2,
+         "        ORB R32,R33",
+         "        XRB R32,R33",
+         "        PUMD "+r1+",+R12         ! stack",
+         "        POMD "+r1+",-R12",
+         "        PUBD R32,+R6",
+         "        POBD R32,-R6",
+         lb+"  ICB R36",
+         "        DCM "+r1,
+         "        TCM "+r2,
+         "        NCB R32",
+         "        ELM "+r1,
+         "        LRB R32",
+         "        TSB R32",
+         "        JNZ "+lb+"          ! relative jump",
+         "        JSB =ONEB            ! subroutine",
+         "        AIF FLAG1",
+         "        LDB R32,=1",
+         "        AIF FLAG2",
+         "        LDB R33,=2",
+         "        ELS",
+         "        DIF BENCH",
+         "        LDB R33,=3",
+         "        EIF",
+         "        EIF",
+         "        ELS",
+         "        CLM "+r1,
+         "        EIF",
+         "        BYT 1,2,3,{:o}".format(rnd.randint(0,255)),
+         '        ASC "TEXT"',
+         '        ASP "BENCH"',
+         "        VAL CNT",
+         "        BSZ 2",
+         lz+"  RTN"]
+      return lines
+
+#
+# capasm ROM source generator, used for the caplif and caprom benchmarks ----
+#
+class clsCapasmRomGenerator(clsCapasmGenerator):
+
+   def header(self,name):
+      return ["        ABS 60000",
+              "        BYT 320,57          ! ROM number",
+              "        SET FLAG1",
+              "        CLR FLAG2"]
+
+#
+# ncas source generator --------------------------------------------------
+#
+class clsNcasGenerator(clsSourceGenerator):
+
+   def __init__(self,numLines,includeDepth=3,seed=1):
+      super().__init__(numLines,includeDepth,seed)
+
+   def comment(self,text):
+      return ["* "+text]
+
+   def include(self,fileName):
+      return "        INCLUDE '"+fileName+"'"
+
+   def header(self,name):
+      return ["        .SET FL1",
+              "        .CLR FL2",
+              "        DATA 0D0H,2FH      ; ROM number"]
+
+   def definitions(self):
+      return ["BUFADR  ADDR 0FE00H",
+              "ONEB    ADDR 3E8BH",
+              "PTR     ADDR 0FF00H",
+              "CNT     EQU 10",
+              "MASK    EQU 0FFH",
+              "TEXT    EQU 'AB'"]
+
+   def trailer(self):
+      return ["        RTN",
+              "        END"]
+
+   def block(self,n,rnd):
+      la=self.label(n,"A")
+      lz=self.label(n,"Z")
+      r1=rnd.choice(["R40","R50","R60"])
+      r2=rnd.choice(["R44","R54","R64"])
+      w1=rnd.choice(["R46","R56","R66"])
+      b1=rnd.choice(["R32","R33","R36","R37"])
+      lines=[ "* block {:d}".format(n),
+         la+"  LDB "+b1+",=(CNT)+1    ; literal immediate",
+         "        LDM "+r1+",=1,2,3,4,5,6,7,0{:02X}H".format(rnd.randint(0,255)),
+         "        LDMD "+r2+",=BUFADR     ; literal direct",
+         "        LDBI R36,=PTR",
+         "        STMD "+r1+",X34,BUFADR   ; index",
+         "        STBD "+b1+",X34,PTR",
+         "        LDMI "+r1+",=PTR         ; literal indirect",
+         "        ADM "+r1+","+r2+"         ; register",
+         "        ADB "+b1+",=((CNT)*2)%7",
+         "        ADMD "+r1+",=BUFADR",
+         "        SBM "+r1+","+r2,
+         "        CMM "+w1+",=20H,0",
+         "        ANM "+r1+","+r2,
+         "        PUMD "+r1+",+R12         ; stack",
+         "        POMD "+r1+",-R12",
+         "        CMB R32,=7",
+         "        IFEQ",
+         "          ICB R36",
+         "        ELSE",
+         "          DCB R36",
+         "        ENDIF",
+         "        LOOP",
+         "          DCM "+r1,
+         "          EXEZ",
+         "          TSB R32",
+         "        WHNZ",
+         "        .IFSET FL1",
+         "        .IFDEF FL2",
+         "        LDB R33,=2",
+         "        .ELSE",
+         "        LDB R33,=3",
+         "        .ENDIF",
+         "        .ENDIF",
+         "        .IFNSET FL1",
+         "        CLM "+r1,
+         "        .ENDIF",
+         "        JSB =ONEB",
+         "        DATA 1,2,3,0{:02X}H,'TEXT',`BENCH`".format(rnd.randint(0,255)),
+         "        DATA (TEXT).2,(("+lz+")-("+la+")).2",
+         "        DEF ("+lz+")-("+la+")",
+         "        VAL CNT",
+         "        BSS 2",
+         lz+"  RTN"]
+      return lines
+
+#
+# Benchmark runner class --------------------------------------------------
+#
+# Each tool is executed as a separate Python process, so the times include
+# the startup of Python and the import of the modules like a call of the
+# console script. The minimum, median and maximum of the wall times of
+# all repetitions are recorded. The peak memory is the maximum resident set
+# size of the process, it is not available on all platforms.
+#
+class clsBenchmarkRunner(object):
+
+   def __init__(self,workDirectory,repeat=3,verbose=True):
+      super().__init__()
+      self.__workDirectory__=workDirectory
+      self.__repeat__=repeat
+      self.__verbose__=verbose
+      self.__results__=[]
+#
+#  Run an entry point of capasm in a separate process, return the wall time
+#  and the peak memory in KB (None if not available). The entry point is
+#  imported from its module like the console scripts do
+#
+   def runTool(self,tool,module,args):
+      importFrom="capasm."+module
+      script="import sys\n"+PEAK_MEMORY_SCRIPT+ \
+         "from {:s} import {:s}; sys.argv=[{!r}]+sys.argv[1:]; {:s}()". \
+         format(importFrom,tool,tool,tool)
+      env=dict(os.environ)
+      packageDir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+      env["PYTHONPATH"]=packageDir+os.pathsep+env.get("PYTHONPATH","")
+      env["CAPASMREGRESSIONTEST"]="1"
+      startTime=time.perf_counter()
+      proc=subprocess.run([sys.executable,"-c",script]+args, \
+         cwd=self.__workDirectory__,env=env,stdout=subprocess.PIPE, \
+         stderr=subprocess.PIPE,universal_newlines=True)
+      wallTime=time.perf_counter()-startTime
+      if proc.returncode!=0:
+         raise capasmError("Benchmark "+tool+" failed:\n"+proc.stdout+ \
+            proc.stderr)
+      peakMemory=None
+      lines=proc.stderr.splitlines()
+      if lines and lines[-1].startswith(PEAK_MEMORY_MARKER):
+         peakMemory=int(lines[-1][len(PEAK_MEMORY_MARKER):])
+      return wallTime,peakMemory
+#
+#  Run a benchmark repeatedly and record the result
+#
+   def benchmark(self,name,tool,module,args,lines=0):
+      times=[]
+      peakMemory=None
+      for i in range(self.__repeat__):
+         wallTime,memory=self.runTool(tool,module,args)
+         times.append(wallTime)
+         if memory is not None:
+            peakMemory=max(memory,peakMemory or 0)
+      times.sort()
+      result= { "name": name, "tool": tool, "lines": lines, \
+         "runs": len(times), "min": times[0], \
+         "median": times[len(times)//2], "max": times[-1], \
+         "peakMemory": peakMemory }
+      self.__results__.append(result)
+      if self.__verbose__:
+         print("{:24s} {:10.3f} {:10.3f} {:10.3f} {:>10s}".format(name, \
+            result["min"]*1000.0,result["median"]*1000.0, \
+            result["max"]*1000.0,formatMemory(peakMemory)))
+      return result
+#
+#  Run all benchmarks for the given source sizes and tools
+#
+   def run(self,sizes,tools,includeDepth=3,seed=1):
+      if self.__verbose__:
+         print("{:24s} {:>10s} {:>10s} {:>10s} {:>10s}".format("benchmark", \
+            "min ms","median ms","max ms","peak KB"))
+#
+#     startup time: import the entry point and print the help text
+#
+      for tool in tools:
+         self.benchmark("startup-"+tool,tool,TOOL_MODULES[tool],["-h"])
+      for numLines in sizes:
+         if "capasm" in tools:
+            name="cbench{:d}".format(numLines)
+            clsCapasmGenerator(numLines,includeDepth,seed).generate( \
+               self.__workDirectory__,name)
+            self.benchmark("capasm-{:d}".format(numLines),"capasm", \
+               "assembler",[name+".asm","-l",name+".lst"],numLines)
+         if "ncas" in tools:
+            name="nbench{:d}".format(numLines)
+            clsNcasGenerator(numLines,includeDepth,seed).generate( \
+               self.__workDirectory__,name)
+            self.benchmark("ncas-{:d}".format(numLines),"ncas","ncas", \
+               [name+".asm","-l",name+".lst"],numLines)
+#
+#     caplif and caprom process a small ROM file
+#
+      if "caplif" in tools or "caprom" in tools:
+         name="rbench"
+         clsCapasmRomGenerator(500,includeDepth,seed).generate( \
+            self.__workDirectory__,name)
+         self.runTool("capasm","assembler",[name+".asm"])
+         if "caplif" in tools:
+            self.benchmark("caplif","caplif","captools",[name+".bin"])
+         if "caprom" in tools:
+            self.benchmark("caprom","caprom","captools", \
+               [name+".bin","-s","32"])
+      return self.getResults()
+#
+#  Get the benchmark results as dictionary
+#
+   def getResults(self):
+      return { "format": BENCHMARK_FORMAT_VERSION, \
+         "capasmVersion": CAPASM_VERSION, \
+         "python": platform.python_version(), \
+         "platform": platform.platform(), \
+         "benchmarks": sorted(self.__results__,key=lambda r: r["name"]) }
+
+#
+# Compare benchmark results ------------------------------------------------
+#
+# Compare the median times and the peak memory of the current results with
+# a previous run. Returns the number of benchmarks which are slower or
+# need more memory than the threshold (percent)
+#
+def compareResults(previous,current,threshold):
+   previousResults= { }
+   for r in previous["benchmarks"]:
+      previousResults[r["name"]]=r
+   numSlower=0
+   print("{:24s} {:>10s} {:>10s} {:>8s} {:>10s} {:>10s} {:>8s}".format( \
+      "benchmark","previous","current","change","prev. KB","curr. KB", \
+      "change"))
+   for r in current["benchmarks"]:
+      if r["name"] not in previousResults:
+         continue
+      old=previousResults[r["name"]]["median"]
+      change=(r["median"]-old)*100.0/old
+      flag=""
+      if change > threshold:
+         numSlower+=1
+         flag=" slower"
+      oldMemory=previousResults[r["name"]].get("peakMemory")
+      memory=r.get("peakMemory")
+      memoryChange=""
+      if oldMemory and memory:
+         percent=(memory-oldMemory)*100.0/oldMemory
+         memoryChange="{:+7.1f}%".format(percent)
+         if percent > threshold:
+            numSlower+=1
+            flag+=" more memory"
+      print("{:24s} {:10.3f} {:10.3f} {:+7.1f}% {:>10s} {:>10s} {:>8s}{:s}". \
+         format(r["name"],old*1000.0,r["median"]*1000.0,change, \
+         formatMemory(oldMemory),formatMemory(memory),memoryChange,flag))
+   return numSlower
+#
+# Format peak memory for output
+#
+def formatMemory(peakMemory):
+   if peakMemory is None:
+      return "-"
+   return "{:d}".format(peakMemory)
+
+#
+# Entry point capbench ------------------------------------------------------
+#
+def capbench():        # pragma: no cover
+
+   argparser=argparse.ArgumentParser(description=\
+   "Benchmark suite for the capasm and ncas assemblers and the caplif and caprom utilities",\
+   epilog="See https://github.com/bug400/capasm for details. "+CAPASM_VERSION)
+   argparser.add_argument("-n","--lines",type=int,action='append', \
+      help="number of lines of the generated sources, may be specified more than once (default: 10000)")
+   argparser.add_argument("-t","--tools",default="capasm,ncas,caplif,caprom",\
+      help="comma separated list of tools to benchmark (default: capasm,ncas,caplif,caprom)")
+   argparser.add_argument("-r","--repeat",type=int,default=3, \
+      help="number of runs of each benchmark (default: 3)")
+   argparser.add_argument("-i","--includedepth",type=int,default=3, \
+      choices=[0,1,2,3],help="depth of the include file chain (default: 3)")
+   argparser.add_argument("-s","--seed",type=int,default=1, \
+      help="seed of the source generator (default: 1)")
+   argparser.add_argument("-d","--directory",default="", \
+      help="directory for the generated files (default: temporary directory)")
+   argparser.add_argument("-g","--generate",action='store_true', \
+      help="only generate the source files into the directory")
+   argparser.add_argument("-o","--output",default="", \
+      help="write results to this JSON file")
+   argparser.add_argument("-c","--compare",default="", \
+      help="compare results with this JSON file of a previous run")
+   argparser.add_argument("--threshold",type=float,default=10.0, \
+      help="exit with error if a benchmark is slower than the previous run by this percentage (default: 10)")
+   args= argparser.parse_args()
+
+   sizes=args.lines
+   if not sizes:
+      sizes=[10000]
+   tools=[t.strip() for t in args.tools.split(",")]
+   for t in tools:
+      if t not in ["capasm","ncas","caplif","caprom"]:
+         argparser.error("invalid tool: "+t)
+   if args.generate:
+      if args.directory=="":
+         argparser.error("the generate option requires a directory")
+      for numLines in sizes:
+         print(clsCapasmGenerator(numLines,args.includedepth,args.seed). \
+            generate(args.directory,"cbench{:d}".format(numLines)))
+         print(clsNcasGenerator(numLines,args.includedepth,args.seed). \
+            generate(args.directory,"nbench{:d}".format(numLines)))
+      return
+
+   previous=None
+   if args.compare!="":
+      try:
+         with open(args.compare,"r") as f:
+            previous=json.load(f)
+      except (OSError,ValueError):
+         print("cannot read benchmark results "+args.compare)
+         sys.exit(1)
+
+   try:
+      if args.directory=="":
+         with tempfile.TemporaryDirectory() as directory:
+            runner=clsBenchmarkRunner(directory,args.repeat)
+            results=runner.run(sizes,tools,args.includedepth,args.seed)
+      else:
+         os.makedirs(args.directory,exist_ok=True)
+         runner=clsBenchmarkRunner(args.directory,args.repeat)
+         results=runner.run(sizes,tools,args.includedepth,args.seed)
+   except capasmError as e:
+      print(e.msg)
+      sys.exit(1)
+
+   if args.output!="":
+      try:
+         with open(args.output,"w") as f:
+            json.dump(results,f,indent=3,sort_keys=True)
+            f.write("\n")
+      except OSError:
+         print("cannot write benchmark results "+args.output)
+         sys.exit(1)
+   if previous is not None:
+      print("")
+      if compareResults(previous,results,args.threshold):
+         sys.exit(1)
+#
+#  Run the capbench procedure, if this file is called as top level script
+#
+if __name__ == '__main__':  # pragma: no cover
+   capbench()
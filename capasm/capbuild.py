@@ -0,0 +1,643 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# This module contains the build support of the assemblers: dependency
+# files, profiler, build cache, batch assembly and syntax check mode. The
+# assemblers import it when these features are used.
+#
+# (c) 2020 Joachim Siebold
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#--------------------------------------------------------------------------
+#
+import os,sys,io,glob,contextlib,json,time
+from pathlib import Path
+from .capcommon import capasmError, MESSAGE, CAPASM_VERSION, clsSymDict
+#
+# Dependency file writer class -------------------------------------------
+#
+# Write the dependencies of the object and list file either as make
+# compatible dependency file or as JSON file. Like "gcc -MP" the make
+# file contains an empty rule for each dependency, so that make does not
+# fail if an include file was removed.
+#
+class clsDependencyWriter(object):
+
+   def __init__(self,targets,dependencies):
+      super().__init__()
+      self.__targets__=targets
+      self.__dependencies__=dependencies
+#
+#  Escape a file name for make
+#
+   @staticmethod
+   def escapeMake(fileName):
+      return fileName.replace("$","$$").replace("#","\\#").replace(" ","\\ ")
+#
+#  Write make compatible dependency file
+#
+   def writeMake(self,depFileName):
+      targets=" ".join([self.escapeMake(t) for t in self.__targets__])
+      lines=[targets+":"]
+      for d in self.__dependencies__:
+         lines.append(" "+self.escapeMake(d))
+      text=" \\\n".join(lines)+"\n"
+      for d in self.__dependencies__[1:]:
+         text+="\n"+self.escapeMake(d)+":\n"
+      try:
+         with open(depFileName,"w") as f:
+            f.write(text)
+      except OSError:
+         MESSAGE.fatalError("Error writing dependency file")
+#
+#  Write JSON dependency file
+#
+   def writeJson(self,depJsonFileName):
+      try:
+         with open(depJsonFileName,"w") as f:
+            json.dump({ "targets": self.__targets__, \
+               "dependencies": self.__dependencies__ }, f, indent=3)
+            f.write("\n")
+      except OSError:
+         MESSAGE.fatalError("Error writing dependency file")
+#
+# Profiler class ---------------------------------------------------------
+#
+# The profiler measures wall and CPU time of the phases of an assembly. 
+# The methods of the reader, scanner, parser, code generator and writer
+# objects are replaced by timing wrappers, so there is no overhead if
+# profiling is not enabled. The timing wrappers itself add some overhead
+# to each phase. The peak memory is the maximum resident set size of the
+# process, which is not available on all platforms.
+#
+class clsProfiler(object):
+
+   PHASES= [ ["read","source reader (read)"],
+             ["scan","line scanner (scanLineSpans)"],
+             ["parse","parser (parseLine)"],
+             ["generate","code generator (generate)"],
+             ["objwrite","object writer (writeCode)"],
+             ["listwrite","list writer (writeLine)"],
+             ["symbols","list writer (writeSymbols)"] ]
+#
+#  Descriptions of the statistics counters of an assembly
+#
+   COUNTERS= { "foldedExpressions": "folded constant expressions",
+               "cachedExpressions": "expressions taken from the cache" }
+
+   def __init__(self):
+      super().__init__()
+      self.__phases__= { }
+      for name,_ in clsProfiler.PHASES:
+         self.__phases__[name]=[0,0.0,0.0]
+      self.__counters__= { }
+      self.__lines__=0
+      self.__wallTime__=0.0
+      self.__cpuTime__=0.0
+      self.__startWallTime__=0.0
+      self.__startCpuTime__=0.0
+#
+#  Replace a method of an object with a timing wrapper
+#
+   def instrument(self,obj,methodName,phase):
+      method=getattr(obj,methodName)
+      stats=self.__phases__[phase]
+      perfCounter=time.perf_counter
+      processTime=time.process_time
+
+      def timedMethod(*args):
+         wallTime=perfCounter()
+         cpuTime=processTime()
+         ret=method(*args)
+         stats[1]+=perfCounter()-wallTime
+         stats[2]+=processTime()-cpuTime
+         stats[0]+=1
+         return ret
+
+      setattr(obj,methodName,timedMethod)
+#
+#  Start and stop measuring the total time, stop adds the statistics 
+#  counters of the assembly
+#
+   def start(self):
+      self.__startWallTime__=time.perf_counter()
+      self.__startCpuTime__=time.process_time()
+
+   def stop(self,lines,counters=None):
+      self.__wallTime__+=time.perf_counter()-self.__startWallTime__
+      self.__cpuTime__+=time.process_time()-self.__startCpuTime__
+      self.__lines__+=lines
+      if counters is not None:
+         for name,value in counters.items():
+            self.__counters__[name]=self.__counters__.get(name,0)+value
+#
+#  Get peak memory usage in KB, None if not available
+#
+   def getPeakMemory(self):
+      try:
+         import resource
+      except ImportError:
+         return None
+      maxRss=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+      if sys.platform=="darwin":
+         maxRss//=1024
+      return maxRss
+#
+#  Get the profiling results as dictionary
+#
+   def getReport(self):
+      phases= { }
+      for name,_ in clsProfiler.PHASES:
+         calls,wallTime,cpuTime=self.__phases__[name]
+         phases[name]= { "calls": calls, "wall": wallTime, "cpu": cpuTime }
+      linesPerSecond=0.0
+      if self.__wallTime__ > 0:
+         linesPerSecond=self.__lines__/self.__wallTime__
+      return { "phases": phases, "wall": self.__wallTime__, \
+         "cpu": self.__cpuTime__, "lines": self.__lines__, \
+         "linesPerSecond": linesPerSecond, \
+         "counters": dict(self.__counters__), \
+         "peakMemoryKB": self.getPeakMemory() }
+#
+#  Print the profiling results
+#
+   def printReport(self):
+      report=self.getReport()
+      print("")
+      print("Profile")
+      print(" {:28s} {:>8s} {:>10s} {:>10s} {:>6s}".format("phase","calls", \
+         "wall ms","cpu ms","%"))
+      for name,description in clsProfiler.PHASES:
+         phase=report["phases"][name]
+         percent=0.0
+         if report["wall"] > 0:
+            percent=phase["wall"]*100.0/report["wall"]
+         print(" {:28s} {:8d} {:10.3f} {:10.3f} {:6.1f}".format(description, \
+            phase["calls"],phase["wall"]*1000.0,phase["cpu"]*1000.0,percent))
+      print(" {:28s} {:8s} {:10.3f} {:10.3f}".format("total","", \
+         report["wall"]*1000.0,report["cpu"]*1000.0))
+      print(" {:d} lines, {:.0f} lines/s".format(report["lines"], \
+         report["linesPerSecond"]))
+      for name,value in sorted(report["counters"].items()):
+         print(" {:s} {:d}".format(clsProfiler.COUNTERS.get(name,name),value))
+      if report["peakMemoryKB"] is not None:
+         print(" peak memory {:d} KB".format(report["peakMemoryKB"]))
+#
+#  Write the profiling results as JSON file
+#
+   def writeJson(self,fileName):
+      try:
+         with open(fileName,"w") as f:
+            json.dump(self.getReport(),f,indent=3)
+            f.write("\n")
+      except OSError:
+         MESSAGE.fatalError("Error writing profile file")
+#
+# Build cache class ------------------------------------------------------
+#
+# The build cache stores the object code, the list file and the terminal
+# output of error free assemblies in a cache directory. The cache is
+# organized like this:
+#
+#   manifests/<key>.json: the key is a hash of the main source file, the
+#       assembler options and the identity of the global symbol table.
+#       The manifest contains a list of entries, each entry holds the 
+#       include and link files with their hashes and the result key
+#   results/<key>.json: object code, list file and terminal output. The
+#       result key is the hash of the manifest key and the include file 
+#       hashes
+#   stats.json: hit/miss statistics and time of the last cleanup
+#
+# Results and manifests are evicted by age (last use) and if the total
+# size of the cache exceeds the maximum size (least recently used first).
+# The statistics are updated without locking and may be inaccurate if
+# many assemblies run concurrently.
+#
+class clsBuildCache(object):
+
+   MAX_MANIFEST_ENTRIES=8
+   CLEANUP_INTERVAL=86400
+
+   def __init__(self,cacheDir,maxSize=100,maxAge=30):
+      super().__init__()
+      self.__cacheDir__=cacheDir
+      self.__maxSize__=maxSize*1024*1024
+      self.__maxAge__=maxAge*86400
+      self.__manifestDir__=os.path.join(cacheDir,"manifests")
+      self.__resultDir__=os.path.join(cacheDir,"results")
+      self.__statsFile__=os.path.join(cacheDir,"stats.json")
+#
+#  Hash of bytes or string
+#
+   @staticmethod
+   def hashData(data):
+      import hashlib
+      if isinstance(data,str):
+         data=data.encode("utf-8","surrogateescape")
+      return hashlib.sha256(data).hexdigest()
+#
+#  Hash of a file, None if the file cannot be read
+#
+   @staticmethod
+   def hashFile(fileName):
+      try:
+         with open(fileName,"rb") as f:
+            return clsBuildCache.hashData(f.read())
+      except OSError:
+         return None
+#
+#  Read a JSON file, return None if it does not exist or is invalid
+#
+   def readJson(self,fileName):
+      try:
+         with open(fileName,"r",encoding="utf-8") as f:
+            return json.load(f)
+      except (OSError,ValueError):
+         return None
+#
+#  Write a JSON file atomically
+#
+   def writeJson(self,fileName,obj):
+      tmpFileName="{:s}.{:d}.tmp".format(fileName,os.getpid())
+      try:
+         os.makedirs(os.path.dirname(fileName),exist_ok=True)
+         with open(tmpFileName,"w",encoding="utf-8") as f:
+            json.dump(obj,f)
+         os.replace(tmpFileName,fileName)
+      except OSError:
+         try:
+            os.remove(tmpFileName)
+         except OSError:
+            pass
+         return False
+      return True
+#
+#  Build the manifest key from the main source text and the list of
+#  assembler options (which must be serializable as JSON)
+#
+   def getKey(self,sourceText,options):
+      return self.hashData(json.dumps([CAPASM_VERSION,options])+ \
+         "\n"+sourceText)
+#
+#  Look up a manifest key. Returns the result object or None.
+#
+   def lookup(self,key):
+      manifest=self.readJson(os.path.join(self.__manifestDir__,key+".json"))
+      if manifest is not None:
+         fileHashes= { }
+         for entry in manifest:
+            match=True
+            for fileName,fileHash in entry["includes"]:
+               if fileName not in fileHashes:
+                  fileHashes[fileName]=self.hashFile(fileName)
+               if fileHashes[fileName]!=fileHash:
+                  match=False
+                  break
+            if not match:
+               continue
+            resultFileName=os.path.join(self.__resultDir__, \
+               entry["result"]+".json")
+            result=self.readJson(resultFileName)
+            if result is None:
+               continue
+            try:
+               os.utime(resultFileName)
+            except OSError:
+               pass
+            self.updateStatistics("hits")
+            return result
+      self.updateStatistics("misses")
+      return None
+#
+#  Store the result of an assembly. The includes are a list of file name 
+#  and hash pairs, the dependencies are the file names for the dependency
+#  files
+#
+   def store(self,key,includes,code,listing,output,dependencies):
+      resultKey=self.hashData(key+json.dumps(includes))
+      result= { "code": code.hex(), "listing": listing, "output": output, \
+         "dependencies": dependencies }
+      if not self.writeJson(os.path.join(self.__resultDir__, \
+         resultKey+".json"),result):
+         return
+      manifestFileName=os.path.join(self.__manifestDir__,key+".json")
+      manifest=self.readJson(manifestFileName)
+      if manifest is None:
+         manifest=[]
+      manifest=[entry for entry in manifest if entry["result"]!=resultKey]
+      manifest.insert(0,{ "includes": includes, "result": resultKey })
+      self.writeJson(manifestFileName, \
+         manifest[:clsBuildCache.MAX_MANIFEST_ENTRIES])
+      stats=self.updateStatistics("stores",len(code)+len(listing or "")+ \
+         len(output))
+      if stats["size"] > self.__maxSize__ or \
+         time.time()-stats["lastCleanup"] > clsBuildCache.CLEANUP_INTERVAL:
+         self.cleanup()
+#
+#  Read statistics
+#
+   def getStatistics(self):
+      stats=self.readJson(self.__statsFile__)
+      if stats is None:
+         stats= { }
+      for name in ["hits","misses","stores","evictions","size"]:
+         stats.setdefault(name,0)
+      stats.setdefault("lastCleanup",time.time())
+      return stats
+#
+#  Increment a counter of the statistics, add size of stored data
+#
+   def updateStatistics(self,counter,size=0):
+      stats=self.getStatistics()
+      stats[counter]+=1
+      stats["size"]+=size
+      self.writeJson(self.__statsFile__,stats)
+      return stats
+#
+#  Remove results and manifests which were not used within maxAge, then 
+#  remove least recently used results until the cache size is below 90%
+#  of maxSize
+#
+   def cleanup(self):
+      now=time.time()
+      evicted=0
+      files=[]
+      for directory in [self.__resultDir__,self.__manifestDir__]:
+         try:
+            names=os.listdir(directory)
+         except OSError:
+            continue
+         for name in names:
+            fileName=os.path.join(directory,name)
+            try:
+               st=os.stat(fileName)
+            except OSError:
+               continue
+            if now-st.st_mtime > self.__maxAge__:
+               if self.removeFile(fileName):
+                  evicted+=1
+               continue
+            files.append([st.st_mtime,st.st_size,fileName])
+      size=sum(f[1] for f in files)
+      files.sort()
+      for mtime,fileSize,fileName in files:
+         if size <= self.__maxSize__*0.9:
+            break
+         if fileName.startswith(self.__resultDir__) and \
+            self.removeFile(fileName):
+            size-=fileSize
+            evicted+=1
+      stats=self.getStatistics()
+      stats["evictions"]+=evicted
+      stats["size"]=size
+      stats["lastCleanup"]=now
+      self.writeJson(self.__statsFile__,stats)
+      return evicted
+
+   def removeFile(self,fileName):
+      try:
+         os.remove(fileName)
+      except OSError:
+         return False
+      return True
+#
+#  Remove all entries from the cache and reset statistics
+#
+   def clear(self):
+      for directory in [self.__resultDir__,self.__manifestDir__]:
+         try:
+            names=os.listdir(directory)
+         except OSError:
+            continue
+         for name in names:
+            self.removeFile(os.path.join(directory,name))
+      self.removeFile(self.__statsFile__)
+#
+#  Print statistics
+#
+   def printStatistics(self):
+      stats=self.getStatistics()
+      lookups=stats["hits"]+stats["misses"]
+      if lookups:
+         hitRate=stats["hits"]*100.0/lookups
+      else:
+         hitRate=0.0
+      print("cache directory  {:s}".format(self.__cacheDir__))
+      print("cache hits       {:d}".format(stats["hits"]))
+      print("cache misses     {:d}".format(stats["misses"]))
+      print("hit rate         {:.1f} %".format(hitRate))
+      print("results stored   {:d}".format(stats["stores"]))
+      print("evictions        {:d}".format(stats["evictions"]))
+      print("cache size       {:.1f} of {:.1f} MB".format(stats["size"]/ \
+         1048576.0,self.__maxSize__/1048576.0))
+#
+# Include resolver which reads include and link files from the file system
+# and records the hashes of all files read (used by the build cache)
+#
+class clsRecordingIncludeResolver(object):
+
+   def __init__(self):
+      super().__init__()
+      self.includes=[]
+
+   def __call__(self,fileName):
+      try:
+         with open(fileName,"rb") as f:
+            data=f.read()
+      except OSError:
+         return None
+      self.includes.append([os.path.abspath(fileName), \
+         clsBuildCache.hashData(data)])
+      return self.decode(data)
+#
+#  Decode file content like open(fileName,"r") does
+#
+   @staticmethod
+   def decode(data):
+      return io.TextIOWrapper(io.BytesIO(data)).read()
+#
+# Standard output stream which copies all output to a buffer
+#
+class clsTeeOutput(object):
+
+   def __init__(self,stream):
+      super().__init__()
+      self.__stream__=stream
+      self.buffer=io.StringIO()
+
+   def write(self,s):
+      self.buffer.write(s)
+      return self.__stream__.write(s)
+
+   def flush(self):
+      self.__stream__.flush()
+#
+# Batch assembly ---------------------------------------------------------
+#
+# Assemble many source files with a pool of worker processes. Each worker
+# process imports the assembler modules and the built-in global symbol
+# table only once. The terminal output of each assembly is captured and
+# printed in the order of the source files, followed by a status line.
+#
+# Expand file name patterns (for shells which do not expand wildcards).
+# Patterns without a match are passed unchanged to get a proper error 
+# message from the assembler
+#
+def expandSourceFiles(fileNames):
+   sourceFiles=[]
+   for fileName in fileNames:
+      if glob.has_magic(fileName):
+         matches=sorted(glob.glob(fileName))
+         if matches:
+            sourceFiles.extend(matches)
+            continue
+      sourceFiles.append(fileName)
+   return sourceFiles
+#
+# Worker process initialization, preload built-in global symbol table
+#
+def batchWorkerInit(globalSymbolFile):
+   if globalSymbolFile in ["85","87","75","none"]:
+      try:
+         clsSymDict(False,globalSymbolFile,None).loadGlobalSymbols()
+      except capasmError:
+         pass
+#
+# Assemble one file in the worker process, returns source file name,
+# error condition and the captured terminal output
+#
+def batchWorkerAssemble(args):
+   assemblerClass,sourceFileName,options=args
+   output=io.StringIO()
+   with contextlib.redirect_stdout(output):
+      try:
+         ret=assemblerClass().assemble(sourceFileName,**options)
+      except capasmError as e:
+         print(e.msg+" -- Assembler terminated")
+         ret=True
+      except Exception as e:
+         print("Internal error: "+repr(e)+" -- Assembler terminated")
+         ret=True
+   return sourceFileName,ret,output.getvalue()
+
+class clsBatchAssembler(object):
+
+   def __init__(self,assemblerClass,jobs=1):
+      super().__init__()
+      self.__assemblerClass__=assemblerClass
+      if jobs < 1:
+         jobs=os.cpu_count() or 1
+      self.__jobs__=jobs
+#
+#  Assemble all source files with the keyword options of the assemble
+#  method of the assembler class. The object files are written to the
+#  current directory, source files which result in the same object file
+#  name are rejected before any file is assembled.
+#  Returns the number of source files which failed to assemble
+#
+   def run(self,sourceFiles,options):
+      objectFiles= { }
+      for sourceFileName in sourceFiles:
+         binFileName=Path(sourceFileName).with_suffix(".bin").name
+         key=os.path.normcase(binFileName)
+         if key in objectFiles:
+            print("Object file {:s} of {:s} and {:s} would be the same, "\
+               "batch terminated".format(binFileName,objectFiles[key], \
+               sourceFileName))
+            return len(sourceFiles)
+         objectFiles[key]=sourceFileName
+      jobArgs=[(self.__assemblerClass__,sourceFileName,options) \
+         for sourceFileName in sourceFiles]
+      globalSymbolFile=options.get("globalSymbolFile","none")
+      numFailed=0
+      jobs=min(self.__jobs__,len(jobArgs))
+      if jobs <=1:
+         batchWorkerInit(globalSymbolFile)
+         results=map(batchWorkerAssemble,jobArgs)
+         pool=None
+      else:
+         import multiprocessing
+         pool=multiprocessing.Pool(jobs,batchWorkerInit,(globalSymbolFile,))
+         results=pool.imap(batchWorkerAssemble,jobArgs)
+      try:
+         for sourceFileName,ret,output in results:
+            sys.stdout.write(output)
+            if ret:
+               numFailed+=1
+               print("{:s}: failed".format(sourceFileName))
+            else:
+               print("{:s}: o.k.".format(sourceFileName))
+            sys.stdout.flush()
+      finally:
+         if pool is not None:
+            pool.close()
+            pool.join()
+      print("{:d} file(s) assembled, {:d} failed".format(len(jobArgs), \
+         numFailed))
+      return numFailed
+
+#
+# Syntax check ---------------------------------------------------------------
+#
+# Check source files without writing object or list files and print the
+# diagnostics in a machine readable format:
+# - "gcc": one line per diagnostic: file:line: severity: message
+# - "json": a list with one object per source file with the keys file, 
+#           errors, warnings and diagnostics (file, line, severity, phase,
+#           code, message)
+# Returns True if any source file has errors
+#
+def syntaxCheck(assemblerClass,sourceFiles,options,diagFormat):
+   hasErrors=False
+   jsonResults=[]
+   for sourceFileName in sourceFiles:
+      try:
+         result=assemblerClass().check(sourceFileName,**options)
+      except capasmError as e:
+         hasErrors=True
+         if diagFormat=="json":
+            jsonResults.append({ "file": sourceFileName, "errors": 1, \
+               "warnings": 0, "diagnostics": [ { "file": sourceFileName, \
+               "line": 0, "severity": "fatal", "phase": "", "code": 0, \
+               "message": e.msg } ] })
+         else:
+            print("{:s}: fatal: {:s}".format(sourceFileName,e.msg))
+         continue
+      if result.hasErrors():
+         hasErrors=True
+#
+#     diagnostics contain the base name of a file, map it to the path
+#
+      filePaths= { }
+      for fileName in result.dependencies:
+         filePaths.setdefault(Path(fileName).name,fileName)
+      diagnostics=[]
+      for d in result.diagnostics:
+         diagnostic=d.toDict()
+         diagnostic["file"]=filePaths.get(d.fileName,d.fileName)
+         diagnostics.append(diagnostic)
+      if diagFormat=="json":
+         jsonResults.append({ "file": sourceFileName, \
+            "errors": result.errorCount, "warnings": result.warningCount, \
+            "diagnostics": diagnostics })
+      else:
+         for d in diagnostics:
+            print("{:s}:{:d}: {:s}: {:s}".format(d["file"],d["line"], \
+               d["severity"],d["message"]))
+   if diagFormat=="json":
+      print(json.dumps(jsonResults,indent=3))
+   return hasErrors
+
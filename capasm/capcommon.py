@@ -32,41 +32,13 @@
 # - line numbers in list file
 # - parsing of conditional assembly pseudo-ops fixed
 #
-import re,os,sys,importlib,datetime
+import re,os,sys,io,importlib,datetime,contextlib
+import collections,threading,array,struct
+import importlib.util
 from pathlib import Path
+from .capcore import CAPASM_VERSION, CAPASM_VERSION_DATE, capasmError, \
+     clsDateTime, parseFunc, clsToken, clsLineScanner, clsGlobalSymbolTable
 
-#
-# Program Constants -----------------------------------------------------
-#
-CAPASM_VERSION="Version 1.0.1"
-CAPASM_VERSION_DATE="January 2024"
-
-#
-# CAPASM custom exception -----------------------------------------------
-# The assembler raises this exception, if a fatal error occurred
-#
-class capasmError(Exception):
-   def __init__(self,msg):
-      super().__init__()
-      self.msg= msg
-
-#
-# Class to generates Date/Time as BCD ---------------------------------------
-#
-class clsDateTime(object):
-
-   def __init__(self):
-      super().__init__()
-      now=datetime.datetime.now()
-      self.bcdYear= self.intToBcd(now.date().year-2000)
-      self.bcdMonth= self.intToBcd(now.date().month)
-      self.bcdDay= self.intToBcd(now.date().day)
-      self.bcdHour= self.intToBcd(now.time().hour)
-      self.bcdMin= self.intToBcd(now.time().minute)
-      self.bcdSec= self.intToBcd(now.time().second)
-
-   def intToBcd(self,value):
-      return (((int(value/10)%10)<<4)+(value%10))
 #
 # Static class for the bytes to store check --------------------------------
 #
@@ -156,131 +128,14 @@ class BYTESTOSTORE(object):
       else:
          return BYTESTOSTORE.__dictBytesToStore__[reg]
 #
-# Static class for number and label parsing ----------------------------------
+# Opcode information data class -------------------------------------------
 #
-class parseFunc(object):
-
-   DELIMITER=""
-   LABELMATCHSTRING=""
-   
-
-#  Parse quoted string
+# Immutable record of an opcode of the dialect opcode dictionary. The fields
+# correspond to the items of the opcode lists of the OPCODES class.
 #
-   @staticmethod
-   def parseQuotedString(string):
-      if string[0] not in parseFunc.DELIMITER:
-         return None
-      if string[0]!=string[-1]:
-         return None
-      string=string[1:len(string)-1]
-
-      return string
-#
-#  Parse quoted or unquoted string
-#
-   @staticmethod 
-   def parseAnyString(string):
-      if string[0] in parseFunc.DELIMITER:
-         return parseFunc.parseQuotedString(string)
-      else:
-         return string
-#
-#  Parse label
-#
-   @staticmethod
-   def parseLabel(string,length):
-      match=re.fullmatch(parseFunc.LABELMATCHSTRING+ str(length)+"}",string)
-      if match:
-         return string
-      else:
-         return None
-#
-#  Parse decimal number (without D at the end, e.g. line numbers)
-#
-   @staticmethod
-   def parseDecimal(string):
-      try:
-         val=int(string,10)
-         return None if val <  0 else val
-      except ValueError:
-         return None
-#
-#  Parse hex number 
-#
-   @staticmethod
-   def parseHex(string):
-      try:
-         val=int(string,16)
-         return None if val < 0 else val
-      except ValueError:
-         return None
-
-#
-#  Parse binary number
-#
-   @staticmethod
-   def parseBin(string):
-      try:
-         val=int(string,2)
-         return None if val < 0 else val
-      except ValueError:
-         return None
-#
-#  Parse octal number
-#
-   @staticmethod
-   def parseOctal(string):
-      try:
-         val=int(string,8)
-         return None if val < 0 else val
-      except ValueError:
-         return None
-#
-#  Parse BCD number (with a C at the end)
-#
-   @staticmethod
-   def parseBCD(string):
-      retVal=0
-      for c in string:
-         if c in "0123456789":
-            retVal=(retVal<<4) | ord(c)-ord("0")
-         else:
-            return None
-      return retVal
-#
-#  Parse Kbyte number (with a K at the end)
-#
-   @staticmethod
-   def parseKB(string):
-      try:
-         val=int(string,10)*1024
-         return None if val <  0 else val
-      except ValueError:
-         return None
-
-#
-#  Parse number, guess the type from the type attribute character at the end
-#  If the number has no attribute, then it is an ocal number
-#  
-   @staticmethod
-   def parseNumber(string):
-      retval=0
-      if string[-1] in "Dd":
-         return parseFunc.parseDecimal(string[:-1])
-      elif string[-1] in "Cc":
-         return parseFunc.parseBCD(string[:-1])
-      elif string[-1] in "Hh#":
-         return parseFunc.parseHex(string[:-1])
-      elif string[-1] in "Bb":
-         return parseFunc.parseBin(string[:-1])
-      elif string[-1] in "OoQq":
-         return parseFunc.parseOctal(string[:-1])
-      elif string[-1] in "Kk":
-         return parseFunc.parseKB(string[:-1])
-      elif string[-1] in "0123456789":
-         return parseFunc.parseOctal(string)
-      else:
-         return None
+clsOpcodeInfo=collections.namedtuple("clsOpcodeInfo", ["parseMethod",
+   "generateMethod","code","minOperands","maxOperands","isUncondJump",
+   "noCode","isCondAssembly"])
 
 #
 #  Basic Static class for the opcode dictionary ----------------------------------
@@ -390,26 +245,115 @@ class OPCODES(object):
    "JRZ"  : ["pJrel","gJrel",0o376,1,1,False,False,False],
    "JRN"  : ["pJrel","gJrel",0o377,1,1,False,False,False],
    }
-   __condAssemblyOpcodes__= []
 #
-#  extend the basic opcodes above with the assembler pseudo ops
+#  build a new dictionary of the basic opcodes above extended with the
+#  assembler pseudo ops. The basic opcode dictionary is not modified,
+#  the opcode lists are converted to clsOpcodeInfo records
 #
    @classmethod
-   def extendDict(cls,extendedOpcodes):
-      OPCODES.__opcodeDict__.update(extendedOpcodes)
+   def buildDict(cls,extendedOpcodes):
+      opcodeDict=dict(OPCODES.__opcodeDict__)
+      opcodeDict.update(extendedOpcodes)
+      for opcode,opcodeInfo in opcodeDict.items():
+         opcodeDict[opcode]=clsOpcodeInfo(*opcodeInfo)
+      return opcodeDict
+
+
+
+
 #
-#  get opcode information
+# Dialect data class ----------------------------------------------------
 #
-   @classmethod
-   def get(cls,opcode):
-      lookUp=opcode
-      if lookUp in OPCODES.__opcodeDict__.keys():
-         return OPCODES.__opcodeDict__[lookUp]
-      else:
-         return []
+# An object of this class holds the language specific settings of an
+# assembler: the opcode dictionary, the string delimiters and label syntax
+# for the parser, the scanner settings and the names of the symbol types.
+# The object is created once per assembler class and is never modified
+# afterwards, because it is shared by all assemblies, which may run
+# concurrently.
+#
+class clsDialect(object):
 
+   def __init__(self,progName,extendedOpcodes,delimiter,labelMatchString, \
+      commentLineChar,commentTrailerChar,stringDelimiters,symTypes):
+      super().__init__()
+      self.progName=progName                   # program name
+      self.opcodeDict=OPCODES.buildDict(extendedOpcodes) # opcode dictionary
+      self.delimiter=delimiter                 # string delimiter(s)
+      self.labelMatchString=labelMatchString   # label regex (incomplete)
+      self.commentLineChar=commentLineChar     # scanner: comment line
+      self.commentTrailerChar=commentTrailerChar # scanner: trailing comment
+      self.stringDelimiters=stringDelimiters   # scanner: string delimiters
+      self.symTypes=symTypes                   # names of symbol types
+      self.labelValidators= { }                # label validators by length
+#
+#  get opcode information, None if the opcode does not exist
+#
+   def getOpcode(self,opcode):
+      return self.opcodeDict.get(opcode)
+#
+#  build the dispatch dictionary opcode -> (opcode information, method) of
+#  a parser or code generator object. methodField is the name of the field
+#  of the opcode information with the method name. The methods are looked
+#  up once in the class of the object and must be called with the object
+#  as argument
+#
+   def buildDispatch(self,obj,methodField):
+      cls=type(obj)
+      dispatch= { }
+      for opcode,opcodeInfo in self.opcodeDict.items():
+         dispatch[opcode]=(opcodeInfo, \
+            getattr(cls,getattr(opcodeInfo,methodField)))
+      return dispatch
+#
+#  parse functions with the dialect specific settings
+#
+   def parseQuotedString(self,string):
+      return parseFunc.parseQuotedString(string,self.delimiter)
 
+   def parseAnyString(self,string):
+      return parseFunc.parseAnyString(string,self.delimiter)
 
+   def parseLabel(self,string,length):
+      return self.getLabelValidator(length).parseLabel(string)
+#
+#  get the label validator for a maximum label length
+#
+   def getLabelValidator(self,length):
+      validator=self.labelValidators.get(length)
+      if validator is None:
+         validator=self.labelValidators.setdefault(length, \
+            clsLabelValidator(self.labelMatchString,length))
+      return validator
+
+#
+# Label validator class ---------------------------------------------------
+#
+# The validator checks label names with the label regex of a dialect that is
+# compiled once for the maximum label length. The results are cached for
+# each label name. The cache is cleared if it exceeds MAX_ENTRIES names.
+#
+class clsLabelValidator(object):
+
+   MAX_ENTRIES=65536
+
+   def __init__(self,labelMatchString,length):
+      super().__init__()
+      self.__fullmatch__=re.compile(labelMatchString+str(length)+"}"). \
+         fullmatch
+      self.__results__= { }
+#
+#  Parse label, returns the label or None if the label is invalid
+#
+   def parseLabel(self,string):
+      try:
+         return self.__results__[string]
+      except KeyError:
+         pass
+      result=string if self.__fullmatch__(string) else None
+      if len(self.__results__) >= clsLabelValidator.MAX_ENTRIES:
+         self.__results__.clear()
+      self.__results__[string]=result
+      return result
 
 #
 # Error Messages static class --------------------------------------------
@@ -531,6 +475,7 @@ class MESSAGE(object):
    def fatalError(msg):
      raise capasmError(msg)
 
+
 # 
 # Symbol dictionary class -------------------------------------
 #
@@ -547,18 +492,29 @@ class clsSymDict(object):
       
       self.__extendedChecks__=extendedChecks
       self.__symbols__= { }
+      self.__extendedGlobals__= { }
+      self.__extendedGlobalsUsed__= False
       self.__dictSymbolTypes__= dictSymTypes
       self.__maxSymNameLength__=0
+      self.__globalSyms__=None
+      self.__slotIndexes__= { }   # slot index of a symbol name
+      self.__slotNames__= []      # symbol name of a slot
+      self.__slotEntries__= []    # symbol entry of a slot or None
 #
-#  Load global symbols 
+#  Check the global symbol file, the table is loaded on first use. A binary
+#  global symbol table is preferred, if it exists and if it was created
+#  from the Python global symbol file (checked on load)
 #
+      self.__globalTableFile__=None
+      self.__globalTableSource__=None
       if globalSymbolFile in ["85","87","75","none"]:
-         globalModuleName=".globals"+globalSymbolFile
-         try:
-            self.__globalSyms__=importlib.import_module(globalModuleName, \
-                              package='capasm')
-         except :
-            MESSAGE.fatalError("Invalid global symbol file")
+         self.__globalModuleName__=".globals"+globalSymbolFile
+         self.__globalSymbolFile__=None
+         baseName=os.path.join(os.path.dirname(os.path.abspath(__file__)), \
+            "globals"+globalSymbolFile)
+         if os.path.isfile(baseName+clsGlobalSymbolTable.SUFFIX):
+            self.__globalTableFile__=baseName+clsGlobalSymbolTable.SUFFIX
+            self.__globalTableSource__=baseName+".py"
       else:
          globalSymbolFilePath=Path(globalSymbolFile)
          suffix=globalSymbolFilePath.suffix.upper()
@@ -568,14 +524,59 @@ class clsSymDict(object):
          if not os.access(globalSymbolFile,os.R_OK):
             MESSAGE.fatalError(\
                "cannot open or read global symbol file")
+         self.__globalModuleName__=None
+         self.__globalSymbolFile__=globalSymbolFile
+         tableFile=str(globalSymbolFilePath.with_suffix( \
+            clsGlobalSymbolTable.SUFFIX))
+         if os.path.isfile(tableFile):
+            self.__globalTableFile__=tableFile
+            self.__globalTableSource__=globalSymbolFile
+      return
+#
+#  Load the global symbol table, returns an object with a get method. If
+#  the binary table cannot be used, the Python global symbol file is loaded
+#
+   def loadGlobalSymbols(self):
+      if self.__globalTableFile__ is not None:
+         try:
+            self.__globalSyms__=clsGlobalSymbolTable.load( \
+               self.__globalTableFile__,self.__globalTableSource__)
+            return self.__globalSyms__
+         except (OSError,ValueError,struct.error,capasmError):
+            self.__globalTableFile__=None
+      if self.__globalModuleName__ is not None:
+         try:
+            module=importlib.import_module( \
+               self.__globalModuleName__, package='capasm')
+         except :
+            MESSAGE.fatalError("Invalid global symbol file")
+      else:
          try:
             spec=importlib.util.spec_from_file_location(".globals",\
-               globalSymbolFile)
-            self.__globalSyms__=importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(self.__globalSyms__)
+               self.__globalSymbolFile__)
+            module=importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
          except :
             MESSAGE.fatalError("Invalid global symbol file")
-      return
+      if not hasattr(module,"globalSymbols"):
+         MESSAGE.fatalError("Invalid global symbol file")
+      self.__globalSyms__=module.globalSymbols
+      return self.__globalSyms__
+#
+#  Get the file name of the Python global symbol file without loading it.
+#  A binary table is only used if it matches this file
+#
+   def getGlobalSymbolFileName(self):
+      if self.__globalSymbolFile__ is not None:
+         return self.__globalSymbolFile__
+      try:
+         spec=importlib.util.find_spec(self.__globalModuleName__, \
+            package='capasm')
+      except (ImportError,ValueError):
+         return None
+      if spec is None:
+         return None
+      return spec.origin
 #
 #  Enter new symbol, we have to check for duplicates in the global symbol
 #  dictionary and this dictionary as well. Returns None if we have no
@@ -589,7 +590,7 @@ class clsSymDict(object):
 #
 #      Check global dict, if global symbol was redefined
 #
-       ret=self.__globalSyms__.globalSymbols.get(name)
+       ret=self.getGlobal(name)
        if ret is not None and  self.__extendedChecks__:
 #
 #      Extended check, warn if redefined global symbol does not match
@@ -614,6 +615,52 @@ class clsSymDict(object):
              self.__maxSymNameLength__=l
        return msg
 #
+#  Bind a symbol name to a slot, returns the slot index. The symbol entry
+#  of the slot is resolved by bindLocals or on first use by getSlot
+#
+   def bind(self,name):
+      slot=self.__slotIndexes__.get(name)
+      if slot is None:
+         slot=len(self.__slotNames__)
+         self.__slotIndexes__[name]=slot
+         self.__slotNames__.append(name)
+         self.__slotEntries__.append(None)
+      return slot
+#
+#  Resolve the slots of all symbols in our own dictionary. Called after
+#  pass 1, when all symbols are defined. Global symbols are entered into
+#  our own dictionary on first use by getSlot, as by get
+#
+   def bindLocals(self):
+      symbols=self.__symbols__
+      entries=self.__slotEntries__
+      for slot,name in enumerate(self.__slotNames__):
+         if entries[slot] is None:
+            entries[slot]=symbols.get(name)
+#
+#  Get a symbol by its slot index, see get. A symbol entry is never
+#  replaced once it is in our own dictionary, so it can be kept in the slot
+#
+   def getSlot(self,slot,lineInfo=None):
+      entry=self.__slotEntries__[slot]
+      if entry is None:
+         name=self.__slotNames__[slot]
+         ret=self.get(name,lineInfo)
+         if ret is not None:
+            self.__slotEntries__[slot]=self.__symbols__.get(name)
+         return ret
+      if lineInfo is not None:
+         if not entry[4]:
+            entry[4]=[lineInfo]
+         else:
+            entry[4].append(lineInfo)
+      return entry
+#
+#  Return True if the symbol is in our own symbol dictionary
+#
+   def isLocal(self,name):
+      return name in self.__symbols__
+#
 #  Get a symbol. We look first in our own symbol dictionary. If the
 #  symbol is not found, try the Globals dictionary. If a symbol was
 #  found in the Globals dictionary the insert it into the local dict.
@@ -628,7 +675,7 @@ class clsSymDict(object):
                self.__symbols__[name][4].append(lineInfo)
          return ret
       except KeyError:
-         ret=self.__globalSyms__.globalSymbols.get(name)
+         ret=self.getGlobal(name)
          if ret:
             typ=ret[0]
             value=ret[1]
@@ -660,10 +707,31 @@ class clsSymDict(object):
    def getMaxSymNameLength(self):
       return self.__maxSymNameLength__
 #
-#  Extend the global symbol table
+#  Get a global symbol. Look first for symbols that were added with
+#  extendGlobalSymbols, then in the global symbol table
+#
+   def getGlobal(self,name):
+      ret=self.__extendedGlobals__.get(name)
+      if ret is None:
+         globalSyms=self.__globalSyms__
+         if globalSyms is None:
+            globalSyms=self.loadGlobalSymbols()
+         ret=globalSyms.get(name)
+      else:
+         self.__extendedGlobalsUsed__=True
+      return ret
+#
+#  Return True if a symbol added with extendGlobalSymbols was looked up
+#
+   def extendedGlobalsUsed(self):
+      return self.__extendedGlobalsUsed__
+#
+#  Extend the global symbol table. The symbols are stored in this object
+#  only, the global symbol table, which is shared by all assemblies, is
+#  not modified.
 #
    def extendGlobalSymbols(self,key,value):
-       self.__globalSyms__.globalSymbols.symbols[key]=value
+       self.__extendedGlobals__[key]=value
      
 
 #
@@ -788,6 +856,7 @@ class clsGlobVar(object):
 
       super().__init__()
       self.progName=""               # program name
+      self.dialect=None              # dialect object of the assembler
       self.arpReg=-1                 # current content of the ARP
       self.drpReg=-1                 # current content of the DRP
       self.lastStmtWasPAD= False     # PAD sets this to True
@@ -813,235 +882,67 @@ class clsGlobVar(object):
       self.doPageBreak=False         # do a page break
       self.lastRtnAddr=-255          # address of last return
       self.lastOpcodeWasJmp=False    # flag, if last opcode was JMP or RTN
-#      
-# Token data class, result of lexical scanner -----------------------------
-#
-class clsToken(object):
-
-   def __init__(self, string= "", position= 0, termChar=""):
-      self.string=string          # this is the scanned token as string
-      self.position=position      # the position of the scanned token in the
-                                  # source line
-      self.termChar=termChar      # the char after the token that terminated
-                                  # scanning
-
-   def __repr__(self):  # pragma: no cover
-      return ("clsToken object '{:s}' {:d} '{:s}'".format(self.string, self.position,self.termChar))
-
-#
-# Lexical Scanner class -------------------------------------------------
-#
-# The scanLine() method of the scanner takes a source line as input and
-# returns a list of clsToken objects:
-# [lineNumber,label,opcode,[scannedOperands]]
-#
-class clsLineScanner(object):
-
-#
-#  init scanner:
-# commentLineChar: character(s) that indicate a line with a comment
-# commentTrailerChar: character(s) that idicate trailing comment
-# stringDelimiters: string delimiters
-#
-
-   def __init__(self,commentLineChar,commentTrailerChar,stringDelimiters):
-      super().__init__()
-      self.__commentLineChar__= commentLineChar
-      self.__commentTrailerChar__= commentTrailerChar
-      self.__stringDelimiters__= stringDelimiters
-#
-#  Get one character, returns a tripel of [character, position, next character]
-#
-   def scanChar(self):
-      oldposition= self.__position__
-      oldch= self.__gch__
-      oldnxtch= self.__nxtChar__
-      if self.__gch__ != "":
-         self.__position__+=1  
-         self.__gch__=self.__nxtChar__
-         if (self.__position__) >= len(self.__line__)-1:
-            self.__nxtChar__= ""
-         else:
-            self.__nxtChar__=self.__line__[self.__position__+1]
-    
-      return [oldch, oldposition,oldnxtch]
-#
-#  Get Token, returns a token object
-#
-      
-   def scanTok(self,termSyms=None):
-#
-#     Skip blanks
-#
-      while True:
-         char, pos, nxtChar=self.scanChar()
-         if char!=" ":
-            break
-      token=""
-      position= -1
-      termchar= ""
-      termString=" "
-      inString=False
-      if termSyms is not None:
-         termString+=termSyms
-         if char in termSyms:
-            return clsToken(char, pos, nxtChar)
-#
-#     Loop until end of line, blank or termchar encountered
-#
-      while char!="":
-         if not inString and char in termString:
-               termchar= char
-               break
-#
-#     String handling
-#
-         if char in self.__stringDelimiters__:
-            if not inString:
-               quote=char
-               inString=True
-            else:
-#
-#              In string mode and we have a " or '
-#
-               if char==quote:
-                  inString=False
-#
-#        Accumulate token
-#
-         if len(token)==0:
-            position= pos
-         token+=char
-         char, pos, nxtChar=self.scanChar()
-      return clsToken(token, position, termchar)
-#
-#  Scan input line and return scanned line number, label, opcode and a list
-#  of operands. Missing items are None
-#
-   def scanLine(self,line):
-
-      scannedLineNumber=None
-      scannedLabel=None
-      scannedOpcode=None
-      scannedOperand=[]
-
-      self.__line__= line
-      self.__position__= -1
-      self.__gch__= ""
-      self.__nxtChar__= ""
-      if self.__line__!="":
-         self.__gch__=self.__line__[0]
-         self.__position__= 0
-      if len(line) > 1:
-         self.__nxtChar__= self.__line__[1]
-#
-#     We have an empty line that contains nothing, return line count as token
-#
-      tok=self.scanTok()
-      if tok.string=="":
-         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
-#
-#     Is the first token a line number?
-#
-      lineBegin=0
-      if tok.string[0] in "0123456789":
-         scannedLineNumber=tok
-         lineBegin=len(scannedLineNumber.string)+tok.position
-         tok=self.scanTok()
-#
-#     No next token, leave ...
-#
-      if tok.string=="":
-         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
-#
-#     Is the token a label? 
-#
-      if tok.position <= lineBegin+2:
-         if tok.string[0] not in self.__commentLineChar__:
-            scannedLabel= tok
-            tok= self.scanTok()
-#
-#     No next token, leave ...
-#
-      if tok.string=="":
-         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
-#
-#     Do we have a comment?
-#
-      if tok.string[0] in self.__commentLineChar__ \
-         or tok.string[0] in self.__commentTrailerChar__:
-         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
-#
-#      Opcode, convert it to upper case
-#
-      scannedOpcode= tok
-      scannedOpcode.string=scannedOpcode.string.upper()
-#
-#     Operand, if any, scan it as a comma separated list
-#
-      tok= self.scanTok(",")
-      while True:
-#
-#        End of line
-#
-         if tok.string=="":
-            break
-#
-#        Comment 
-#
-         if tok.string[0] in self.__commentTrailerChar__:
-            break
-#
-#        Comma, continue loop
-#
-         if tok.string!=",":
-            scannedOperand.append(tok)
-         tok= self.scanTok(",")
-      return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+      self.counters= { }             # statistics counters for the profiler
+      self.expressionCache= { }      # parsed expressions (ncas)
 
 #
 #  object code writer class --------------------------------------------
 # 
-#  This object writer dumps the generated code to the binary output file
+#  This object writer collects the generated code and dumps it to the 
+#  binary output file. If no file name is specified, the code is only
+#  kept in memory and can be retrieved with getCode()
 #
 class clsObjWriter(object):
 #
 #  Initialize, open binary output file
 #
-   def __init__(self,objectfilename):
+   def __init__(self,objectfilename=None):
       super().__init__()
-      self.__codeLen__=0
+      self.__code__=bytearray()
       self.__objectfile__= None
+      if objectfilename is None:
+         return
       try:
          self.__objectfile__=open(objectfilename,"wb")
       except OSError:
          MESSAGE.fatalError("Error opening object file")
       return
 #
-#  Dump code to file
+#  Collect code
 #
    def writeCode(self,codeInfo,parsedLine):
       if codeInfo.code == []:
          return
-      for c in codeInfo.code:
-         try:
-            self.__objectfile__.write(c.to_bytes(1,byteorder="big"))
-            self.__codeLen__+=1
-         except OSError:
-            MESSAGE.fatalError("Error writing object file")
-         except OverflowError:
-            MESSAGE.fatalError("Internal error: code overflow")
+      try:
+         self.__code__.extend(codeInfo.code)
+      except ValueError:
+         MESSAGE.fatalError("Internal error: code overflow")
       return
 #
-#  Destructor, flush and close file
+#  Get the collected code
+#
+   def getCode(self):
+      return bytes(self.__code__)
+#
+#  Write collected code to file, flush and close file
+#
+   def close(self):
+      if self.__objectfile__ is None:
+         return
+      try:
+         self.__objectfile__.write(self.__code__)
+         self.__objectfile__.flush()
+         self.__objectfile__.close()
+      except OSError:
+         MESSAGE.fatalError("Error writing object file")
+      finally:
+         self.__objectfile__= None
+      return
+#
+#  Destructor, close file if this was not done before
 #
    def __del__(self):
       if self.__objectfile__ is not None:
-#        fill= 256 - (self.__codeLen__ % 256)
-#        c=0xFF
-#        for i in range(0,fill):
-#           self.__objectfile__.write(c.to_bytes(1,byteorder="big"))
-         self.__objectfile__.flush()
          self.__objectfile__.close()
       return
 #
@@ -1054,13 +955,20 @@ class clsListWriter(object):
 #
 #  Initialize and open list file
 #
-   def __init__(self,globVar,listFileName,maxLines,lineWidth):
+#  If listStream is specified, the list file is written to that
+#  (already opened) stream instead of the file listFileName. If quiet is
+#  True, nothing is printed to the terminal.
+#
+   def __init__(self,globVar,listFileName,maxLines,lineWidth,listStream=None,\
+                quiet=False):
       super().__init__()
       self.__globVar__=globVar
       self.__maxLines__=maxLines
       self.__lineWidth__= lineWidth
       self.__lineCount__=maxLines
       self.__listFile__= None
+      self.__closeListFile__=False
+      self.__quiet__=quiet
       self.__totalLines__=0
       self.__totalBytesOfCode__=0
       self.__pageCount__=1
@@ -1068,11 +976,14 @@ class clsListWriter(object):
       self.__sourceFileDict__={ }
       self.__sourceFileCount__=0
       try:
-         if listFileName=="":
+         if listStream is not None:
+            self.__listFile__=listStream
+         elif listFileName=="":
             self.__listFile__=sys.stdout
             self.__noList__=True
          else:
             self.__listFile__=open(listFileName,"w")
+            self.__closeListFile__=True
       except OSError:
          MESSAGE.fatalError("Error opening list file")
       self.writeHeader()
@@ -1132,7 +1043,8 @@ class clsListWriter(object):
 #
 #     Print header to terminal regardless if we have a list file or not
 #
-      print(headerString)
+      if not self.__quiet__:
+         print(headerString)
       if not self.__noList__:
          self.__listFile__.write(headerString)
       self.__lineCount__=3
@@ -1180,8 +1092,8 @@ class clsListWriter(object):
 #
 #     Do not output statement, if we output to terminal
 #
-      if self.__noList__ and parsedLine.messages== [ ] \
-         and codeInfo.messages== [ ]:
+      if self.__noList__ and (self.__quiet__ or (parsedLine.messages== [ ] \
+         and codeInfo.messages== [ ])):
          return
       pc=parsedLine.PC
       line=parsedLine.line
@@ -1340,9 +1252,10 @@ class clsListWriter(object):
 #
 #     Output statistics to terminal regardless if we have a list file
 #
-      print(s1)
-      print(s2)
-      print(s3)
+      if not self.__quiet__:
+         print(s1)
+         print(s2)
+         print(s3)
       if not self.__noList__:
          self.wrL(s1)
          self.wrL(s2)
@@ -1354,25 +1267,198 @@ class clsListWriter(object):
    def __del__(self):
       if self.__listFile__ is not None:
          self.__listFile__.flush()
-         if self.__listFile__ != sys.stdout:
+         if self.__closeListFile__:
             self.__listFile__.close()
       return
 #
+# Source buffer class ---------------------------------------------------
+#
+# A source buffer holds the lines of a complete source file, indexed by
+# line number. The text is split into lines in one step. Line ends are
+# translated like a file opened in text mode does. Files with at least
+# MMAP_THRESHOLD bytes are mapped into memory instead of being read.
+#
+class clsSourceBuffer(object):
+
+   MMAP_THRESHOLD=4*1024*1024
+#
+#  estimated memory of a line and its scanned spans in bytes
+#
+   LINE_OVERHEAD=256
+
+   def __init__(self,text):
+      super().__init__()
+      self.isCached=False
+      self.__scannedLines__= { }
+      if "\r" in text:
+         text=text.replace("\r\n","\n").replace("\r","\n")
+      lines=text.split("\n")
+#
+#     a final line end does not start another line
+#
+      if lines[-1]=="":
+         lines.pop()
+      self.lines=lines
+      self.numLines=len(lines)
+      self.size=len(text)+clsSourceBuffer.LINE_OVERHEAD*self.numLines
+#
+#  Read a file, returns None if the file cannot be opened
+#
+   @staticmethod
+   def fromFile(fileName):
+      try:
+         with open(fileName,"rb") as f:
+            size=os.fstat(f.fileno()).st_size
+            if size >= clsSourceBuffer.MMAP_THRESHOLD:
+               import mmap
+               with mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as m:
+                  return clsSourceBuffer(clsSourceBuffer.decode(m))
+            return clsSourceBuffer(clsSourceBuffer.decode(f.read()))
+      except OSError:
+         return None
+#
+#  Decode file content with the encoding open(fileName,"r") uses
+#
+   @staticmethod
+   def decode(data):
+      import locale
+      try:
+         return str(data,locale.getpreferredencoding(False))
+      except UnicodeDecodeError:
+         MESSAGE.fatalError("Error reading source or include file")
+#
+#  Get a line without the line end, the first line has the index 0
+#
+   def getLine(self,index):
+      return self.lines[index]
+#
+#  Get the scanned spans of a line. If the buffer is held by the include
+#  cache, the lines are scanned only once for each line scanner
+#  configuration. The scanned lines are shared and must not be modified.
+#
+   def getScannedLine(self,index,lineScanner):
+      if not self.isCached:
+         return lineScanner.scanLineSpans(self.lines[index])
+      scannedLines=self.__scannedLines__.get(lineScanner.key)
+      if scannedLines is None:
+         scannedLines=self.__scannedLines__.setdefault(lineScanner.key, \
+            [None]*self.numLines)
+      scannedLine=scannedLines[index]
+      if scannedLine is None:
+         scannedLine=lineScanner.scanLineSpans(self.lines[index])
+         scannedLines[index]=scannedLine
+      return scannedLine
+
+#
+# Include file cache class ------------------------------------------------
+#
+# Process wide cache of the source buffers of include files. The buffers
+# keep the scanned lines, so an include file which is used by many 
+# assemblies in batch or server mode is read and scanned only once. An 
+# entry is valid as long as modification time and size of the file do
+# not change. The least recently used entries are removed if the estimated
+# memory of all entries exceeds maxSize bytes. A maxSize of 0 disables
+# the cache.
+#
+class clsIncludeCache(object):
+
+   maxSize=32*1024*1024
+   __entries__=collections.OrderedDict()
+   __size__=0
+   __lock__=threading.Lock()
+#
+#  Get the source buffer of a file, returns None if the file cannot be read
+#
+   @classmethod
+   def get(cls,fileName):
+      if cls.maxSize==0:
+         return clsSourceBuffer.fromFile(fileName)
+      try:
+         st=os.stat(fileName)
+      except OSError:
+         return None
+      path=os.path.realpath(fileName)
+      stamp=(st.st_mtime_ns,st.st_size)
+      with cls.__lock__:
+         entry=cls.__entries__.get(path)
+         if entry is not None and entry[0]==stamp:
+            cls.__entries__.move_to_end(path)
+            return entry[1]
+      buffer=clsSourceBuffer.fromFile(fileName)
+      if buffer is None:
+         return None
+      buffer.isCached=True
+      with cls.__lock__:
+         entry=cls.__entries__.pop(path,None)
+         if entry is not None:
+            cls.__size__-=entry[1].size
+         if buffer.size <= cls.maxSize:
+            cls.__entries__[path]=(stamp,buffer)
+            cls.__size__+=buffer.size
+         while cls.__size__ > cls.maxSize:
+            _,(_,oldBuffer)=cls.__entries__.popitem(last=False)
+            cls.__size__-=oldBuffer.size
+      return buffer
+#
+#  Set the maximum size in bytes, remove entries if necessary
+#
+   @classmethod
+   def setMaxSize(cls,maxSize):
+      with cls.__lock__:
+         cls.maxSize=maxSize
+         while cls.__size__ > cls.maxSize:
+            _,(_,oldBuffer)=cls.__entries__.popitem(last=False)
+            cls.__size__-=oldBuffer.size
+#
+#  Remove all entries
+#
+   @classmethod
+   def clear(cls):
+      with cls.__lock__:
+         cls.__entries__.clear()
+         cls.__size__=0
+#
+#  Get the number of entries and their estimated memory
+#
+   @classmethod
+   def getStatistics(cls):
+      with cls.__lock__:
+         return len(cls.__entries__),cls.__size__
+
+#
 # Source file reader class ----------------------------------------------
 #
+# If sourceText is specified, the source is read from that string instead
+# of the file inputFileName. The includeResolver is a callable which gets
+# the name of an include or link file and returns its content as string or
+# None if the file does not exist. If no includeResolver is specified, 
+# include and link files are read from the file system.
+#
+# Each file is read only once into a source buffer, the lines are served
+# from that buffer. Files which are included more than once are not read
+# again. Include files from the file system are taken from the process
+# wide include cache.
+#
 class clsSourceReader(object):
 #
 #  Initialize and open first source file
 #
-   def __init__(self,inputFileName):
+   def __init__(self,inputFileName,sourceText=None,includeResolver=None):
       super().__init__()
       self.__inputFiles__= []
       self.__lineInfos__= []
-      try:
-        self.__inputFiles__.append(open(inputFileName,"r"))
-        self.__lineInfos__.append([Path(inputFileName).name,0])
-      except OSError:
-        MESSAGE.fatalError("Error opening source file")
+      self.__fileNames__= [inputFileName]
+      self.__buffers__= { }
+      self.__includeResolver__=includeResolver
+      if sourceText is not None:
+        buffer=clsSourceBuffer(sourceText)
+      else:
+        buffer=clsSourceBuffer.fromFile(inputFileName)
+        if buffer is None:
+           MESSAGE.fatalError("Error opening source file")
+      self.__buffers__[inputFileName]=buffer
+      self.__inputFiles__.append(buffer)
+      self.__lineInfos__.append([Path(inputFileName).name,0])
 #
 # build name of include or link file. 
 # If the source assembly file name has a path and
@@ -1394,17 +1480,26 @@ class clsSourceReader(object):
       if len(self.__inputFiles__)> 3:
          MESSAGE.fatalError("Maximum include depth exceeded")
       fileName=self.buildFileName(inputFileName,sourceFileDirectory)
-      try:
-        self.__inputFiles__.append(open(fileName,"r"))
-        self.__lineInfos__.append([Path(inputFileName).name,0])
-      except OSError:
-        MESSAGE.fatalError("Error opening include or link file "+\
-              inputFileName+" ")
+      if fileName not in self.__fileNames__:
+         self.__fileNames__.append(fileName)
+      buffer=self.__buffers__.get(fileName)
+      if buffer is None:
+         if self.__includeResolver__ is not None:
+            text=self.__includeResolver__(fileName)
+            if text is not None:
+               buffer=clsSourceBuffer(text)
+         else:
+            buffer=clsIncludeCache.get(fileName)
+         if buffer is None:
+            MESSAGE.fatalError("Error opening include or link file "+\
+               inputFileName+" ")
+         self.__buffers__[fileName]=buffer
+      self.__inputFiles__.append(buffer)
+      self.__lineInfos__.append([Path(inputFileName).name,0])
 #
 #  open linked file
 #
    def openLink(self,inputFileName,sourceFileDirectory):
-      self.__inputFiles__[-1].close()
       self.__inputFiles__.pop()
       self.__lineInfos__.pop()
       self.openInclude(inputFileName,sourceFileDirectory)
@@ -1414,39 +1509,60 @@ class clsSourceReader(object):
 #
    def read(self):
       while self.__inputFiles__:
-         try:
-            line=self.__inputFiles__[-1].readline()
-         except OSError:
-            MESSAGE.fatalError("Error reading source or include file")
-         if line:
-            self.__lineInfos__[-1][1]+=1    
-            return line.strip("\r\n")
+         lineInfo=self.__lineInfos__[-1]
+         index=lineInfo[1]
+         buffer=self.__inputFiles__[-1]
+         if index < buffer.numLines:
+            lineInfo[1]=index+1
+            return buffer.lines[index]
 #
 #        EOF, fall back to previous file, if none return None
 #
-         self.__inputFiles__[-1].close()
          self.__inputFiles__.pop()
          self.__lineInfos__.pop()
       return None
 #
+# Get the source buffer and the line index of the line which was returned
+# by read
+#
+   def getLineReference(self):
+      return self.__inputFiles__[-1],self.__lineInfos__[-1][1]-1
+#
+# Get the scanned spans of the line which was returned by read
+#
+   def getScannedLine(self,lineScanner):
+      return self.__inputFiles__[-1].getScannedLine( \
+         self.__lineInfos__[-1][1]-1,lineScanner)
+#
+# Get a line of a file which was opened, the first line has the number 1.
+# Returns None if the file was not opened or the line does not exist
+#
+   def getSourceLine(self,fileName,lineNumber):
+      buffer=self.__buffers__.get(fileName)
+      if buffer is None or lineNumber < 1 or lineNumber > buffer.numLines:
+         return None
+      return buffer.getLine(lineNumber-1)
+#
+# Get the names of all files which were opened
+#
+   def getFileNames(self):
+      return self.__fileNames__
+#
 # Get current filename and line count
 #
    def getLineInfo(self):
       return [self.__lineInfos__[-1][0],self.__lineInfos__[-1][1]]
-         
-#
-#  Destructor, close any open files
-#
-   def __del__(self):
-      for f in self.__inputFiles__:
-         f.close()
-      return
 #
 # Parser Info data class ----------------------------------------------
 #
-# An object of this class is returned by the parser
+# An object of this class is returned by the parser. The objects of all
+# lines are kept until the end of pass 2, the data classes of the parser
+# and code generator therefore have no instance dictionary.
 #
 class clsParserInfo(object):
+
+   __slots__=("PC","lineInfo","messages","line","opcode","opcodeLen",
+      "parsedOperand","needsArp","needsDrp","addressMode")
 #
 #  Address Modes
 #
@@ -1499,6 +1615,125 @@ class clsParserInfo(object):
    def __repr__(self): # pragma: no cover
       return("clsParserInfo object:")
 #
+# Pass 1 result store class --------------------------------------------
+#
+# The results of pass 1 are stored in columns instead of a list of
+# clsParserInfo objects: arrays for the numeric fields, an index into a table
+# of opcodes and file names and side tables for the operands and the
+# messages. The source line is referenced by its source buffer and line
+# index. Iterating over the store returns a new clsParserInfo object for
+# each line, which is released after processing the line in pass 2.
+#
+class clsPass1Info(object):
+
+   def __init__(self):
+      super().__init__()
+      self.__PC__=array.array("q")
+      self.__opcodeLen__=array.array("q")
+      self.__opcodeIndex__=array.array("H")
+      self.__needsArp__=array.array("b")
+      self.__needsDrp__=array.array("b")
+      self.__addressMode__=array.array("b")
+      self.__fileIndex__=array.array("H")
+      self.__lineNumber__=array.array("i")
+      self.__bufferIndex__=array.array("H")
+      self.__lineIndex__=array.array("i")
+      self.__parsedOperand__=[]
+      self.__messages__= { }
+      self.__lines__= { }
+      self.__opcodes__=[]
+      self.__opcodeIndexes__= { }
+      self.__fileNames__=[]
+      self.__fileIndexes__= { }
+      self.__buffers__=[]
+      self.__bufferIndexes__= { }
+#
+#  Add a value to a table, returns the index of the value
+#
+   def addTableEntry(self,table,indexes,value,key):
+      index=len(table)
+      table.append(value)
+      indexes[key]=index
+      return index
+#
+#  Append the result of a line. The line reference is the source buffer and
+#  the line index returned by the getLineReference method of the source
+#  reader. A line which is not identical with the line of the buffer is
+#  stored separately
+#
+   def append(self,parsedLine,lineReference):
+      row=len(self.__PC__)
+      buffer,lineIndex=lineReference
+      opcode=parsedLine.opcode
+      opcodeIndex=self.__opcodeIndexes__.get(opcode)
+      if opcodeIndex is None:
+         opcodeIndex=self.addTableEntry(self.__opcodes__, \
+            self.__opcodeIndexes__,opcode,opcode)
+      fileName,lineNumber=parsedLine.lineInfo
+      fileIndex=self.__fileIndexes__.get(fileName)
+      if fileIndex is None:
+         fileIndex=self.addTableEntry(self.__fileNames__, \
+            self.__fileIndexes__,fileName,fileName)
+      bufferIndex=self.__bufferIndexes__.get(id(buffer))
+      if bufferIndex is None:
+         bufferIndex=self.addTableEntry(self.__buffers__, \
+            self.__bufferIndexes__,buffer,id(buffer))
+      self.__PC__.append(parsedLine.PC)
+      self.__opcodeLen__.append(parsedLine.opcodeLen)
+      self.__opcodeIndex__.append(opcodeIndex)
+      self.__needsArp__.append(parsedLine.needsArp)
+      self.__needsDrp__.append(parsedLine.needsDrp)
+      self.__addressMode__.append(parsedLine.addressMode)
+      self.__fileIndex__.append(fileIndex)
+      self.__lineNumber__.append(lineNumber)
+      self.__bufferIndex__.append(bufferIndex)
+      self.__lineIndex__.append(lineIndex)
+      if buffer.lines[lineIndex] is not parsedLine.line:
+         self.__lines__[row]=parsedLine.line
+      self.__parsedOperand__.append(parsedLine.parsedOperand)
+      if parsedLine.messages:
+         self.__messages__[row]=parsedLine.messages
+#
+#  Bind the labels of all operands to slots of the symbol dictionary
+#
+   def bindSymbols(self,symDict):
+      for parsedOperand in self.__parsedOperand__:
+         if parsedOperand is None:
+            continue
+         for pOperand in parsedOperand:
+            if pOperand.typ==clsParsedOperand.OP_LABEL:
+               pOperand.slot=symDict.bind(pOperand.label)
+      symDict.bindLocals()
+#
+#  Add a message to the last line
+#
+   def addMessage(self,message):
+      self.__messages__.setdefault(len(self.__PC__)-1,[]).append(message)
+
+   def __len__(self):
+      return len(self.__PC__)
+#
+#  Iterate over the lines, returns a clsParserInfo object for each line
+#
+   def __iter__(self):
+      opcodes=self.__opcodes__
+      fileNames=self.__fileNames__
+      buffers=self.__buffers__
+      messages=self.__messages__
+      lines=self.__lines__
+      for row,(PC,opcodeLen,opcodeIndex,needsArp,needsDrp,addressMode, \
+         fileIndex,lineNumber,bufferIndex,lineIndex,parsedOperand) in \
+         enumerate(zip(self.__PC__,self.__opcodeLen__,self.__opcodeIndex__,\
+         self.__needsArp__,self.__needsDrp__,self.__addressMode__, \
+         self.__fileIndex__,self.__lineNumber__,self.__bufferIndex__, \
+         self.__lineIndex__,self.__parsedOperand__)):
+         line=lines.get(row)
+         if line is None:
+            line=buffers[bufferIndex].lines[lineIndex]
+         yield clsParserInfo(PC,[fileNames[fileIndex],lineNumber], \
+            messages.get(row,[]),line,opcodes[opcodeIndex],opcodeLen, \
+            parsedOperand,needsArp,needsDrp,addressMode)
+#
 # Parsed Operand Data Class --------------------------------------------
 #
 # Note: the base class is used to indicate illegal operand items
@@ -1514,6 +1749,8 @@ class clsParsedOperand(object):
    OP_STRING=4
    OP_EXPRESSION=5
 
+   __slots__=("typ","size")
+
    def __init__(self,typ=OP_INVALID):
       self.typ=typ
       self.size=None
@@ -1527,6 +1764,8 @@ class clsParsedOperand(object):
 #  Invalid operand, operand that had issues during parsing
 #
 class clsInvalidOperand(clsParsedOperand):
+
+   __slots__=()
    
    def __init__(self):
       super().__init__(clsParsedOperand.OP_INVALID)
@@ -1538,10 +1777,13 @@ class clsInvalidOperand(clsParsedOperand):
 #
 class clsParsedExpression(clsParsedOperand): 
 
-   def __init__(self,bytecode,size):
+   __slots__=("byteCode","evaluate")
+
+   def __init__(self,bytecode,size,evaluate=None):
       super().__init__(clsParsedOperand.OP_EXPRESSION)
       self.byteCode=bytecode
       self.size=size
+      self.evaluate=evaluate  # compiled expression function
 
    def __repr__(self): # pragma: no cover
       s="clsParsedExpression\n"
@@ -1553,6 +1795,8 @@ class clsParsedExpression(clsParsedOperand):
 #  Valid number operand (syntax checked)
 #
 class clsParsedNumber(clsParsedOperand):
+
+   __slots__=("number",)
    
    def __init__(self,number,size=None):
       super().__init__(clsParsedOperand.OP_NUMBER)
@@ -1565,6 +1809,8 @@ class clsParsedNumber(clsParsedOperand):
 # Valid string operand (syntax checked)
 #
 class clsParsedString(clsParsedOperand):
+
+   __slots__=("string",)
    
    def __init__(self,string):
       super().__init__(clsParsedOperand.OP_STRING)
@@ -1579,10 +1825,13 @@ class clsParsedString(clsParsedOperand):
 #
 class clsParsedLabel(clsParsedOperand):
 
+   __slots__=("label","slot")
+
    def __init__(self,label,size=None):
       super().__init__(clsParsedOperand.OP_LABEL)
       self.label=label
       self.size=size
+      self.slot=None     # slot index in the symbol dictionary, see bind
 
    def __repr__(self): # pragma: no cover
       return ("clsParsedLabel label= "+self.label+" "+str(self.size))
@@ -1594,6 +1843,8 @@ class clsParsedRegister(clsParsedOperand):
    R_HASH=-1
    R_ILLEGAL=-2
 
+   __slots__=("registerSign","registerTyp","registerNumber")
+
    def __init__(self,registerSign="", registerTyp="", registerNumber=R_ILLEGAL):
       super().__init__(clsParsedOperand.OP_REGISTER)
       self.registerSign=registerSign      # sign of the register "+", "-" or ""
@@ -1615,6 +1866,8 @@ class clsParsedRegister(clsParsedOperand):
 # An object of this class is returned by the code generator
 #
 class clsCodeInfo(object):
+
+   __slots__=("code","messages","shortList")
    
    def __init__(self,code, messages, shortList=False):
       self.code= code         # list of generated code (bytes)
@@ -1679,6 +1932,8 @@ class clsCodeGeneratorBase(object):
    def __init__(self,globVar):
       super().__init__()
       self.__globVar__= globVar
+      self.__generateDispatch__=globVar.dialect.buildDispatch(self, \
+         "generateMethod")
       return
 #
 #  Add error message to the code generator message list
@@ -1708,7 +1963,7 @@ class clsCodeGeneratorBase(object):
       if pLabel.typ != clsParsedOperand.OP_LABEL:
          self.__code__.extend(defCode)
          return
-      ret=SymDict.get(pLabel.label,self.__lineInfo__)
+      ret=SymDict.getSlot(pLabel.slot,self.__lineInfo__)
       if ret==None:
          self.addError(MESSAGE.E_SYMNOTFOUND)
          self.__code__.extend(defCode)
@@ -1743,7 +1998,7 @@ class clsCodeGeneratorBase(object):
       if pLabel.typ != clsParsedOperand.OP_LABEL:
          self.__code__.extend(defCode)
          return
-      ret=SymDict.get(pLabel.label,self.__lineInfo__)
+      ret=SymDict.getSlot(pLabel.slot,self.__lineInfo__)
       if ret==None:
          self.addError(MESSAGE.E_SYMNOTFOUND)
          self.__code__.extend(defCode)
@@ -1785,11 +2040,11 @@ class clsCodeGeneratorBase(object):
       if len(self.__parsedOperand__)==0:
          return
       SymDict=self.__globVar__.symDict
-      self.__code__.append(self.__opcodeInfo__[2])
+      self.__code__.append(self.__opcodeInfo__.code)
       self.__bytesToGenerate__-=1
       pOperand=self.__parsedOperand__[0]
       if pOperand.typ == clsParsedOperand.OP_LABEL:
-         ret=SymDict.get(pOperand.label,self.__lineInfo__)
+         ret=SymDict.getSlot(pOperand.slot,self.__lineInfo__)
          if ret==None:
             self.addError(MESSAGE.E_SYMNOTFOUND)
             self.__code__.append(0)
@@ -1812,7 +2067,7 @@ class clsCodeGeneratorBase(object):
 #
 #     Complete instruction template according to address mode
 #
-      self.__code__.append(self.__opcodeInfo__[2] | \
+      self.__code__.append(self.__opcodeInfo__.code | \
          clsCodeGeneratorBase.STACK_COMPLETION[self.__addressMode__ ] )
       self.__bytesToGenerate__-=1
       self.gOperands()
@@ -1825,7 +2080,7 @@ class clsCodeGeneratorBase(object):
 #
 #     Complete instruction template according to address mode
 #
-      self.__code__.append(self.__opcodeInfo__[2] | \
+      self.__code__.append(self.__opcodeInfo__.code | \
          clsCodeGeneratorBase.JSB_COMPLETION[self.__addressMode__ ] )
       self.__bytesToGenerate__-=1
       self.gOperands()
@@ -1837,7 +2092,7 @@ class clsCodeGeneratorBase(object):
 #
 #     Complete instruction template according to address mode
 #
-      self.__code__.append(self.__opcodeInfo__[2] | \
+      self.__code__.append(self.__opcodeInfo__.code | \
          clsCodeGeneratorBase.ARI_COMPLETION[self.__addressMode__ ] )
       self.__bytesToGenerate__-=1
       self.gOperands()
@@ -1850,7 +2105,7 @@ class clsCodeGeneratorBase(object):
 #
 #     Complete instruction template according to address mode
 #
-      self.__code__.append(self.__opcodeInfo__[2] | \
+      self.__code__.append(self.__opcodeInfo__.code | \
          clsCodeGeneratorBase.LOADSTORE_COMPLETION[self.__addressMode__ ] )
       self.__bytesToGenerate__-=1
       self.gOperands()
@@ -1871,7 +2126,7 @@ class clsCodeGeneratorBase(object):
 #         Process label, 1 or 2 bytes long
 #
           elif pOperand.typ== clsParsedOperand.OP_LABEL:
-             ret=SymDict.get(pOperand.label,self.__lineInfo__)
+             ret=SymDict.getSlot(pOperand.slot,self.__lineInfo__)
 #
 #            apply the size constraint
 #
@@ -1926,7 +2181,7 @@ class clsCodeGeneratorBase(object):
    def gdarp(self):
 #     if self.__opcodeLen__==0:
 #        return
-      code=self.__opcodeInfo__[2]
+      code=self.__opcodeInfo__.code
       if not self.__parsedOperand__[0].isInvalid():
          code|=self.__parsedOperand__[0].registerNumber
       self.__code__.append(code)
@@ -1936,7 +2191,7 @@ class clsCodeGeneratorBase(object):
 #  Generate all instructions, where the opcode is not modfied by operands
 #
    def gdirect(self):
-      self.__code__.append(self.__opcodeInfo__[2])
+      self.__code__.append(self.__opcodeInfo__.code)
       self.__bytesToGenerate__-=1
       return
 #
@@ -2045,10 +2300,10 @@ class clsCodeGeneratorBase(object):
 #
 #     Call the opcode specific generator method
 #
-      self.__opcodeInfo__=OPCODES.get(self.__opcode__)
-      if self.__opcodeInfo__ !=[]:
-         fname=self.__opcodeInfo__[1]
-         getattr(self,fname)()
+      dispatch=self.__generateDispatch__.get(self.__opcode__)
+      if dispatch is not None:
+         self.__opcodeInfo__,generateMethod=dispatch
+         generateMethod(self)
       return clsCodeInfo(self.__code__, self.__messages__,self.__shortList__)
 #
 # Parser Base class ----------------------------------------------------
@@ -2067,12 +2322,14 @@ class clsParserBase(object):
       self.__globVar__= globVar
       self.__infile__= infile
       self.__hasLcl__=False
+      self.__parseDispatch__=globVar.dialect.buildDispatch(self, \
+         "parseMethod")
       return
 #
 #  check if a scanned opcode is single- or multibyte
 #
    def getByteMode(self):
-      c=self.__scannedOpcode__.string[2]
+      c=self.__scannedOpcode__[2]
       if c=="B":
          return clsParserInfo.BM_SINGLEBYTE
       elif c=="M":
@@ -2103,8 +2360,7 @@ class clsParserBase(object):
 #  If signRequired is True, then a missing sign throws an error
 #  If notAllowed is True, then we can have a !<RegisterNumber>
 #
-   def parseRegister(self,token,signRequired,notAllowed):
-      string=token.string
+   def parseRegister(self,string,signRequired,notAllowed):
       registerTypes="rRxX"
       if notAllowed:
          registerTypes+="!"
@@ -2140,14 +2396,15 @@ class clsParserBase(object):
 #  Parse the Label field
 #
    def parseLabelField(self):
-      label= self.__scannedLabel__.string
+      label= self.__scannedLabel__
       PC=self.__globVar__.PC
       SymDict=self.__globVar__.symDict
       isLcl=False
 #
 #     Valid label?
 #
-      if parseFunc.parseLabel(label,self.__globVar__.symNamLen) is None:
+      if self.__globVar__.dialect.parseLabel(label,\
+         self.__globVar__.symNamLen) is None:
          self.addError(MESSAGE.E_ILL_LABEL)
       else:
 #
@@ -2155,9 +2412,9 @@ class clsParserBase(object):
 #
          isLcl=True
          if self.__scannedOpcode__ is not None:
-            if self.__scannedOpcode__.string=="EQU" or \
-               self.__scannedOpcode__.string=="DAD" or \
-               self.__scannedOpcode__.string=="ADDR":
+            if self.__scannedOpcode__=="EQU" or \
+               self.__scannedOpcode__=="DAD" or \
+               self.__scannedOpcode__=="ADDR":
                isLcl=False
 #
 #        real label, enter it into symbol table and invalidate
@@ -2218,12 +2475,13 @@ class clsParserBase(object):
 #  Parse label as operand
 #
    def parseLabelOp(self,opIndex,size=2):
-      label=self.__scannedOperand__[opIndex].string
-      if self.__scannedOperand__[opIndex].termChar == ",":
+      label=self.__scannedOperand__[opIndex]
+      if self.__scannedOperandSpan__[opIndex][2] == ",":
          label+=","
       if label[0]=="=":
          label=label[1:]
-      if parseFunc.parseLabel(label,self.__globVar__.symNamLen) is None:
+      if self.__globVar__.dialect.parseLabel(label,\
+         self.__globVar__.symNamLen) is None:
          self.addError(MESSAGE.E_ILL_LABELOP)
          return clsInvalidOperand()
       else:
@@ -2239,7 +2497,7 @@ class clsParserBase(object):
 #     we have at least one operand which is a "="
 #
       for opIndex in range(idx,len(self.__scannedOperand__)):
-         opString= self.__scannedOperand__[opIndex].string
+         opString= self.__scannedOperand__[opIndex]
 #
 #        if there is no operand, then quit
 #
@@ -2270,7 +2528,7 @@ class clsParserBase(object):
 #  parse single operand expression
 #
    def parseSingleExpression(self,opIndex,indicatedSize=None):
-      opString= self.__scannedOperand__[opIndex].string
+      opString= self.__scannedOperand__[opIndex]
       parsedExpression,errors=self.__expression__.parse(opString, \
              indicatedSize, False)
       if parsedExpression.typ== clsParsedOperand.OP_INVALID:
@@ -2283,11 +2541,12 @@ class clsParserBase(object):
 #
    def pInc(self):
       self.__globVar__.hasIncludes=True
-      fileName=parseFunc.parseAnyString(self.__scannedOperand__[0].string)
+      fileName=self.__globVar__.dialect.parseAnyString( \
+         self.__scannedOperand__[0])
       if fileName is None:
          self.addError(MESSAGE.E_ILLSTRING)
       else:
-         if self.__scannedOpcode__.string=="LNK":
+         if self.__scannedOpcode__=="LNK":
            self.__infile__.openLink(fileName, \
              self.__globVar__.sourceFileDirectory)
          else:
@@ -2298,7 +2557,8 @@ class clsParserBase(object):
 #  Parse the HED statement
 #
    def pHed(self):
-      title=parseFunc.parseQuotedString(self.__scannedOperand__[0].string)
+      title=self.__globVar__.dialect.parseQuotedString( \
+         self.__scannedOperand__[0])
       if title is None:
          self.addError(MESSAGE.E_ILLSTRING)
          return [clsParsedString("")]
@@ -2390,7 +2650,8 @@ class clsParserBase(object):
 #
 #     Rearrange the scanned Operand
 #
-      self.__scannedOperand__= [clsToken("R4",3,""),self.__scannedOperand__[0]]
+      self.__scannedOperand__= ["R4",self.__scannedOperand__[0]]
+      self.__scannedOperandSpan__= [(3,5,""),self.__scannedOperandSpan__[0]]
       self.__opcodeLen__=1
       dRegister=self.parseDr()
       pLabel=self.parseLabelOp(1)
@@ -2402,7 +2663,7 @@ class clsParserBase(object):
 #
    def pBss(self):
       self.__opcodeLen__=0
-      opstring= self.__scannedOperand__[0].string
+      opstring= self.__scannedOperand__[0]
       result,byteResult,errors=self.__expression__.immediate(opstring, 2, \
          self.__lineInfo__)
       if result is not None:
@@ -2615,7 +2876,7 @@ class clsParserBase(object):
       self.__opcodeLen__=0
       pOperand=[]
       for operand in self.__scannedOperand__:
-         number=parseFunc.parseNumber(operand.string)
+         number=parseFunc.parseNumber(operand)
          if number is None or number > 0xFF:
             err=True
             pOperand.append(clsInvalidOperand())
@@ -2646,25 +2907,26 @@ class clsParserBase(object):
 #     check, if we have a number as first operand
 #
       firstOperand=self.__scannedOperand__[0]
-      if firstOperand.string[0] in "0123456789":
-         numChars=parseFunc.parseNumber(firstOperand.string)
+      start,end,termChar=self.__scannedOperandSpan__[0]
+      if firstOperand[0] in "0123456789":
+         numChars=parseFunc.parseNumber(firstOperand)
          if numChars is None:
             self.addError(MESSAGE.E_ILLNUMBER)
             return pOperand
 #
 #        search for the comma
 #
-         if firstOperand.termChar!=",":
+         if termChar!=",":
             self.addError(MESSAGE.ILLSTRING)
             return pOperand
-         strIndex=self.__line__.find(",",firstOperand.position+
-            len(firstOperand.string))+1
+         strIndex=self.__line__.find(",",end)+1
          string=self.__line__[strIndex:strIndex+numChars]
          if len(string)!= numChars:
             self.addError(MESSAGE.E_ILLSTRING)
             return pOperand
       else:
-         string=parseFunc.parseQuotedString(firstOperand.string)
+         string=self.__globVar__.dialect.parseQuotedString( \
+            firstOperand)
          if string is None:
             self.addError(MESSAGE.E_ILLSTRING)
             return pOperand
@@ -2676,7 +2938,7 @@ class clsParserBase(object):
          if n > 0o174 or n == 0o173 or n < 0o40 :
            err=True
            n=0
-         if i==len(string) and self.__scannedOpcode__.string=="ASP":
+         if i==len(string) and self.__scannedOpcode__=="ASP":
            n|=0o200
          pOperand.append(clsParsedNumber(n))
       if err or i==0:
@@ -2699,7 +2961,7 @@ class clsParserBase(object):
 #  Parse an address
 #
    def parseAddress(self,idx):
-      address=parseFunc.parseNumber(self.__scannedOperand__[idx].string)
+      address=parseFunc.parseNumber(self.__scannedOperand__[idx])
       if address is None:
          self.addError(MESSAGE.E_ILLNUMBER)
          address=clsParserInfo.ILL_NUMBER
@@ -2719,7 +2981,7 @@ class clsParserBase(object):
 #     we have at least one operand which is a "="
 #
       for opIndex in range(1,len(self.__scannedOperand__)):
-         opString= self.__scannedOperand__[opIndex].string
+         opString= self.__scannedOperand__[opIndex]
         
 #
 #        first operand, remove "="
@@ -2807,7 +3069,7 @@ class clsParserBase(object):
          allowedLen=10
       if len(self.__scannedOperand__)==2:
          number=parseFunc.parseNumber(\
-            self.__scannedOperand__[0].string)
+            self.__scannedOperand__[0])
          if number is None or number > 0o377:
             progNumber=0
             self.addError(MESSAGE.E_ILLNUMBER)
@@ -2817,7 +3079,7 @@ class clsParserBase(object):
 #
 #     decode and check program name
 #      
-      progName= self.__scannedOperand__[pnIndex].string
+      progName= self.__scannedOperand__[pnIndex]
       match=re.fullmatch("[\x20-\x7A|\|]{1,"+str(allowedLen)+"}",progName)
       if not match:
          self.addError(MESSAGE.E_ILL_PROGNAME)
@@ -2910,16 +3172,53 @@ class clsParserBase(object):
             self.__opcodeLen__=0
       return [dRegister]
 #
-#  Parse line, top level method
+#  Parse a line in a suppressed conditional assembly region. Only the
+#  line number and the opcode are checked, the scanned line needs no
+#  operands. Returns None if the opcode is a conditional assembly
+#  pseudo-op, which must be processed with parseLine.
+#
+   def parseSuppressedLine(self,scannedLine,line):
+      lineNumberSpan,labelSpan,opcodeSpan,operandSpans=scannedLine
+      opcodeInfo=None
+      if opcodeSpan is not None:
+         opcode=line[opcodeSpan[0]:opcodeSpan[1]].upper()
+         if opcode!="!":
+            opcodeInfo=self.__globVar__.dialect.getOpcode(opcode)
+            if opcodeInfo is not None and opcodeInfo.isCondAssembly:
+               return None
+      self.__messages__= [ ]
+      self.__lineInfo__=self.__infile__.getLineInfo()
+      if lineNumberSpan is not None:
+         if parseFunc.parseDecimal( \
+               line[lineNumberSpan[0]:lineNumberSpan[1]]) is None:
+            self.addError(MESSAGE.E_ILL_LINENUMBER)
+      if opcodeSpan is not None and opcodeInfo is None and opcode!="!":
+         self.__hasLcl__=False
+         self.addError(MESSAGE.E_ILL_OPCODE)
+      return clsParserInfo(self.__globVar__.PC,self.__lineInfo__, \
+         self.__messages__,line)
+#
+#  Parse line, top level method. The scanned line is the list of spans
+#  returned by the scanLineSpans method of the scanner. The strings of the
+#  line number, label and opcode are taken from the line, the operand
+#  strings only if the operands are parsed.
 #
    def parseLine(self,scannedLine,line):
       self.__messages__= [ ]
       self.__scannedLine__=scannedLine
-      self.__scannedLineNumber__= scannedLine[0]
-      self.__scannedLabel__= scannedLine[1]
+      lineNumberSpan,labelSpan,opcodeSpan,operandSpans=scannedLine
+      self.__scannedLineNumber__=None
+      if lineNumberSpan is not None:
+         self.__scannedLineNumber__=line[lineNumberSpan[0]:lineNumberSpan[1]]
+      self.__scannedLabel__=None
+      if labelSpan is not None:
+         self.__scannedLabel__=line[labelSpan[0]:labelSpan[1]]
       self.__line__=line
-      self.__scannedOpcode__=self.__scannedLine__[2]
-      self.__scannedOperand__= self.__scannedLine__[3]
+      self.__scannedOpcode__=None
+      if opcodeSpan is not None:
+         self.__scannedOpcode__=line[opcodeSpan[0]:opcodeSpan[1]].upper()
+      self.__scannedOperandSpan__= operandSpans
+      self.__scannedOperand__= [ ]
 
       self.__parsedOperand__= [ ]
       self.__opcodeLen__=0
@@ -2935,7 +3234,7 @@ class clsParserBase(object):
 #
       if self.__scannedLineNumber__ is not None:
          if parseFunc.parseDecimal( \
-                    self.__scannedLineNumber__.string) is None:
+                    self.__scannedLineNumber__) is None:
             self.addError(MESSAGE.E_ILL_LINENUMBER)
 #
 #     If we have a label field, parse it and enter label into symbol table
@@ -2951,29 +3250,31 @@ class clsParserBase(object):
 #
 #     Return if we have a comment ! in the opcode field
 #
-      if self.__scannedOpcode__.string=="!":
+      if self.__scannedOpcode__=="!":
          return clsParserInfo(PC,self.__lineInfo__,self.__messages__, \
                 self.__line__)
 
-      self.__opcode__=self.__scannedOpcode__.string
+      self.__opcode__=self.__scannedOpcode__
 #
 #     Get information how to parse the opcode
 # 
-      self.__opcodeInfo__=OPCODES.get(self.__opcode__)
+      dispatch=self.__parseDispatch__.get(self.__opcode__)
 #
 #        return error information, if opcode not found
 #
-      if self.__opcodeInfo__ ==[]:
+      if dispatch is None:
          self.__hasLcl__=False
          self.addError(MESSAGE.E_ILL_OPCODE)
          return clsParserInfo(PC,self.__lineInfo__,self.__messages__, \
                               self.__line__)
+      opcodeInfo,parseMethod=dispatch
+      self.__opcodeInfo__=opcodeInfo
 #
 #     We have to check the conditional assembly status,
 #     treat the line as comment if we are in False state
 #     except we have an conditional assembly statement
 #
-      if self.__opcodeInfo__[7]:
+      if opcodeInfo.isCondAssembly:
          condAssemblyIsSuppressed=False
       if condAssemblyIsSuppressed: 
          return clsParserInfo(PC,self.__lineInfo__,self.__messages__, \
@@ -2991,12 +3292,12 @@ class clsParserBase(object):
 #
 #     Check number of params for the opcode
 #
-      if len(self.__scannedOperand__)< self.__opcodeInfo__[3]:
+      if len(operandSpans)< opcodeInfo.minOperands:
             self.addError(MESSAGE.E_ILL_NUMOPERANDS)
             return clsParserInfo(PC,self.__lineInfo__,self.__messages__, \
                            self.__line__)
-      if self.__opcodeInfo__[4] != OPCODES.NUM_OPERANDS_ANY:
-         if len(self.__scannedOperand__)> self.__opcodeInfo__[4]:
+      if opcodeInfo.maxOperands != OPCODES.NUM_OPERANDS_ANY:
+         if len(operandSpans)> opcodeInfo.maxOperands:
             self.addError(MESSAGE.E_ILL_NUMOPERANDS)
             return clsParserInfo(PC,self.__lineInfo__,self.__messages__, \
                               self.__line__)
@@ -3006,26 +3307,27 @@ class clsParserBase(object):
 #     - the opcode is no unconditional jump
 #     - a local label exists for that line 
 #
-      if not self.__opcodeInfo__[6]:
-         if self.__hasLcl__ and not self.__opcodeInfo__[5]:
+      if not opcodeInfo.noCode:
+         if self.__hasLcl__ and not opcodeInfo.isUncondJump:
              self.__globVar__.arpReg= -1
              self.__globVar__.drpReg= -1
       self.__hasLcl__=False
 #
 #     Call operand parse method
 #
-      fname=self.__opcodeInfo__[0]
-      self.__parsedOperand__= getattr(self,fname)()
+      self.__scannedOperand__= [line[start:end] \
+         for start,end,termChar in operandSpans]
+      self.__parsedOperand__= parseMethod(self)
 #
 #     Set flag, if the parsed operand is an unconditional JMP
 #     This flag is needed for parsing an immediately following ELSE
 #     statement which will eliminate the jump instructions to the
 #     corresponding ENDIF
 #
-      if self.__opcodeInfo__[5]:
+      if opcodeInfo.isUncondJump:
          self.__globVar__.lastOpcodeWasJmp=True
       else:
-         if not self.__opcodeInfo__[6]:
+         if not opcodeInfo.noCode:
             self.__globVar__.lastOpcodeWasJmp=False
 #
 #     return parsed statement information
@@ -3035,3 +3337,485 @@ class clsParserBase(object):
              self.__opcode__,self.__opcodeLen__, self.__parsedOperand__, \
              self.__needsArp__,self.__needsDrp__,self.__addressMode__)
 
+#
+# Diagnostic data class ------------------------------------------------
+#
+# An object of this class describes an error or warning of an assembly.
+# The phase is "P" for parser and "C" for code generator messages
+#
+class clsDiagnostic(object):
+
+   def __init__(self,fileName,lineNumber,phase,msgno):
+      self.fileName=fileName      # name of source or include file
+      self.lineNumber=lineNumber  # line number in that file
+      self.phase=phase            # "P": parser, "C": code generator
+      self.msgno=msgno            # message number
+      self.severity,self.text=MESSAGE.getMsg(msgno)
+
+   def isError(self):
+      return self.msgno < 1000
+#
+#  Return diagnostic as dictionary (for JSON output)
+#
+   def toDict(self):
+      return { "file": self.fileName, "line": self.lineNumber, \
+         "severity": self.severity.lower(), "phase": self.phase, \
+         "code": self.msgno, "message": self.text }
+
+   def __str__(self):
+      return "*{:s}({:s}) at {:s}({:d}): {:s}".format(self.severity, \
+         self.phase,self.fileName,self.lineNumber,self.text)
+
+   def __repr__(self): # pragma: no cover
+      return ("clsDiagnostic object "+str(self))
+#
+# Assembly result data class -------------------------------------------
+#
+# An object of this class is returned by the assembleSource method of
+# the assemblers:
+# - code       : generated code as bytes, None if the assembly had errors
+# - diagnostics: list of clsDiagnostic objects
+# - symbols    : dictionary of symbol name and a list of
+#                [type string, value, size, defLineInfo, refLineInfo]
+# - listing    : content of the list file as string, None if no list file
+#                was requested
+# - dependencies: list of the file names of the source, include and link
+#                files and of the global symbol file
+#
+class clsAssemblyResult(object):
+
+   def __init__(self):
+      super().__init__()
+      self.code=None
+      self.diagnostics=[]
+      self.symbols={}
+      self.listing=None
+      self.dependencies=[]
+      self.errorCount=0
+      self.warningCount=0
+      self.codeLen=0
+
+   def hasErrors(self):
+      return self.errorCount > 0
+
+   def __repr__(self): # pragma: no cover
+      return("clsAssemblyResult object: {:d} error(s) {:d} warning(s)".format(\
+         self.errorCount,self.warningCount))
+#
+# Assembler base class --------------------------------------------------
+#
+# This class contains the two pass assembly process which is common to
+# the capasm and the ncas assembler. The subclasses provide the dialect
+# specific parts with the methods createDialect, createParser and 
+# createCodeGenerator.
+#
+# All state of an assembly is kept in the assembler object and in the
+# clsGlobVar object. The dialect object is shared and read only. Therefore
+# assemblies can run concurrently in different threads, if each thread
+# uses its own assembler object.
+#
+class clsAssemblerBase(object):
+
+   _dialect_= None
+
+   def __init__(self):
+       super().__init__()
+       self.__globVar__=None
+       self.__profiler__=None
+#
+#  Get the dialect object, create it on first use. The dialect object 
+#  is stored in the class of the assembler
+#
+   def getDialect(self):
+       cls=type(self)
+       dialect=cls.__dict__.get("_dialect_")
+       if dialect is None:
+          dialect=self.createDialect()
+          cls._dialect_= dialect
+       return dialect
+#
+#  Create symbol table object
+#
+   def createSymDict(self):
+       return clsSymDict( self.__extendedChecks__, \
+            self.__globalSymbolFile__, self.__globVar__.dialect.symTypes)
+#
+#  Create scanner object
+#
+   def createLineScanner(self):
+       dialect=self.__globVar__.dialect
+       return clsLineScanner(dialect.commentLineChar, \
+          dialect.commentTrailerChar, dialect.stringDelimiters)
+#
+#  Initialize the global variables and the symbol table of an assembly
+#
+   def initAssembly(self,sourceFileName,referenceOpt,pageSize,pageWidth, \
+       extendedChecks,symNamLen,useHex,definedFlags,globalSymbolFile):
+#
+#      Create global variables data object
+#
+       self.__globVar__=clsGlobVar()
+       self.__globVar__.useHex=useHex
+       self.__profiler__=None
+       self.__sourceFileName__= sourceFileName
+       self.__globalSymbolFile__= globalSymbolFile
+       self.__referenceOpt__= referenceOpt
+       self.__pageSize__= pageSize
+       self.__pageWidth__= pageWidth
+       self.__extendedChecks__= extendedChecks
+       self.__symNamLen__= symNamLen
+       self.__definedFlags__= definedFlags
+#
+#      Initialize dialect and program name
+#
+       self.__globVar__.dialect=self.getDialect()
+       self.__globVar__.progName=self.__globVar__.dialect.progName
+#
+#      Check if we run in regression test mode
+#
+       if os.getenv("CAPASMREGRESSIONTEST"):
+          self.__globVar__.isRegressionTest=True
+#
+#      Create symbol table object
+#
+       self.__globVar__.symDict=self.createSymDict()
+#
+#      Create conditional assembly object
+#
+       self.__globVar__.condAssembly=clsConditionalAssembly(definedFlags)
+#
+#      get directory of source file
+#
+       self.__globVar__.sourceFileDirectory=\
+          str(Path(self.__sourceFileName__).parent)
+#
+#      Check extended checks mode
+#
+       if self.__extendedChecks__:
+          self.__globVar__.allowHashRLiteral=False
+#
+#      Set symbol name length
+#
+       self.__globVar__.symNamLen=self.__symNamLen__
+       return
+#
+#  Pass 1: scan and parse lines, accumulate results in the
+#  pass1Info store
+#
+   def pass1(self,infile):
+       pass1Info=clsPass1Info()
+       lineScanner=self.createLineScanner()
+       lineParser=self.createParser(infile)
+       if self.__profiler__ is not None:
+          self.__profiler__.instrument(infile,"read","read")
+          self.__profiler__.instrument(lineScanner,"scanLineSpans","scan")
+          self.__profiler__.instrument(lineParser,"parseLine","parse")
+          self.__profiler__.instrument(lineParser,"parseSuppressedLine", \
+             "parse")
+
+       condAssembly=self.__globVar__.condAssembly
+       while not self.__globVar__.isFin:
+          line=infile.read()
+          if line is None:
+             if pass1Info:
+                pass1Info.addMessage(MESSAGE.E_MISSING_FIN)
+                break
+             else:
+                MESSAGE.fatalError("Empty source file")
+          lineReference=infile.getLineReference()
+#
+#         In a suppressed conditional assembly region scan only up to the
+#         opcode, unless the line is a conditional assembly pseudo-op
+#
+          parsedLine=None
+          if condAssembly.isSuppressed():
+             parsedLine=lineParser.parseSuppressedLine( \
+                lineScanner.scanLineSpans(line,False),line)
+#
+#         Scan and parse line
+#
+          if parsedLine is None:
+             scannedLine=infile.getScannedLine(lineScanner)
+             parsedLine=lineParser.parseLine(scannedLine,line)
+          pass1Info.append(parsedLine,lineReference)
+#
+#         Increment PC and codeLen with length of instructions
+#
+          self.__globVar__.PC+=parsedLine.opcodeLen
+          self.__globVar__.codeLen+=parsedLine.opcodeLen
+#
+#      Bind the symbols referenced by the operands, pass 2 looks them
+#      up by slot
+#
+       pass1Info.bindSymbols(self.__globVar__.symDict)
+       return pass1Info
+#
+#  Pass 2: process content of pass1Info store, generate code,
+#  write code to the object writer and output information to 
+#  the list writer. Collect diagnostics in the result object
+#
+   def pass2(self,pass1Info,objWriter,listWriter,result):
+       codeGenerator=self.createCodeGenerator()
+       if self.__profiler__ is not None:
+          self.__profiler__.instrument(codeGenerator,"generate","generate")
+          self.__profiler__.instrument(objWriter,"writeCode","objwrite")
+          self.__profiler__.instrument(objWriter,"close","objwrite")
+          self.__profiler__.instrument(listWriter,"writeLine","listwrite")
+          self.__profiler__.instrument(listWriter,"writeSymbols","symbols")
+
+       for parsedLine in pass1Info:
+#
+#         Generate code
+#
+          codeInfo=codeGenerator.generate(parsedLine)
+#
+#         Write code
+#
+          objWriter.writeCode(codeInfo,parsedLine)
+#
+#         Write listing
+#
+          listWriter.writeLine(parsedLine,codeInfo)
+#
+#         Collect diagnostics
+#
+          if parsedLine.messages or codeInfo.messages:
+             self.collectDiagnostics(parsedLine,codeInfo,result)
+
+       listWriter.writeSymbols(self.__referenceOpt__)
+       listWriter.writeStatistics()
+       return
+#
+#  Add the diagnostics of the parser and the code generator for a line 
+#  to the result object
+#
+   def collectDiagnostics(self,parsedLine,codeInfo,result):
+       fileName,lineNumber=parsedLine.lineInfo
+       for e in parsedLine.messages:
+          result.diagnostics.append(clsDiagnostic(fileName, \
+             lineNumber,"P",e))
+       for e in codeInfo.messages:
+          result.diagnostics.append(clsDiagnostic(fileName, \
+             lineNumber,"C",e))
+#
+#  Get the list of dependencies: all files opened by the source reader
+#  and the global symbol file
+#
+   def getDependencies(self,infile):
+       dependencies=list(infile.getFileNames())
+       globalSymbolFileName=self.__globVar__.symDict.getGlobalSymbolFileName()
+       if globalSymbolFileName is not None:
+          dependencies.append(globalSymbolFileName)
+       return dependencies
+#
+#  Run both passes. The object code is written to binFileName and the
+#  listing to listFileName or listStream. If binFileName is None, the
+#  code is kept in memory only. Returns a clsAssemblyResult object
+#
+   def runAssembly(self,infile,binFileName,listFileName,listStream=None, \
+       quiet=False):
+       result=clsAssemblyResult()
+       if self.__profiler__ is not None:
+          self.__profiler__.start()
+       pass1Info=self.pass1(infile)
+       result.dependencies=self.getDependencies(infile)
+       infile=None
+       numLines=len(pass1Info)
+
+       objWriter=clsObjWriter(binFileName)
+       listWriter=clsListWriter(self.__globVar__,listFileName, \
+                  self.__pageSize__, self.__pageWidth__,listStream,quiet)
+       self.pass2(pass1Info,objWriter,listWriter,result)
+       pass1Info=None
+       listWriter=None
+       objWriter.close()
+       if self.__profiler__ is not None:
+          self.__profiler__.stop(numLines,self.__globVar__.counters)
+#
+#      fill result object
+#
+       result.errorCount=self.__globVar__.errorCount
+       result.warningCount=self.__globVar__.warningCount
+       result.codeLen=self.__globVar__.codeLen
+       if result.errorCount==0:
+          result.code=objWriter.getCode()
+       objWriter=None
+       SymDict=self.__globVar__.symDict
+       for sn in SymDict.getList():
+#
+#         skip symbols beginning with a number (generated symbols)
+#
+          if sn[0].isdigit():
+             continue
+          typ,value,size,defLineInfo,refLineInfo=SymDict.get(sn)
+          result.symbols[sn]=[SymDict.getSymTypeString(typ),value,size, \
+             defLineInfo,refLineInfo]
+       return result
+#
+#  Assemble a source file, write object code and list file. If a build
+#  cache object is specified, the result is taken from the cache if
+#  possible. If depFileName or depJsonFileName are specified, the
+#  dependencies of the object and list file are written to a make 
+#  compatible dependency file or a JSON file. If a profiler object is
+#  specified, the phases of the assembly are timed.
+#  Returns:
+#     False:  everything o.k.
+#     True:   errors in assembly
+#  Raises capasmError on I/O error
+#
+   def assembleFile(self,sourceFileName,binFileName,listFileName, \
+       buildCache=None,depFileName="",depJsonFileName="",profiler=None):
+       self.__profiler__=profiler
+#
+#      Build file name of object file if not specified
+#
+       if binFileName=="":
+          binFileName= Path(sourceFileName).with_suffix(".bin").name
+       if buildCache is not None:
+          hasError,dependencies=self.assembleCached(sourceFileName, \
+             binFileName,listFileName,buildCache)
+       else:
+          result=self.runAssembly(clsSourceReader(sourceFileName), \
+             binFileName,listFileName)
+          dependencies=result.dependencies
+#
+#         delete objectfile if any errors
+#
+          hasError=False
+          if result.hasErrors():
+             os.remove(binFileName)
+             hasError=True
+       self.__globVar__=None
+       self.__profiler__=None
+#
+#      write dependency files
+#
+       if not hasError and (depFileName!="" or depJsonFileName!=""):
+          from .capbuild import clsDependencyWriter
+          targets=[binFileName]
+          if listFileName!="":
+             targets.append(listFileName)
+          depWriter=clsDependencyWriter(targets,dependencies)
+          if depFileName!="":
+             depWriter.writeMake(depFileName)
+          if depJsonFileName!="":
+             depWriter.writeJson(depJsonFileName)
+#
+#      return error condition
+#
+       return hasError
+#
+#  Get the list of assembler options which determine the output of an 
+#  assembly for the build cache key
+#
+   def getCacheOptions(self,sourceFileName,listFileName):
+       from .capbuild import clsBuildCache
+       globalSymbolFile=self.__globalSymbolFile__
+       if globalSymbolFile not in ["85","87","75","none"]:
+          globalSymbolFile=clsBuildCache.hashFile(globalSymbolFile)
+       return [self.__globVar__.progName, Path(sourceFileName).name, \
+          os.getcwd(), self.__globVar__.sourceFileDirectory, \
+          self.__referenceOpt__, self.__pageSize__, self.__pageWidth__, \
+          self.__extendedChecks__, self.__symNamLen__, \
+          self.__globVar__.useHex, list(self.__definedFlags__), \
+          globalSymbolFile, self.__globVar__.isRegressionTest, \
+          listFileName!=""]
+#
+#  Assemble a source file using the build cache. Error free assemblies
+#  are stored in the cache, unless they use symbols which change with
+#  every assembly (time and date symbols of ncas).
+#  Returns the error condition and the list of dependencies
+#
+   def assembleCached(self,sourceFileName,binFileName,listFileName, \
+       buildCache):
+       from .capbuild import clsRecordingIncludeResolver, clsTeeOutput
+       try:
+          with open(sourceFileName,"rb") as f:
+             sourceData=f.read()
+       except OSError:
+          MESSAGE.fatalError("Error opening source file")
+       sourceText=clsRecordingIncludeResolver.decode(sourceData)
+       key=buildCache.getKey(sourceText, \
+          self.getCacheOptions(sourceFileName,listFileName))
+#
+#      Cache hit: restore object file, list file and terminal output
+#
+       cached=buildCache.lookup(key)
+       if cached is not None:
+          try:
+             with open(binFileName,"wb") as f:
+                f.write(bytes.fromhex(cached["code"]))
+          except OSError:
+             MESSAGE.fatalError("Error writing object file")
+          if listFileName!="":
+             try:
+                with open(listFileName,"w") as f:
+                   f.write(cached["listing"])
+             except OSError:
+                MESSAGE.fatalError("Error opening list file")
+          sys.stdout.write(cached["output"])
+          return False,cached.get("dependencies",[])
+#
+#      Cache miss: assemble and record include files and terminal output
+#
+       includeResolver=clsRecordingIncludeResolver()
+       output=clsTeeOutput(sys.stdout)
+       with contextlib.redirect_stdout(output):
+          result=self.runAssembly(clsSourceReader(sourceFileName, \
+             sourceText,includeResolver),binFileName,listFileName)
+       if result.hasErrors():
+          os.remove(binFileName)
+          return True,result.dependencies
+       if self.__globVar__.symDict.extendedGlobalsUsed():
+          return False,result.dependencies
+       listing=None
+       if listFileName!="":
+          try:
+             with open(listFileName,"r") as f:
+                listing=f.read()
+          except OSError:
+             return False,result.dependencies
+       buildCache.store(key,includeResolver.includes,result.code,listing, \
+          output.buffer.getvalue(),result.dependencies)
+       return False,result.dependencies
+#
+#  Check a source file. Run pass 1 and resolve the operands of all lines
+#  with the code generator, but do not write an object or a list file.
+#  Returns a clsAssemblyResult object with the diagnostics and no code
+#  Raises capasmError on I/O error
+#
+   def checkFile(self,sourceFileName):
+       result=clsAssemblyResult()
+       infile=clsSourceReader(sourceFileName)
+       pass1Info=self.pass1(infile)
+       result.dependencies=self.getDependencies(infile)
+       infile=None
+       codeGenerator=self.createCodeGenerator()
+       for parsedLine in pass1Info:
+          codeInfo=codeGenerator.generate(parsedLine)
+          if parsedLine.messages or codeInfo.messages:
+             self.collectDiagnostics(parsedLine,codeInfo,result)
+       result.errorCount=self.__globVar__.errorCount
+       result.warningCount=self.__globVar__.warningCount
+       result.codeLen=self.__globVar__.codeLen
+       self.__globVar__=None
+       return result
+#
+#  Assemble source text in memory. There is no file I/O and no output
+#  to the terminal. Include and link files are obtained by calling the
+#  includeResolver (see clsSourceReader). If listing is True, the list
+#  file is returned as string in the result object.
+#  Returns a clsAssemblyResult object
+#  Raises capasmError on fatal errors
+#
+   def assembleText(self,sourceText,sourceFileName,includeResolver, \
+       listing):
+       listStream=None
+       if listing:
+          listStream=io.StringIO()
+       result=self.runAssembly(clsSourceReader(sourceFileName,sourceText, \
+          includeResolver),None,"",listStream,True)
+       if listing:
+          result.listing=listStream.getvalue()
+       self.__globVar__=None
+       return result
\ No newline at end of file
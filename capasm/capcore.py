@@ -0,0 +1,609 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# This module contains the core code which is shared by the assemblers and
+# the command line tools in captools. It is kept small, so that tools like
+# caprom or caplif do not load the assembler code on startup.
+#
+# (c) 2020 Joachim Siebold
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#--------------------------------------------------------------------------
+#
+import re,os,sys,array,mmap,struct,zlib
+#
+# Program Constants -----------------------------------------------------
+#
+CAPASM_VERSION="Version 1.0.1"
+CAPASM_VERSION_DATE="January 2024"
+
+#
+# CAPASM custom exception -----------------------------------------------
+# The assembler raises this exception, if a fatal error occurred
+#
+class capasmError(Exception):
+   def __init__(self,msg):
+      super().__init__()
+      self.msg= msg
+
+#
+# Class to generates Date/Time as BCD ---------------------------------------
+#
+class clsDateTime(object):
+
+   def __init__(self):
+      super().__init__()
+      import datetime
+      now=datetime.datetime.now()
+      self.bcdYear= self.intToBcd(now.date().year-2000)
+      self.bcdMonth= self.intToBcd(now.date().month)
+      self.bcdDay= self.intToBcd(now.date().day)
+      self.bcdHour= self.intToBcd(now.time().hour)
+      self.bcdMin= self.intToBcd(now.time().minute)
+      self.bcdSec= self.intToBcd(now.time().second)
+
+   def intToBcd(self,value):
+      return (((int(value/10)%10)<<4)+(value%10))
+#
+# Static class for number and label parsing ----------------------------------
+#
+class parseFunc(object):
+#
+#  String delimiters and label syntax of the assembler dialects. The
+#  label match strings must be completed with the maximum length and "}"
+#
+   CAPASM_DELIMITER='"'
+   CAPASM_LABELMATCHSTRING="[(^0-9)(\x20-\x7A|\|)][\x20-\x7A|\|]{0,"
+   NCAS_DELIMITER="'"+'"'
+   NCAS_LABELMATCHSTRING=\
+          "[A-Za-z][A-Za-z0-9_$\+\-\.#/?\(\!\&)=:<>\|@*^]{0,"
+   
+
+#  Parse quoted string
+#
+   @staticmethod
+   def parseQuotedString(string,delimiter):
+      if string[0] not in delimiter:
+         return None
+      if string[0]!=string[-1]:
+         return None
+      string=string[1:len(string)-1]
+
+      return string
+#
+#  Parse quoted or unquoted string
+#
+   @staticmethod 
+   def parseAnyString(string,delimiter):
+      if string[0] in delimiter:
+         return parseFunc.parseQuotedString(string,delimiter)
+      else:
+         return string
+#
+#  Parse label
+#
+   @staticmethod
+   def parseLabel(string,length,labelMatchString):
+      match=re.fullmatch(labelMatchString+ str(length)+"}",string)
+      if match:
+         return string
+      else:
+         return None
+#
+#  Parse decimal number (without D at the end, e.g. line numbers)
+#
+   @staticmethod
+   def parseDecimal(string):
+      try:
+         val=int(string,10)
+         return None if val <  0 else val
+      except ValueError:
+         return None
+#
+#  Parse hex number 
+#
+   @staticmethod
+   def parseHex(string):
+      try:
+         val=int(string,16)
+         return None if val < 0 else val
+      except ValueError:
+         return None
+
+#
+#  Parse binary number
+#
+   @staticmethod
+   def parseBin(string):
+      try:
+         val=int(string,2)
+         return None if val < 0 else val
+      except ValueError:
+         return None
+#
+#  Parse octal number
+#
+   @staticmethod
+   def parseOctal(string):
+      try:
+         val=int(string,8)
+         return None if val < 0 else val
+      except ValueError:
+         return None
+#
+#  Parse BCD number (with a C at the end)
+#
+   @staticmethod
+   def parseBCD(string):
+      retVal=0
+      for c in string:
+         if c in "0123456789":
+            retVal=(retVal<<4) | ord(c)-ord("0")
+         else:
+            return None
+      return retVal
+#
+#  Parse Kbyte number (with a K at the end)
+#
+   @staticmethod
+   def parseKB(string):
+      try:
+         val=int(string,10)*1024
+         return None if val <  0 else val
+      except ValueError:
+         return None
+
+#
+#  Number syntax table: type attribute character at the end of a number ->
+#  base, multiplier, length of the attribute and check of the digits.
+#  BCD numbers are converted as hex numbers after the digits were checked.
+#  Numbers without attribute are octal numbers.
+#
+   NUMBER_TYPES= { }
+   for _c in "Dd":
+      NUMBER_TYPES[_c]=(10,1,1,None)
+   for _c in "Cc":
+      NUMBER_TYPES[_c]=(16,1,1,re.compile("[0-9]*").fullmatch)
+   for _c in "Hh#":
+      NUMBER_TYPES[_c]=(16,1,1,None)
+   for _c in "Bb":
+      NUMBER_TYPES[_c]=(2,1,1,None)
+   for _c in "OoQq":
+      NUMBER_TYPES[_c]=(8,1,1,None)
+   for _c in "Kk":
+      NUMBER_TYPES[_c]=(10,1024,1,None)
+   for _c in "0123456789":
+      NUMBER_TYPES[_c]=(8,1,0,None)
+   del _c
+#
+#  Cache of parsed numbers, it is cleared if it exceeds NUMBER_CACHE_SIZE
+#  entries
+#
+   NUMBER_CACHE_SIZE=4096
+   __numberCache__= { }
+#
+#  Parse number, guess the type from the type attribute character at the end
+#  If the number has no attribute, then it is an ocal number
+#  
+   @staticmethod
+   def parseNumber(string):
+      try:
+         return parseFunc.__numberCache__[string]
+      except KeyError:
+         pass
+      retval=None
+      numberType=parseFunc.NUMBER_TYPES.get(string[-1])
+      if numberType is not None:
+         base,multiplier,attributeLength,checkDigits=numberType
+         digits=string[:len(string)-attributeLength]
+         if checkDigits is None:
+            try:
+               val=int(digits,base)*multiplier
+               if val >= 0:
+                  retval=val
+            except ValueError:
+               pass
+         elif checkDigits(digits):
+            retval=int("0"+digits,base)
+      if len(parseFunc.__numberCache__) >= parseFunc.NUMBER_CACHE_SIZE:
+         parseFunc.__numberCache__.clear()
+      parseFunc.__numberCache__[string]=retval
+      return retval
+
+#      
+# Token data class, result of lexical scanner -----------------------------
+#
+class clsToken(object):
+
+   __slots__=("string","position","termChar")
+
+   def __init__(self, string= "", position= 0, termChar=""):
+      self.string=string          # this is the scanned token as string
+      self.position=position      # the position of the scanned token in the
+                                  # source line
+      self.termChar=termChar      # the char after the token that terminated
+                                  # scanning
+
+   def __repr__(self):  # pragma: no cover
+      return ("clsToken object '{:s}' {:d} '{:s}'".format(self.string, self.position,self.termChar))
+
+#
+# Lexical Scanner class -------------------------------------------------
+#
+# The scanLine() method of the scanner takes a source line as input and
+# returns a list of clsToken objects:
+# [lineNumber,label,opcode,[scannedOperands]]
+#
+# The scanLineSpans() method returns the same structure, but instead of
+# token objects each item is a tuple (start, end, termChar) of offsets into
+# the source line. The parser consumes this compact format.
+#
+# A token is scanned with one match of a compiled regular expression:
+# leading blanks are skipped, the token ends at a blank or at one of the
+# terminating symbols. Terminating symbols and blanks within a string
+# are part of the token, an unterminated string extends to the end of the
+# line. If the token starts with a terminating symbol, this symbol is
+# returned as token. The regular expressions are built once for each set
+# of terminating symbols.
+#
+class clsLineScanner(object):
+
+#
+#  init scanner:
+# commentLineChar: character(s) that indicate a line with a comment
+# commentTrailerChar: character(s) that idicate trailing comment
+# stringDelimiters: string delimiters
+#
+
+   def __init__(self,commentLineChar,commentTrailerChar,stringDelimiters):
+      super().__init__()
+      self.__commentLineChar__= commentLineChar
+      self.__commentTrailerChar__= commentTrailerChar
+      self.__stringDelimiters__= stringDelimiters
+      self.__tokenPatterns__= { }
+#
+#     scanned lines of cached include files are stored with this key
+#
+      self.key=(self.__class__,commentLineChar,commentTrailerChar, \
+         stringDelimiters)
+#
+#  Build the regular expression for a token. Groups:
+#  1: terminating symbol at the beginning of the token
+#  2: character after the terminating symbol (not consumed)
+#  3: token
+#  4: character that terminated the token
+#
+   def buildTokenPattern(self,termSyms):
+      termString=" "+termSyms
+      body=["[^"+re.escape(termString+self.__stringDelimiters__)+"]+"]
+      for quote in self.__stringDelimiters__:
+         q=re.escape(quote)
+         body.append(q+"[^"+q+"]*"+q+"?")
+      if termSyms:
+         termPattern="(["+re.escape(termSyms)+"])(?=(.?))|"
+      else:
+         termPattern="()()"
+      pattern=re.compile(" *(?:"+termPattern+"((?:"+"|".join(body)+ \
+         ")*)(.?))",re.DOTALL)
+      self.__tokenPatterns__[termSyms]=pattern
+      return pattern
+#
+#  Get the token pattern for a set of terminating symbols
+#
+   def getTokenPattern(self,termSyms):
+      pattern=self.__tokenPatterns__.get(termSyms)
+      if pattern is None:
+         pattern=self.buildTokenPattern(termSyms)
+      return pattern
+#
+#  Scan input line and return the spans of the scanned line number, label,
+#  opcode and a list of the spans of the operands. A span is a tuple
+#  (start, end, termChar). Missing items are None. If scanOperands is
+#  False, the operands are not scanned and the operand list is empty.
+#
+   def scanLineSpans(self,line,scanOperands=True):
+
+      scannedLineNumber=None
+      scannedLabel=None
+      scannedOperand=[]
+      pattern=self.getTokenPattern("")
+#
+#     We have an empty line that contains nothing
+#
+      match=pattern.match(line)
+      start,end=match.span(3)
+      if start==end:
+         return [None,None,None,scannedOperand]
+      position=match.end()
+#
+#     Is the first token a line number?
+#
+      lineBegin=0
+      if line[start] in "0123456789":
+         scannedLineNumber=(start,end,match.group(4))
+         lineBegin=end
+         match=pattern.match(line,position)
+         start,end=match.span(3)
+#
+#     No next token, leave ...
+#
+         if start==end:
+            return [scannedLineNumber,None,None,scannedOperand]
+         position=match.end()
+#
+#     Is the token a label? 
+#
+      if start <= lineBegin+2:
+         if line[start] not in self.__commentLineChar__:
+            scannedLabel=(start,end,match.group(4))
+            match=pattern.match(line,position)
+            start,end=match.span(3)
+#
+#     No next token, leave ...
+#
+            if start==end:
+               return [scannedLineNumber,scannedLabel,None,scannedOperand]
+            position=match.end()
+#
+#     Do we have a comment?
+#
+      if line[start] in self.__commentLineChar__ \
+         or line[start] in self.__commentTrailerChar__:
+         return [scannedLineNumber,scannedLabel,None,scannedOperand]
+      scannedOpcode=(start,end,match.group(4))
+      if not scanOperands:
+         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+#
+#     Operand, if any, scan it as a comma separated list
+#
+      pattern=self.getTokenPattern(",")
+      while True:
+         match=pattern.match(line,position)
+         position=match.end()
+#
+#        Comma, continue loop
+#
+         if match.group(1):
+            continue
+         start,end=match.span(3)
+#
+#        End of line
+#
+         if start==end:
+            break
+#
+#        Comment 
+#
+         if line[start] in self.__commentTrailerChar__:
+            break
+         scannedOperand.append((start,end,match.group(4)))
+      return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+#
+#  Scan input line and return scanned line number, label, opcode and a list
+#  of operands as token objects. Missing items are None
+#
+   def scanLine(self,line):
+      scannedLine=self.scanLineSpans(line)
+      for i in range(3):
+         span=scannedLine[i]
+         if span is not None:
+            scannedLine[i]=clsToken(line[span[0]:span[1]],span[0],span[2])
+      if scannedLine[2] is not None:
+         scannedLine[2].string=scannedLine[2].string.upper()
+      scannedLine[3]=[clsToken(line[start:end],start,termChar) \
+         for start,end,termChar in scannedLine[3]]
+      return scannedLine
+#
+# Binary global symbol table class ------------------------------------------
+#
+# A binary global symbol table is created by capglo together with the Python
+# global symbol table. The file is mapped into memory and a symbol is looked
+# up in a hash table without creating Python objects for the other symbols.
+# File layout, all numbers are little endian:
+#
+# header:       magic, number of symbols, number of hash slots, name blob
+#               size, size and CRC-32 of the Python global symbol file
+# hash slots:   uint32 symbol index + 1 for each slot, 0 if the slot is empty
+# name offsets: uint32 offset of each name in the name blob and the blob size
+# hashes:       uint32 hash of each name
+# values:       uint16 value of each symbol
+# types:        uint8 type of each symbol
+# name blob:    UTF-8 encoded symbol names in sorted order
+#
+# The hash is zlib.crc32 of the encoded name, collisions are resolved by
+# linear probing. A table is only used if the size and the CRC-32 of the
+# Python global symbol file match the header, because the Python file may
+# have been changed without creating the binary table again. Loaded tables
+# are shared by all assemblies of a process, a table is loaded again if the
+# inode, mtime or size of the file changes.
+# A table is written to a temporary file which replaces the old file, so
+# that the old file remains valid for processes which have it mapped.
+# The results of the lookups are cached for each name, the cache is cleared
+# if it exceeds MAX_ENTRIES names.
+#
+class clsGlobalSymbolTable(object):
+
+   MAGIC=b"CAPGST02"
+   HEADER=struct.Struct("<8sIIIII")
+   SUFFIX=".gst"
+   MAX_ENTRIES=65536
+   __tables__= { }
+
+   def __init__(self,fileName):
+      super().__init__()
+      self.fileName=fileName
+      self.__results__= { }
+      with open(fileName,"rb") as f:
+         self.identity=clsGlobalSymbolTable.getIdentity(os.fstat(f.fileno()))
+         self.__map__=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+      magic,count,numSlots,blobSize,sourceSize,sourceCrc= \
+         clsGlobalSymbolTable.HEADER.unpack_from(self.__map__,0)
+      self.sourceStamp=(sourceSize,sourceCrc)
+      self.sourceIdentity=None
+      offset=clsGlobalSymbolTable.HEADER.size
+      if magic != clsGlobalSymbolTable.MAGIC or numSlots & (numSlots-1) or \
+         numSlots <= count or len(self.__map__) != offset+numSlots*4+ \
+         (count+1)*4+count*7+blobSize:
+         raise capasmError("Invalid binary global symbol table "+fileName)
+      self.__count__=count
+      self.__mask__=numSlots-1
+      self.__hashSlots__=self.getArray("I",offset,numSlots)
+      offset+=numSlots*4
+      self.__offsets__=self.getArray("I",offset,count+1)
+      offset+=(count+1)*4
+      self.__hashes__=self.getArray("I",offset,count)
+      offset+=count*4
+      self.__values__=self.getArray("H",offset,count)
+      offset+=count*2
+      self.__types__=self.getArray("B",offset,count)
+      self.__blobOffset__=offset+count
+#
+#  Get a view of an array in the file, the numbers are converted if the
+#  machine is big endian
+#
+   def getArray(self,typecode,offset,count):
+      view=memoryview(self.__map__)[offset:offset+ \
+         count*array.array(typecode).itemsize]
+      if sys.byteorder=="little":
+         return view.cast(typecode)
+      numbers=array.array(typecode)
+      numbers.frombytes(view)
+      numbers.byteswap()
+      return numbers
+#
+#  Get the identity of a table file from its stat result
+#
+   @staticmethod
+   def getIdentity(st):
+      return (st.st_ino,st.st_mtime_ns,st.st_size)
+#
+#  Get size and CRC-32 of the Python global symbol file
+#
+   @staticmethod
+   def getSourceStamp(sourceFileName):
+      with open(sourceFileName,"rb") as f:
+         data=f.read()
+      return (len(data),zlib.crc32(data) & 0xFFFFFFFF)
+#
+#  Load a table, a table is loaded only once per process unless the file
+#  was changed. Raises capasmError if the table was not created from the
+#  Python global symbol file sourceFileName. The Python file is only read
+#  again if its inode, mtime or size changed.
+#
+   @classmethod
+   def load(cls,fileName,sourceFileName):
+      key=os.path.abspath(fileName)
+      identity=cls.getIdentity(os.stat(fileName))
+      table=cls.__tables__.get(key)
+      if table is None or table.identity != identity:
+         table=cls(fileName)
+         cls.__tables__[key]=table
+      sourceIdentity=cls.getIdentity(os.stat(sourceFileName))
+      if table.sourceIdentity != sourceIdentity:
+         if cls.getSourceStamp(sourceFileName) != table.sourceStamp:
+            raise capasmError("Binary global symbol table "+fileName+ \
+               " does not match "+sourceFileName)
+         table.sourceIdentity=sourceIdentity
+      return table
+#
+#  Write a table, symbols is a dictionary of symbol name and [type, value]
+#  of the Python global symbol file sourceFileName
+#
+   @staticmethod
+   def write(fileName,symbols,sourceFileName):
+      sourceSize,sourceCrc= \
+         clsGlobalSymbolTable.getSourceStamp(sourceFileName)
+      names=sorted(symbols.keys())
+      numSlots=1
+      while numSlots <= len(names)*2:
+         numSlots*=2
+      slots=array.array("I",[0]*numSlots)
+      offsets=array.array("I")
+      hashes=array.array("I")
+      values=array.array("H")
+      types=array.array("B")
+      blob=bytearray()
+      for index,name in enumerate(names):
+         key=name.encode("utf-8")
+         hashValue=zlib.crc32(key) & 0xFFFFFFFF
+         slot=hashValue & (numSlots-1)
+         while slots[slot]:
+            slot=(slot+1) & (numSlots-1)
+         slots[slot]=index+1
+         offsets.append(len(blob))
+         blob.extend(key)
+         hashes.append(hashValue)
+         typ,value=symbols[name]
+         types.append(typ)
+         values.append(value)
+      offsets.append(len(blob))
+      if sys.byteorder!="little":
+         for numbers in (slots,offsets,hashes,values):
+            numbers.byteswap()
+      tmpFileName="{:s}.{:d}.tmp".format(fileName,os.getpid())
+      try:
+         with open(tmpFileName,"wb") as f:
+            f.write(clsGlobalSymbolTable.HEADER.pack( \
+               clsGlobalSymbolTable.MAGIC,len(names),numSlots,len(blob), \
+               sourceSize,sourceCrc))
+            for numbers in (slots,offsets,hashes,values,types):
+               f.write(numbers.tobytes())
+            f.write(blob)
+         os.replace(tmpFileName,fileName)
+      except OSError:
+         try:
+            os.remove(tmpFileName)
+         except OSError:
+            pass
+         raise
+#
+#  Get a symbol, returns [type, value] or None. A leading "=" is ignored
+#  like in the Python global symbol table
+#
+   def get(self,name):
+      try:
+         return self.__results__[name]
+      except KeyError:
+         pass
+      result=self.lookup(name[1:] if name[0]=='=' else name)
+      if len(self.__results__) >= clsGlobalSymbolTable.MAX_ENTRIES:
+         self.__results__.clear()
+      self.__results__[name]=result
+      return result
+#
+#  Look up a symbol in the hash table
+#
+   def lookup(self,name):
+      key=name.encode("utf-8")
+      hashValue=zlib.crc32(key) & 0xFFFFFFFF
+      slots=self.__hashSlots__
+      hashes=self.__hashes__
+      mask=self.__mask__
+      slot=hashValue & mask
+      while True:
+         index=slots[slot]
+         if index==0:
+            return None
+         index-=1
+         if hashes[index]==hashValue:
+            blobOffset=self.__blobOffset__
+            if self.__map__[blobOffset+self.__offsets__[index]: \
+               blobOffset+self.__offsets__[index+1]]==key:
+               return [self.__types__[index],self.__values__[index]]
+         slot=(slot+1) & mask
+
+   def __len__(self):
+      return self.__count__
@@ -0,0 +1,390 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# This module contains the assembler server and its thin client:
+# - the server keeps the CAPASM modules and the global symbol tables
+#   loaded and executes the command line tools on request of a client
+#   over a local Unix domain socket. The server is started with
+#   capasm --serve
+# - the client entry points capasmc, ncasc, caplexc, caplifc and capromc
+#   are drop-in replacements for the corresponding command line tools.
+#   They send the command line to the server and print its output. If
+#   no server is running, the tool is executed locally.
+#
+# The socket path is taken from the environment variable CAPASM_SOCKET,
+# the default is capasm.sock in $XDG_RUNTIME_DIR or in the private directory
+# capasm-<user id> (mode 0700) in the temporary directory. The client and
+# the server only use a socket which is owned by the current user.
+#
+# (c) 2020 Joachim Siebold
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#--------------------------------------------------------------------------
+#
+import sys,os,io,json,socket,signal,tempfile,contextlib,importlib,stat, \
+   struct
+
+#
+# Tools which can be executed by the server: tool name, module and
+# entry point function
+#
+SERVER_TOOLS= { "capasm": (".assembler","capasm"),
+                "ncas":   (".ncas","ncas"),
+                "caplex": (".captools","caplex"),
+                "caplif": (".captools","caplif"),
+                "caprom": (".captools","caprom"),
+              }
+#
+# Environment variables which are passed from the client to the server
+#
+SERVER_ENVIRONMENT= [ "CAPASMREGRESSIONTEST", "CAPASM_CACHEDIR" ]
+#
+# Timeout in seconds for receiving a request or a response
+#
+SERVER_TIMEOUT=30
+
+#
+# Get the path of the server socket
+#
+def getSocketPath():
+   socketPath=os.getenv("CAPASM_SOCKET")
+   if socketPath:
+      return socketPath
+   runtimeDirectory=os.getenv("XDG_RUNTIME_DIR")
+   if runtimeDirectory and os.path.isdir(runtimeDirectory):
+      return os.path.join(runtimeDirectory,"capasm.sock")
+   return os.path.join(getPrivateDirectory(),"capasm.sock")
+#
+# Get the private socket directory in the temporary directory
+#
+def getPrivateDirectory():
+   return os.path.join(tempfile.gettempdir(), \
+      "capasm-{:d}".format(os.getuid()))
+#
+# Check the socket path, returns an error message or None. The private
+# directory must be owned by the current user and must not be accessible
+# by other users, an existing socket must be owned by the current user
+#
+def checkSocketPath(socketPath):
+   directory=os.path.dirname(socketPath)
+   if directory==getPrivateDirectory():
+      try:
+         st=os.lstat(directory)
+      except OSError:
+         return None
+      if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or \
+         st.st_mode & 0o077:
+         return "Socket directory "+directory+ \
+            " is not a private directory of the current user"
+   try:
+      st=os.lstat(socketPath)
+   except OSError:
+      return None
+   if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+      return "Socket "+socketPath+" is not owned by the current user"
+   return None
+#
+# Check the user of the peer of a connected socket, if the platform
+# supports SO_PEERCRED
+#
+def isOwnPeer(sock):
+   if not hasattr(socket,"SO_PEERCRED"):
+      return True
+   try:
+      credentials=sock.getsockopt(socket.SOL_SOCKET,socket.SO_PEERCRED, \
+         struct.calcsize("3i"))
+   except OSError:
+      return False
+   _,uid,_=struct.unpack("3i",credentials)
+   return uid==os.getuid()
+#
+# Receive a JSON message which is terminated by closing the write side
+# of the socket
+#
+def receiveMessage(sock):
+   chunks=[]
+   while True:
+      chunk=sock.recv(65536)
+      if not chunk:
+         break
+      chunks.append(chunk)
+   return json.loads(b"".join(chunks).decode("utf-8"))
+#
+# Send a JSON message and close the write side of the socket
+#
+def sendMessage(sock,message):
+   sock.sendall(json.dumps(message).encode("utf-8"))
+   sock.shutdown(socket.SHUT_WR)
+
+#
+# Exception which terminates the server loop on SIGTERM. It is derived from
+# BaseException, so that it is not caught by the tools
+#
+class clsServerTerminate(BaseException):
+   pass
+
+#
+# Assembler server class --------------------------------------------------
+#
+# The server processes one request at a time, because the tools change
+# the current directory and write to sys.stdout. A request is a JSON object
+# with the tool name, the command line arguments, the current directory
+# and the environment variables of the client. The response contains the
+# exit code and the terminal output of the tool.
+#
+# A SIGTERM which arrives while a request is processed only sets a flag,
+# the response is sent and then the server loop is left.
+#
+class clsAssemblerServer(object):
+#
+#  True while a server loop is running in this process
+#
+   __active__=False
+
+   def __init__(self,socketPath):
+      super().__init__()
+      self.__socketPath__=socketPath
+      self.__entryPoints__= { }
+      self.__busy__=False
+      self.__terminate__=False
+#
+#     Import all tools and the build support and load the built-in global
+#     symbol tables once
+#
+      for tool,(moduleName,functionName) in SERVER_TOOLS.items():
+         module=importlib.import_module(moduleName,package="capasm")
+         self.__entryPoints__[tool]=getattr(module,functionName)
+      importlib.import_module(".capbuild",package="capasm")
+      capcommon=importlib.import_module(".capcommon",package="capasm")
+      for globalSymbolFile in ["75","85","87","none"]:
+         capcommon.clsSymDict(False,globalSymbolFile,None). \
+            loadGlobalSymbols()
+#
+#  Check the structure of a request, returns an error message or None
+#
+   def checkRequest(self,request):
+      if not isinstance(request,dict):
+         return "Invalid request"
+      tool=request.get("tool")
+      if tool not in self.__entryPoints__:
+         return "Invalid tool: "+str(tool)
+      argv=request.get("argv")
+      if not isinstance(argv,list) or \
+         not all(isinstance(arg,str) for arg in argv):
+         return "Invalid request: argv"
+      if not isinstance(request.get("directory"),str):
+         return "Invalid request: directory"
+      environment=request.get("environment")
+      if not isinstance(environment,dict) or \
+         not all(value is None or isinstance(value,str) \
+         for value in environment.values()):
+         return "Invalid request: environment"
+      return None
+#
+#  Execute a tool, return the response object
+#
+   def execute(self,request):
+      error=self.checkRequest(request)
+      if error is not None:
+         return {"exitCode": 2, "stdout": "", "stderr": error+"\n"}
+      tool=request["tool"]
+      stdout=io.StringIO()
+      stderr=io.StringIO()
+      oldArgv=sys.argv
+      oldDirectory=os.getcwd()
+      oldEnvironment= { }
+      for name in SERVER_ENVIRONMENT:
+         oldEnvironment[name]=os.environ.get(name)
+      exitCode=0
+      try:
+         for name in SERVER_ENVIRONMENT:
+            value=request["environment"].get(name)
+            if value is None:
+               os.environ.pop(name,None)
+            else:
+               os.environ[name]=value
+         os.chdir(request["directory"])
+         sys.argv=[tool]+request["argv"]
+         with contextlib.redirect_stdout(stdout), \
+              contextlib.redirect_stderr(stderr):
+            try:
+               self.__entryPoints__[tool]()
+            except SystemExit as e:
+               if e.code is None:
+                  exitCode=0
+               elif isinstance(e.code,int):
+                  exitCode=e.code
+               else:
+                  print(e.code,file=sys.stderr)
+                  exitCode=1
+            except Exception as e:
+               print("Internal error: "+repr(e),file=sys.stderr)
+               exitCode=1
+      except OSError as e:
+         print("Cannot change to directory "+request["directory"], \
+            file=stderr)
+         exitCode=1
+      finally:
+         sys.argv=oldArgv
+         os.chdir(oldDirectory)
+         for name,value in oldEnvironment.items():
+            if value is None:
+               os.environ.pop(name,None)
+            else:
+               os.environ[name]=value
+      return {"exitCode": exitCode, "stdout": stdout.getvalue(), \
+         "stderr": stderr.getvalue()}
+#
+#  SIGTERM handler, terminate at once if no request is processed
+#
+   def handleTerminate(self,signum,frame):
+      self.__terminate__=True
+      if not self.__busy__:
+         raise clsServerTerminate()
+#
+#  Server loop, terminate on SIGTERM or keyboard interrupt
+#
+   def serve(self):
+      directory=os.path.dirname(self.__socketPath__)
+      if directory==getPrivateDirectory():
+         try:
+            os.mkdir(directory,0o700)
+         except FileExistsError:
+            pass
+         except OSError:
+            print("Cannot create socket directory "+directory)
+            return False
+      error=checkSocketPath(self.__socketPath__)
+      if error is not None:
+         print(error)
+         return False
+      probe=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+      try:
+         probe.connect(self.__socketPath__)
+         probe.close()
+         print("Server already running on "+self.__socketPath__)
+         return False
+      except OSError:
+         probe.close()
+      if os.path.exists(self.__socketPath__):
+         os.remove(self.__socketPath__)
+      server=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+      oldUmask=os.umask(0o077)
+      try:
+         server.bind(self.__socketPath__)
+      finally:
+         os.umask(oldUmask)
+      server.listen(16)
+      oldHandler=signal.signal(signal.SIGTERM,self.handleTerminate)
+      clsAssemblerServer.__active__=True
+      print("Server listening on "+self.__socketPath__)
+      sys.stdout.flush()
+      try:
+         while not self.__terminate__:
+            conn,_=server.accept()
+            with conn:
+               if not isOwnPeer(conn):
+                  continue
+               conn.settimeout(SERVER_TIMEOUT)
+               try:
+                  request=receiveMessage(conn)
+                  self.__busy__=True
+                  try:
+                     sendMessage(conn,self.execute(request))
+                  finally:
+                     self.__busy__=False
+               except (OSError,ValueError):
+                  pass
+      except (KeyboardInterrupt,clsServerTerminate):
+         pass
+      finally:
+         clsAssemblerServer.__active__=False
+         signal.signal(signal.SIGTERM,oldHandler)
+         server.close()
+         if os.path.exists(self.__socketPath__):
+            os.remove(self.__socketPath__)
+      return True
+#
+# Start the server (called by capasm --serve)
+#
+def serve(socketPath=""):
+   if clsAssemblerServer.__active__:
+      print("A server cannot be started by a server request")
+      sys.exit(2)
+   if socketPath=="":
+      socketPath=getSocketPath()
+   server=clsAssemblerServer(socketPath)
+   if not server.serve():
+      sys.exit(1)
+
+#
+# Client -----------------------------------------------------------------
+#
+# Send the command line to the server and output the response. If the
+# server cannot be reached, run the tool locally
+#
+def runClient(tool):
+   request= { "tool": tool, "argv": sys.argv[1:], "directory": os.getcwd(),
+      "environment": {name: os.environ.get(name) \
+          for name in SERVER_ENVIRONMENT } }
+   socketPath=getSocketPath()
+   error=checkSocketPath(socketPath)
+   sock=socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+   try:
+      if error is not None:
+         raise OSError(error)
+      sock.connect(socketPath)
+      if not isOwnPeer(sock):
+         raise OSError("Server is not owned by the current user")
+   except OSError:
+      sock.close()
+      if error is not None:
+         print(error+", running locally",file=sys.stderr)
+      moduleName,functionName=SERVER_TOOLS[tool]
+      module=importlib.import_module(moduleName,package="capasm")
+      getattr(module,functionName)()
+      return
+   sock.settimeout(None)
+   try:
+      sendMessage(sock,request)
+      response=receiveMessage(sock)
+   except (OSError,ValueError):
+      print("Communication with the assembler server failed", \
+         file=sys.stderr)
+      sys.exit(1)
+   finally:
+      sock.close()
+   sys.stdout.write(response["stdout"])
+   sys.stderr.write(response["stderr"])
+   if response["exitCode"]:
+      sys.exit(response["exitCode"])
+#
+# Client entry points -----------------------------------------------------
+#
+def capasmc():      # pragma: no cover
+   runClient("capasm")
+
+def ncasc():        # pragma: no cover
+   runClient("ncas")
+
+def caplexc():      # pragma: no cover
+   runClient("caplex")
+
+def caplifc():      # pragma: no cover
+   runClient("caplif")
+
+def capromc():      # pragma: no cover
+   runClient("caprom")
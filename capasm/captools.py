@@ -50,7 +50,8 @@
 import sys, argparse,os, codecs,re,contextlib
 from pathlib import Path
 from itertools import groupby
-from .capcommon import capasmError, clsLineScanner, parseFunc, CAPASM_VERSION,clsDateTime
+from .capcore import capasmError, clsLineScanner, parseFunc, CAPASM_VERSION,clsDateTime, \
+     clsGlobalSymbolTable
 
 #
 # silently remove files, continue if they do not exist
@@ -314,6 +315,8 @@ class clsSymbolFileConverter(object):
 # to access global symbols for a specific machine. At the moment CAPASM 
 # supports the script file names globals75.py, globals85.py, globals87.py. 
 # The -m option of the assembler controls which file is used for the assembly.
+# Additionally a binary global symbol table with the suffix ".gst" is
+# generated, which is preferred by the assembler (see clsGlobalSymbolTable).
 #
 # The program checks for duplicate global symbol definitions which exist
 # in the file globals75.txt. At the moment duplicate definitions overwrite 
@@ -343,14 +346,12 @@ class clsSymClassGenerator(object):
       if style== "ncas":
          labelLen=32
          lineScanner=clsLineScanner("*",";","'`^"+'"')
-         parseFunc.DELIMITER="'"+'"'
-         parseFunc.LABELMATCHSTRING=\
-          "[A-Za-z][A-Za-z0-9_$\+\-\.#/?\(\!\&)=:<>\|@*^]{0,"
+         labelMatchString=parseFunc.NCAS_LABELMATCHSTRING
       else:
          lineScanner=clsLineScanner("!","!",'"')
-         parseFunc.DELIMITER='"'
-         parseFunc.LABELMATCHSTRING="[(^0-9)(\x20-\x7A|\|)][\x20-\x7A|\|]{0,"
+         labelMatchString=parseFunc.CAPASM_LABELMATCHSTRING
       symDict= { }
+      symbols= { }
       duplicates=0
       errors=0
       hasErrors=False
@@ -410,7 +411,7 @@ class clsSymClassGenerator(object):
 #
 #        Check symbol name
 #
-            if parseFunc.parseLabel(symbolName,labelLen) is None:
+            if parseFunc.parseLabel(symbolName,labelLen,labelMatchString) is None:
                print("Line: "+lineNumber+": "+line)
                print("illegal symbol")
                errors+=1
@@ -463,11 +464,13 @@ class clsSymClassGenerator(object):
                   ret[0]+" opcode: "+ret[1]+" value: "+ret[2])
                outfile.write('      "'+symbolName+'" : ['+str(opTyp)+ \
                     ","+str(intValue)+"],\n")
+               symbols[symbolName]=[opTyp,intValue]
                duplicates+=1
             else:
                symDict[symbolName]=[lineNumber,opCode,value]
                outfile.write('      "'+symbolName+'" : ['+str(opTyp)+ \
                        ","+str(intValue)+"],\n")
+               symbols[symbolName]=[opTyp,intValue]
 #
 #     All input line processed, write access method
 #
@@ -483,6 +486,11 @@ class clsSymClassGenerator(object):
          outfile.write("         return None\n")
          outfile.write("\n")
          outfile.close()
+#
+#     Write binary global symbol table
+#
+         clsGlobalSymbolTable.write(str(Path(outputFileName).with_suffix( \
+            clsGlobalSymbolTable.SUFFIX)),symbols,outputFileName)
       except OSError:
          raise capasmError("I/O Error while converting global symbols file")
       print("Errors {:d}, duplicate entries {:d} ".format(errors,duplicates))
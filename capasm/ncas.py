@@ -22,7 +22,7 @@
 #
 # Changelog
 
-import argparse,sys,os,math,time
+import argparse,sys,os,math,time,operator
 import importlib.util
 from pathlib import Path
 from .capcommon import capasmError,BYTESTOSTORE,parseFunc,OPCODES, \
@@ -31,11 +31,25 @@ from .capcommon import capasmError,BYTESTOSTORE,parseFunc,OPCODES, \
      clsObjWriter, clsListWriter, clsSourceReader, clsParserInfo, \
      clsParsedOperand, clsParsedExpression, clsInvalidOperand, \
      clsParsedLabel,clsParsedString, clsParsedRegister, clsCodeInfo, \
-     clsCodeGeneratorBase, clsParserBase, clsDateTime
+     clsCodeGeneratorBase, clsParserBase, clsDateTime, clsAssemblerBase, \
+     clsAssemblyResult, clsDialect
 
 #
+# Expression error class --------------------------------------------------
+#
+# Raised by a compiled expression if it cannot be evaluated
+#
+class clsExpressionError(Exception):
+
+   def __init__(self,msgno):
+      super().__init__()
+      self.msgno=msgno    # message number
+#
 # Expression parser and execute class -----------------------------------
 #
+# The parser generates a byte code of an expression and compiles the byte
+# code into a tree of closures, which is evaluated by execute.
+#
 class clsExpression(object):
 
    EX_NUM=0
@@ -55,11 +69,18 @@ class clsExpression(object):
    OP_NONE=10
 
    CH_OP=["PLUS","MINUS","DIV","MULT","OR","AND","NOT","MOD","RESIZE","CHS","NONE"]
+#
+#  Functions of the binary operators without error conditions
+#
+   BINARY_FUNCTIONS= { OP_PLUS: operator.add, OP_MINUS: operator.sub, 
+      OP_MULT: operator.mul, OP_AND: operator.and_, OP_OR: operator.or_ }
 
 
    def __init__(self,globVar):
       super().__init__()
       self.__globVar__=globVar
+      globVar.counters.setdefault("foldedExpressions",0)
+      globVar.counters.setdefault("cachedExpressions",0)
 
    def addError(self,errnum):
       self.__errors__.append(errnum)
@@ -78,18 +99,26 @@ class clsExpression(object):
    def genLoc(self,value):
       self.__bc__.append([clsExpression.EX_NUM,value])
       self.__size__=2
+      self.__cacheable__=False
       
 #
 #  symbol
 #
    def genSymbol(self,name):
       self.__bc__.append([clsExpression.EX_SYM,name])
-      ret=self.__globVar__.symDict.get(name,noGlobStore=True)
+      symDict=self.__globVar__.symDict
+      ret=symDict.get(name,noGlobStore=True)
       if ret is None:
          self.__size__= None
       else:
          self.__size__=ret[2]
 #
+#     the size of a symbol, which is not in the local symbol dictionary,
+#     may change if the symbol is defined later
+#
+      if not symDict.isLocal(name):
+         self.__cacheable__=False
+#
 #  opcode
 #
    def genOp(self,op):
@@ -98,6 +127,54 @@ class clsExpression(object):
          self.__size__=self.__bc__[-2][1]
       else:
          self.__size__= None
+      self.fold()
+#
+#  constant folding: replace the operation just generated by a number, if
+#  all operands are numbers. Operations which fail (division by zero, value
+#  too large for the size) are not folded, the error is reported by
+#  execute. The size of the expression is not changed by folding
+#
+   def fold(self):
+      bc=self.__bc__
+      op=bc[-1][1]
+      if op==clsExpression.OP_CHS:
+         if len(bc)<2 or bc[-2][0]!=clsExpression.EX_NUM:
+            return
+         value= -bc[-2][1]
+         del bc[-1]
+      else:
+         if len(bc)<3 or bc[-2][0]!=clsExpression.EX_NUM or \
+            bc[-3][0]!=clsExpression.EX_NUM:
+            return
+         left=bc[-3][1]
+         right=bc[-2][1]
+         if op==clsExpression.OP_PLUS:
+            value=left+right
+         elif op==clsExpression.OP_MINUS:
+            value=left-right
+         elif op==clsExpression.OP_MULT:
+            value=left*right
+         elif op==clsExpression.OP_DIV:
+            if right==0:
+               return
+            value=left//right
+         elif op==clsExpression.OP_MOD:
+            if right==0:
+               return
+            value=left%right
+         elif op==clsExpression.OP_AND:
+            value=left & right
+         elif op==clsExpression.OP_OR:
+            value=left | right
+         elif op==clsExpression.OP_RESIZE:
+            value=self.resize(left,right)
+            if value is None:
+               return
+         else:
+            return
+         del bc[-2:]
+      bc[-1]=[clsExpression.EX_NUM,value]
+      self.__folded__=True
 #
 #  returns the smallest number of bytes a integer value will occupy
 #  Note: for negative number an additional bit will be needed for the 
@@ -122,13 +199,10 @@ class clsExpression(object):
    def makeBytes(self,value,size=None):
       if size is None:
          return None
-      else:
-         nBytes=size
-      b= [0]* nBytes
-      for i in range(0,nBytes):
-            b[i]= value & 0xFF
-            value=value>>8
-      return b
+#
+#     masking yields the 2s complement of negative numbers
+#
+      return list((value & ((1 << (size*8))-1)).to_bytes(size,"little"))
 
 #
 #  resize a value to a given size
@@ -215,7 +289,8 @@ class clsExpression(object):
          self.getch()
          if " )\n".find(self.__GCH__)>=0:
             break
-      if parseFunc.parseLabel(symName,self.__globVar__.symNamLen) is None:
+      if self.__globVar__.dialect.parseLabel(symName, \
+         self.__globVar__.symNamLen) is None:
          self.addError(MESSAGE.E_ILL_LABELOP)
          return 
       self.genSymbol(symName)
@@ -285,24 +360,24 @@ class clsExpression(object):
 #
    def bool(self):
       first=True
-      operator=clsExpression.OP_NONE
+      op=clsExpression.OP_NONE
       done=False
       while not done:
          self.unary()
          if first:
             first=False
          else:
-            if operator== clsExpression.OP_AND:
-               self.genOp(operator)
-            elif operator== clsExpression.OP_OR:
-               self.genOp(operator)
+            if op== clsExpression.OP_AND:
+               self.genOp(op)
+            elif op== clsExpression.OP_OR:
+               self.genOp(op)
          done=True
          if self.__GCH__=="&":
-            operator= clsExpression.OP_AND
+            op= clsExpression.OP_AND
             done= False
             self.getch()
          if self.__GCH__=="|":
-            operator= clsExpression.OP_OR
+            op= clsExpression.OP_OR
             done= False
             self.getch()
 
@@ -312,7 +387,7 @@ class clsExpression(object):
 #
    def factor(self):
 
-      operator=clsExpression.OP_NONE
+      op=clsExpression.OP_NONE
       first=True
       done=False
       while not done:
@@ -320,23 +395,23 @@ class clsExpression(object):
          if first:
             first=False
          else:
-            if operator== clsExpression.OP_MULT:
-               self.genOp(operator)
-            elif operator== clsExpression.OP_DIV:
-               self.genOp(operator)
-            elif operator == clsExpression.OP_MOD:
-               self.genOp(operator)
+            if op== clsExpression.OP_MULT:
+               self.genOp(op)
+            elif op== clsExpression.OP_DIV:
+               self.genOp(op)
+            elif op == clsExpression.OP_MOD:
+               self.genOp(op)
          done=True
          if self.__GCH__=="*":
-            operator=clsExpression.OP_MULT
+            op=clsExpression.OP_MULT
             done= False
             self.getch()
          if self.__GCH__=="/":
-            operator=clsExpression.OP_DIV
+            op=clsExpression.OP_DIV
             done= False
             self.getch()
          if self.__GCH__=="%":
-            operator=clsExpression.OP_MOD
+            op=clsExpression.OP_MOD
             done= False
             self.getch()
 
@@ -346,7 +421,7 @@ class clsExpression(object):
 #
    def term(self):
 
-      operator=clsExpression.OP_NONE
+      op=clsExpression.OP_NONE
       first=True
       done=False
       while not done:
@@ -354,17 +429,17 @@ class clsExpression(object):
          if first:
             first=False
          else:
-            if operator== clsExpression.OP_PLUS:
-               self.genOp(operator)
-            elif operator== clsExpression.OP_MINUS:
-               self.genOp(operator)
+            if op== clsExpression.OP_PLUS:
+               self.genOp(op)
+            elif op== clsExpression.OP_MINUS:
+               self.genOp(op)
          done=True
          if self.__GCH__=="+":
-            operator=clsExpression.OP_PLUS
+            op=clsExpression.OP_PLUS
             done= False
             self.getch()
          if self.__GCH__=="-":
-            operator=clsExpression.OP_MINUS
+            op=clsExpression.OP_MINUS
             done= False
             self.getch()
 
@@ -376,8 +451,22 @@ class clsExpression(object):
 #  indicatedSize: force size of result to this size if not None
 #  sizeRequired : True if the size of the expression must be determined by
 #                 parsing
+#
+#  Expressions without errors are stored in the expression cache of the
+#  assembly, unless they contain the location counter or a symbol which
+#  is not yet defined in the local symbol dictionary
 #
    def parse(self,expr,indicatedSize=None,sizeRequired=False):
+      key=(expr,indicatedSize,sizeRequired)
+      cache=self.__globVar__.expressionCache
+      if key in cache:
+         parsedExpression,folded=cache[key]
+         counters=self.__globVar__.counters
+         counters["cachedExpressions"]+=1
+         if folded:
+            counters["foldedExpressions"]+=1
+         self.__errors__= []
+         return parsedExpression,self.__errors__
       self.__exprString__=expr
       self.__getchCount__=-1
       self.__GCH__=""
@@ -385,6 +474,8 @@ class clsExpression(object):
       self.__size__= None
       self.__bc__= []
       self.__lastNumber__=None
+      self.__folded__=False
+      self.__cacheable__=True
       self.getch()
 #
 #     parse expression
@@ -412,73 +503,132 @@ class clsExpression(object):
             self.addError(MESSAGE.E_UNSIZEDEXPRESSION)
  
       if len(self.__errors__)==0:
-         parsedExpression=clsParsedExpression(self.__bc__,self.__size__)
+         parsedExpression=clsParsedExpression(self.__bc__,self.__size__, \
+            self.compile(self.__bc__))
+         if self.__folded__:
+            self.__globVar__.counters["foldedExpressions"]+=1
+         if self.__cacheable__:
+            cache[key]=(parsedExpression,self.__folded__)
       else:
          parsedExpression=clsInvalidOperand()
       return parsedExpression,self.__errors__
 #
-#  execute the byte code of an expression
+#  compile the byte code of an expression into a function, which takes the
+#  slot lookup function of the symbol dictionary and the line info of the
+#  symbol reference as arguments and returns the value of the expression.
+#  Symbols are bound to slots of the symbol dictionary.
+#  The operands are evaluated in the order of the byte code, errors raise
+#  clsExpressionError. Each stack item is a tuple of the function of an
+#  operand, its value if it is a number and its slot if it is a symbol.
+#  Number and symbol operands of binary operations are inlined.
+#
+   def compile(self,byteCode):
+      symDict=self.__globVar__.symDict
+      stack=[]
+      for typ,op in byteCode:
+         if typ==clsExpression.EX_NUM:
+            stack.append((clsExpression.compileNumber(op),op,None))
+         elif typ==clsExpression.EX_SYM:
+            slot=symDict.bind(op)
+            stack.append((clsExpression.compileSymbol(slot),None,slot))
+         elif op==clsExpression.OP_CHS:
+            stack[-1]=(clsExpression.compileNegate(stack[-1][0]),None,None)
+         else:
+            right=stack.pop()
+            stack[-1]=(self.compileOperation(op,stack[-1],right),None,None)
+      return stack[0][0]
+
+   @staticmethod
+   def compileNumber(value):
+      def evaluate(get,lineInfo):
+         return value
+      return evaluate
+
+   @staticmethod
+   def compileSymbol(slot):
+      def evaluate(get,lineInfo):
+         ret=get(slot,lineInfo)
+         if ret is None:
+            raise clsExpressionError(MESSAGE.E_SYMNOTFOUND)
+         return ret[1]
+      return evaluate
+
+   @staticmethod
+   def compileNegate(operand):
+      def evaluate(get,lineInfo):
+         return -operand(get,lineInfo)
+      return evaluate
+#
+#  compile a binary operation of two stack items
+#
+   def compileOperation(self,op,leftItem,rightItem):
+      left,_,leftSlot=leftItem
+      right,rightValue,rightSlot=rightItem
+      if op==clsExpression.OP_RESIZE:
+         resize=self.resize
+         if rightValue is not None:
+            def evaluate(get,lineInfo):
+               value=resize(left(get,lineInfo),rightValue)
+               if value is None:
+                  raise clsExpressionError(MESSAGE.E_VALTOOLARGE)
+               return value
+         else:
+            def evaluate(get,lineInfo):
+               value=resize(left(get,lineInfo),right(get,lineInfo))
+               if value is None:
+                  raise clsExpressionError(MESSAGE.E_VALTOOLARGE)
+               return value
+      elif op==clsExpression.OP_DIV or op==clsExpression.OP_MOD:
+         func=operator.floordiv if op==clsExpression.OP_DIV else operator.mod
+         def evaluate(get,lineInfo):
+            leftValue=left(get,lineInfo)
+            divisor=right(get,lineInfo)
+            if divisor==0:
+               raise clsExpressionError(MESSAGE.E_DIVBYZERO)
+            return func(leftValue,divisor)
+      else:
+         func=clsExpression.BINARY_FUNCTIONS[op]
+#
+#        symbol and number, e.g. (LABEL)+2
+#
+         if leftSlot is not None and rightValue is not None:
+            def evaluate(get,lineInfo):
+               ret=get(leftSlot,lineInfo)
+               if ret is None:
+                  raise clsExpressionError(MESSAGE.E_SYMNOTFOUND)
+               return func(ret[1],rightValue)
+#
+#        two symbols, e.g. (END)-(START)
+#
+         elif leftSlot is not None and rightSlot is not None:
+            def evaluate(get,lineInfo):
+               ret=get(leftSlot,lineInfo)
+               if ret is None:
+                  raise clsExpressionError(MESSAGE.E_SYMNOTFOUND)
+               leftValue=ret[1]
+               ret=get(rightSlot,lineInfo)
+               if ret is None:
+                  raise clsExpressionError(MESSAGE.E_SYMNOTFOUND)
+               return func(leftValue,ret[1])
+         elif rightValue is not None:
+            def evaluate(get,lineInfo):
+               return func(left(get,lineInfo),rightValue)
+         else:
+            def evaluate(get,lineInfo):
+               return func(left(get,lineInfo),right(get,lineInfo))
+      return evaluate
+#
+#  execute the compiled expression
 #
    def execute(self,parsedExpression,lineInfo):
-
-      stack=[]
       self.__errors__= []
-      size=parsedExpression.size
-
-
-      for typ,op in parsedExpression.byteCode:
-         if typ== clsExpression.EX_NUM:
-            stack.append(op)
-         elif typ==clsExpression.EX_SYM:
-            ret=self.__globVar__.symDict.get(op,lineInfo)
-            if ret is None:
-               self.addError(MESSAGE.E_SYMNOTFOUND)
-               return None, None, self.__errors__
-            value=ret[1]
-            stack.append(value)
-         elif typ==clsExpression.EX_OP:
-            if op==clsExpression.OP_PLUS:
-               stack[-2]+=stack[-1]
-               stack.pop()
-            elif op==clsExpression.OP_MINUS:
-               stack[-2]-=stack[-1]
-               stack.pop()
-            elif op==clsExpression.OP_MULT:
-               stack[-2]*=stack[-1]
-               stack.pop()
-            elif op==clsExpression.OP_DIV:
-               if stack[-1]==0:
-                  self.addError(MESSAGE.E_DIVBYZERO)
-                  return None, None, self.__errors__
-               stack[-2]//=stack[-1]
-               stack.pop()
-            elif op==clsExpression.OP_MOD:
-               if stack[-1]==0:
-                  self.addError(MESSAGE.E_DIVBYZERO)
-                  return None, None, self.__errors__
-               stack[-2]%=stack[-1]
-               stack.pop()
-            elif op==clsExpression.OP_AND:
-               stack[-2]&=stack[-1]
-               stack.pop()
-            elif op==clsExpression.OP_OR:
-               stack[-2]|=stack[-1]
-               stack.pop()
-            elif op==clsExpression.OP_CHS:
-               stack[-1]=-stack[-1]
-#           elif op==clsExpression.OP_NOT:
-#              stack[-1]= ~ stack[-1]
-            elif op==clsExpression.OP_RESIZE:
-               value=self.resize(stack[-2],stack[-1])
-               if value== None:
-                  self.addError(MESSAGE.E_VALTOOLARGE)
-                  return None, None,self.__errors__
-               else:
-                  stack[-2]=value
-                  stack.pop()
- 
-      result=stack [0]
-      byteResult=self.makeBytes(result,size)
+      try:
+         result=parsedExpression.evaluate(self.__globVar__.symDict.getSlot, \
+            lineInfo)
+      except clsExpressionError as e:
+         self.addError(e.msgno)
+         return None, None, self.__errors__
+      byteResult=self.makeBytes(result,parsedExpression.size)
       return result,byteResult,self.__errors__
 
    def immediate(self,expression,indicatedSize,lineInfo):
@@ -658,7 +808,7 @@ class clsParser(clsParserBase):
 #
       isAddr=False
       indicatedSize=None
-      if self.__scannedOpcode__.string=="ADDR":
+      if self.__scannedOpcode__=="ADDR":
          isAddr=True
          indicatedSize=2
       SymDict=self.__globVar__.symDict
@@ -666,8 +816,8 @@ class clsParser(clsParserBase):
          self.addError(MESSAGE.E_MISSING_LABEL)
          return []
 
-      label=self.__scannedLabel__.string
-      opstring= self.__scannedOperand__[0].string
+      label=self.__scannedLabel__
+      opstring= self.__scannedOperand__[0]
 #
 #     evaluate expression immediately
 #
@@ -706,7 +856,7 @@ class clsParser(clsParserBase):
 #  Parse ORG pseudoop
 #
    def pOrg(self):
-      opstring= self.__scannedOperand__[0].string
+      opstring= self.__scannedOperand__[0]
       result,byteResult,errors=self.__expression__.immediate(opstring,2, \
           self.__lineInfo__)
       if result is not None:
@@ -721,7 +871,7 @@ class clsParser(clsParserBase):
 #  parse DEF, VAL
 #
    def pDef(self):
-     if self.__scannedOpcode__.string== "DEF":
+     if self.__scannedOpcode__== "DEF":
         self.__opcodeLen__=2
         return [self.parseSingleExpression(0,2)]
      else:
@@ -750,12 +900,12 @@ class clsParser(clsParserBase):
 #
 #     Invalidate Arp, Drp context
 #
-      if self.__scannedOpcode__.string!="JSBN":
+      if self.__scannedOpcode__!="JSBN":
         self.__globVar__.lastStmtWasJSB=True
 #
 #     Determine mode
 #
-      if self.__scannedOperand__[0].string[0]=="=":
+      if self.__scannedOperand__[0][0]=="=":
 #
 #        JSB literal direct
 #
@@ -800,12 +950,12 @@ class clsParser(clsParserBase):
 #     and parse opcodes
 #
       if len(self.__opcode__)==3:       # ADB, ADM, SBB, SBM, CMB, CMM, ANM
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_IMMEDIATE
-            self.__scannedOperand__[1].string= \
-                 self.__scannedOperand__[1].string[1:]
+            self.__scannedOperand__[1]= \
+                 self.__scannedOperand__[1][1:]
             if byteMode== clsParserInfo.BM_SINGLEBYTE:
-               if len(self.__scannedOperand__[1].string) > 0:
+               if len(self.__scannedOperand__[1]) > 0:
                   self.__opcodeLen__+= 1
                   parsedOperand.append(self.parseSingleExpression(1,1))
                else:
@@ -834,10 +984,10 @@ class clsParser(clsParserBase):
                parsedOperand.append(self.parseAr())
       else:                            # ADBD, ADMD, SBBD, ANMD
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_DIRECT
-            self.__scannedOperand__[1].string= \
-                 self.__scannedOperand__[1].string[1:]
+            self.__scannedOperand__[1]= \
+                 self.__scannedOperand__[1][1:]
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=2:
                self.addError(MESSAGE.E_ILL_NUMOPERANDS)
@@ -874,12 +1024,12 @@ class clsParser(clsParserBase):
 #
       if len(self.__opcode__)==3:       # LDB, STB, LDM, STM
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_IMMEDIATE
-            self.__scannedOperand__[1].string= \
-                 self.__scannedOperand__[1].string[1:]
+            self.__scannedOperand__[1]= \
+                 self.__scannedOperand__[1][1:]
             if byteMode== clsParserInfo.BM_SINGLEBYTE:
-               if len(self.__scannedOperand__[1].string) > 0:
+               if len(self.__scannedOperand__[1]) > 0:
                  self.__opcodeLen__+= 1
                  parsedOperand.append(self.parseSingleExpression(1,1))
                else:
@@ -899,7 +1049,7 @@ class clsParser(clsParserBase):
                   self.__opcodeLen__+= opLen
                   parsedOperand.extend(parsedExpressions)
 
-         elif self.__scannedOperand__[1].string[0] in "xX":
+         elif self.__scannedOperand__[1][0] in "xX":
             self.addError(MESSAGE.E_ILLADDRESSMODE)
 
          else:
@@ -911,17 +1061,17 @@ class clsParser(clsParserBase):
 
       elif self.__opcode__[-1]=="D":         # LDBD, STBD, LDMD, STMD
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_DIRECT
-            self.__scannedOperand__[1].string= \
-                 self.__scannedOperand__[1].string[1:]
+            self.__scannedOperand__[1]= \
+                 self.__scannedOperand__[1][1:]
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=2:
                self.addError(MESSAGE.E_ILL_NUMOPERANDS)
             else:
                parsedOperand.append(self.parseSingleExpression(1,2))
 
-         elif self.__scannedOperand__[1].string[0] in "xX":
+         elif self.__scannedOperand__[1][0] in "xX":
             self.__addressMode__=clsParserInfo.AM_INDEX_DIRECT
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=3:
@@ -939,17 +1089,17 @@ class clsParser(clsParserBase):
 
       elif self.__opcode__[-1]=="I":       # LDBI, STBI, LDMI, STMI
 
-         if self.__scannedOperand__[1].string[0]== "=":
+         if self.__scannedOperand__[1][0]== "=":
             self.__addressMode__=clsParserInfo.AM_LITERAL_INDIRECT
-            self.__scannedOperand__[1].string= \
-                 self.__scannedOperand__[1].string[1:]
+            self.__scannedOperand__[1]= \
+                 self.__scannedOperand__[1][1:]
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=2:
                self.addError(MESSAGE.E_ILL_NUMOPERANDS)
             else:
                parsedOperand.append(self.parseSingleExpression(1,2))
 
-         elif self.__scannedOperand__[1].string[0] in "xX":
+         elif self.__scannedOperand__[1][0] in "xX":
             self.__addressMode__=clsParserInfo.AM_INDEX_INDIRECT
             self.__opcodeLen__+= 2
             if len(self.__scannedOperand__)!=3:
@@ -993,15 +1143,15 @@ class clsCodeGenerator(clsCodeGeneratorBase):
 #
 # This is the top level class for the entire assembler
 #
-class clsNcas(object):
+class clsNcas(clsAssemblerBase):
 
    def __init__(self):
        super().__init__()
 #
-#  extend the OPCODES dictionary with the ncas specific OPS
+#  ncas specific OPS which extend the OPCODES dictionary
 #
    def extendOpcodes(self):
-      OPCODES.extendDict( {
+      return {
 #
 #  ncas specific ops
 #
@@ -1151,7 +1301,17 @@ class clsNcas(object):
 #     "NOP" : ["pNoPer","gdirect",0o235,0,0,False,False,False],
       "NOP" : ["pNoPer","gdirect",0o220,0,0,False,False,False], #  Karma NOP
       "NOP1" : ["pNoPer","gdirect",0o336,0,0,False,False,False], # see Series 80 wiki
-      })
+      }
+#
+#  Create the dialect object of ncas
+#
+   def createDialect(self):
+       return clsDialect("NCAS",self.extendOpcodes(), \
+          parseFunc.NCAS_DELIMITER, parseFunc.NCAS_LABELMATCHSTRING, \
+          "*",";","'`^"+'"', \
+          { clsSymDict.SYM_DAD: "ADR", \
+            clsSymDict.SYM_EQU: "EQU", \
+            clsSymDict.SYM_LCL: "LCL" })
 
    def addTimeDateSyms(self,isRegressiontest):
 #
@@ -1186,9 +1346,29 @@ class clsNcas(object):
       return
 
 #
+#  Create symbol table object and add time and date global symbols
+#
+   def createSymDict(self):
+       symDict=super().createSymDict()
+       self.__globVar__.symDict=symDict
+       self.addTimeDateSyms(self.__globVar__.isRegressionTest)
+       return symDict
+#
+#  Create parser and code generator objects
+#
+   def createParser(self,infile):
+       return clsParser(self.__globVar__,infile)
+
+   def createCodeGenerator(self):
+       return clsCodeGenerator(self.__globVar__)
+#
 #  Assemble method. The method takes the values of the command line
 #  switches and parameters. This method may be called multiple times
-#  with different parameters.
+#  with different parameters. If buildCache is a clsBuildCache object,
+#  the results are taken from or stored in the build cache. If depFileName
+#  or depJsonFileName are specified, a make compatible or a JSON dependency
+#  file is written. If profiler is a clsProfiler object, the phases of the 
+#  assembly are timed.
 #  Returns:
 #     False:  everything o.k.
 #     True:   errors in assembly
@@ -1197,154 +1377,40 @@ class clsNcas(object):
    def assemble(self,sourceFileName,binFileName="",listFileName="", \
        referenceOpt=1, pageSize=66, pageWidth=80, \
        extendedChecks=False,useOct=False, definedFlags=[], \
-       globalSymbolFile="none"):
-#
-#      initialize opcode
-#
-       self.extendOpcodes()
-#
-#      initialize error condition
-#
-       hasError=False
-#
-#      Create global variables data object
-#
-       self.__globVar__=clsGlobVar()
-       self.__globVar__.useHex= not useOct
-       self.__sourceFileName__= sourceFileName
-       self.__globalSymbolFile__= globalSymbolFile
-       self.__globVar__.progName="NCAS"
-#
-#      initialize basic parser functions
-#
-       parseFunc.DELIMITER="'"+'"'
-       parseFunc.LABELMATCHSTRING=\
-          "[A-Za-z][A-Za-z0-9_$\+\-\.#/?\(\!\&)=:<>\|@*^]{0,"
-#
-#      Build file name of object file if not specified
-#
-       if binFileName=="":
-          self.__binFileName__= \
-               Path(self.__sourceFileName__).with_suffix(".bin").name
-       else:
-          self.__binFileName__=binFileName
-       self.__listFileName__= listFileName
-       self.__referenceOpt__= referenceOpt
-       self.__pageSize__= pageSize
-       self.__pageWidth__= pageWidth
-       self.__extendedChecks__= extendedChecks
-       self.__symNamLen__= 32
-#
-#      Check if we run in regression test mode
-#
-       if os.getenv("CAPASMREGRESSIONTEST"):
-          self.__globVar__.isRegressionTest=True
-#
-#      Create symbol table object
-#
-       self.__globVar__.symDict=clsSymDict( self.__extendedChecks__, \
-            self.__globalSymbolFile__, \
-            { clsSymDict.SYM_DAD: "ADR", \
-              clsSymDict.SYM_EQU: "EQU", \
-              clsSymDict.SYM_LCL: "LCL" })
-#
-#      add time and date global symbols
-#
-       self.addTimeDateSyms(self.__globVar__.isRegressionTest)
-#
-#      Create conditional assembly object
-#
-       self.__globVar__.condAssembly=clsConditionalAssembly(definedFlags)
-#
-#      get directory of source file
-#
-       self.__globVar__.sourceFileDirectory=\
-          str(Path(self.__sourceFileName__).parent)
-#
-#      Check extended checks mode
-#
-       if self.__extendedChecks__:
-          self.__globVar__.allowHashRLiteral=False
-#
-#      Set symbol name length
-#
-       self.__globVar__.symNamLen=self.__symNamLen__
-#
-#      Pass 1: scan and parse lines, accumulate results in the
-#      pass1Info list
-#
-       pass1Info=[]
-       infile=clsSourceReader(self.__sourceFileName__)
-       lineScanner=clsLineScanner("*",";","'`^"+'"')
-       lineParser=clsParser(self.__globVar__,infile)
-
-       while not self.__globVar__.isFin:
-          line=infile.read()
-          if line is None:
-             if pass1Info:
-                pass1Info[-1].messages.append(MESSAGE.E_MISSING_FIN)
-                break
-             else:
-                MESSAGE.fatalError("Empty source file")
-#
-#         Scan line
-#
-          scannedLine=lineScanner.scanLine(line)
-#
-#         Parse line
-#
-          parsedLine=lineParser.parseLine(scannedLine,line)
-          pass1Info.append(parsedLine)
-#
-#         Increment PC and codeLen with length of instructions
-#
-          self.__globVar__.PC+=parsedLine.opcodeLen
-          self.__globVar__.codeLen+=parsedLine.opcodeLen
-
-       infile=None
-       lineScanner=None
-       lineParser=None
-#
-#      Passe 2: process content of pass1Info list, generate code,
-#      write code to binary output file and output information to 
-#      the list file
-#
-       objWriter=clsObjWriter(self.__binFileName__)
-       listWriter=clsListWriter(self.__globVar__,self.__listFileName__, \
-                  self.__pageSize__, self.__pageWidth__)
-       codeGenerator=clsCodeGenerator(self.__globVar__)
-
-       for parsedLine in pass1Info:
-#
-#         Generate code
-#
-          codeInfo=codeGenerator.generate(parsedLine)
-#
-#         Write code
-#
-          objWriter.writeCode(codeInfo,parsedLine)
-#
-#         Write listing
-#
-          listWriter.writeLine(parsedLine,codeInfo)
-
-       codeGenerator=None
-       objWriter=None
-
-       listWriter.writeSymbols(self.__referenceOpt__)
-       listWriter.writeStatistics()
-       listWriter=None
-#
-#      delete objectfile if any errors
+       globalSymbolFile="none", buildCache=None, depFileName="", \
+       depJsonFileName="", profiler=None):
+       self.initAssembly(sourceFileName,referenceOpt,pageSize,pageWidth, \
+          extendedChecks,32,not useOct,definedFlags,globalSymbolFile)
+       return self.assembleFile(sourceFileName,binFileName,listFileName, \
+          buildCache,depFileName,depJsonFileName,profiler)
+#
+#  Check method. Check a source file for errors without writing an object
+#  or a list file. See clsAssembler.check for details.
+#  Returns a clsAssemblyResult object without code
+#  Raises capasmError on I/O error
 #
-       if self.__globVar__.errorCount>0:
-          os.remove(self.__binFileName__)
-          hasError=True
-       self.__globVar__=None
+   def check(self,sourceFileName, \
+       referenceOpt=1, pageSize=66, pageWidth=80, \
+       extendedChecks=False,useOct=False, definedFlags=[], \
+       globalSymbolFile="none"):
+       self.initAssembly(sourceFileName,referenceOpt,pageSize,pageWidth, \
+          extendedChecks,32,not useOct,definedFlags,globalSymbolFile)
+       return self.checkFile(sourceFileName)
 #
-#      return error condition
+#  Assemble source code which is passed as string without any file I/O 
+#  and terminal output. See clsAssembler.assembleSource for details.
+#  Returns a clsAssemblyResult object
+#  Raises capasmError on fatal errors
 #
-       return hasError
+   def assembleSource(self,sourceText,sourceFileName="source.asm", \
+       includeResolver=None,listing=False, \
+       referenceOpt=1, pageSize=66, pageWidth=80, \
+       extendedChecks=False,useOct=False, definedFlags=[], \
+       globalSymbolFile="none"):
+       self.initAssembly(sourceFileName,referenceOpt,pageSize,pageWidth, \
+          extendedChecks,32,not useOct,definedFlags,globalSymbolFile)
+       return self.assembleText(sourceText,sourceFileName,includeResolver, \
+          listing)
 #
 # custom arg checks ----------------------------------------------------
 #
@@ -1383,7 +1449,8 @@ def ncas():             # pragma: no cover
    "See https://github.com/bug400/capasm for details. "+CAPASM_VERSION)
    
    
-   argparser.add_argument("sourcefile",help="source code file (required)")
+   argparser.add_argument("sourcefile",nargs="*", \
+      help="source code file (required). Multiple files or file name patterns assemble in batch mode")
    argparser.add_argument("-b","--binfile",\
       help="binary object code file (default: sourcefilename with suffix .bin",\
       default="")
@@ -1404,19 +1471,97 @@ def ncas():             # pragma: no cover
       help="define conditional flag with value True")
    argparser.add_argument("-o","--oct",help="use octal output", \
       action='store_true')
+   argparser.add_argument("-j","--jobs",type=int,default=1,\
+      help="number of parallel assembler processes in batch mode, 0: number of CPUs (default: 1)")
+   argparser.add_argument("--syntax-only",action='store_true', \
+      help="check source files only, do not write object or list files")
+   argparser.add_argument("--diagformat",choices=["gcc","json"], \
+      default="gcc", help="format of the diagnostics in syntax check mode: gcc: file:line: severity: message, json: JSON list (default: gcc)")
+   argparser.add_argument("--profile",action='store_true', \
+      help="print wall and cpu time of the assembler phases")
+   argparser.add_argument("--profilejson",default="", \
+      help="write wall and cpu time of the assembler phases to a JSON file")
+   argparser.add_argument("--depfile",default="", \
+      help="write make compatible dependency file (default: no dependency file)")
+   argparser.add_argument("--depjson",default="", \
+      help="write dependency file in JSON format (default: no dependency file)")
+   argparser.add_argument("--cachedir", \
+      default=os.getenv("CAPASM_CACHEDIR",""), \
+      help="directory of the build cache (default: $CAPASM_CACHEDIR, no cache if not set)")
+   argparser.add_argument("--cachemaxsize",type=int,default=100, \
+      help="maximum size of the build cache in MB (default: 100)")
+   argparser.add_argument("--cachemaxage",type=int,default=30, \
+      help="remove build cache entries not used for this number of days (default: 30)")
+   argparser.add_argument("--cachestats",action='store_true', \
+      help="print build cache statistics and exit")
+   argparser.add_argument("--cacheclear",action='store_true', \
+      help="remove all entries from the build cache and exit")
    args= argparser.parse_args()
 #
+#  The build support is only needed if the command line is valid
+#
+   from .capbuild import clsBuildCache, clsBatchAssembler, \
+      expandSourceFiles, syntaxCheck, clsProfiler
+   buildCache=None
+   if args.cachedir!="":
+      buildCache=clsBuildCache(args.cachedir,args.cachemaxsize, \
+         args.cachemaxage)
+   if args.cachestats or args.cacheclear:
+      if buildCache is None:
+         argparser.error("no build cache directory specified")
+      if args.cacheclear:
+         buildCache.clear()
+      if args.cachestats:
+         buildCache.printStatistics()
+      return
+   if not args.sourcefile:
+      argparser.error("the following arguments are required: sourcefile")
+   sourceFiles=expandSourceFiles(args.sourcefile)
+   if len(sourceFiles) > 1 and (args.binfile!="" or args.listfile!="" or \
+      args.depfile!="" or args.depjson!="" or args.profile or \
+      args.profilejson!=""):
+      argparser.error("-b, -l, --depfile, --depjson, --profile and --profilejson are not allowed with more than one source file")
+#
+#  Options of the assemble and check methods
+#
+   options= { "referenceOpt": args.reference, \
+              "pageSize": args.pagesize, "pageWidth": args.width, \
+              "extendedChecks": args.check, \
+              "useOct": args.oct, \
+              "definedFlags": args.define, \
+              "globalSymbolFile": args.globalsymbolfile }
+#
+#  Syntax check mode
+#
+   if args.syntax_only:
+      if syntaxCheck(clsNcas,sourceFiles,options,args.diagformat):
+         sys.exit(1)
+      return
+   options["buildCache"]=buildCache
+#
+#  Batch mode: assemble all files with a pool of worker processes
+#
+   if len(sourceFiles) > 1:
+      batchAssembler=clsBatchAssembler(clsNcas,args.jobs)
+      if batchAssembler.run(sourceFiles,options):
+         sys.exit(1)
+      return
+#
 #  Create assembler object and run it
 #
    ncas= clsNcas()
+   profiler=None
+   if args.profile or args.profilejson!="":
+      profiler=clsProfiler()
    try:
-      ret=ncas.assemble(args.sourcefile,listFileName=args.listfile,\
-           binFileName=args.binfile, referenceOpt=args.reference, \
-           pageSize=args.pagesize,pageWidth=args.width, \
-           extendedChecks=args.check, \
-           useOct=args.oct,\
-           definedFlags=args.define, \
-           globalSymbolFile=args.globalsymbolfile)
+      ret=ncas.assemble(sourceFiles[0],listFileName=args.listfile,\
+           binFileName=args.binfile, depFileName=args.depfile, \
+           depJsonFileName=args.depjson, profiler=profiler, **options)
+      if profiler is not None:
+         if args.profile:
+            profiler.printReport()
+         if args.profilejson!="":
+            profiler.writeJson(args.profilejson)
    except capasmError as e:
       print(e.msg+" -- Assembler terminated")
       ret=True
@@ -60,13 +60,20 @@ setup(
     # You can just specify the packages manually here if your project is
     # simple. Or you can use find_packages().
     packages=find_packages(exclude=['misc', 'debian', 'tests*']),
+    package_data={'capasm': ['*.gst']},
     entry_points={
-       'console_scripts': [ 'capasm= capasm:capasm',
-                            'ncas= capasm:ncas',
-                            'caplex= capasm:caplex',
-                            'capglo= capasm:capglo',
-                            'caprom= capasm:caprom',
-                            'capconv= capasm:capconv',
-                            'caplif= capasm:caplif' ] ,
+       'console_scripts': [ 'capasm= capasm.assembler:capasm',
+                            'ncas= capasm.ncas:ncas',
+                            'caplex= capasm.captools:caplex',
+                            'capglo= capasm.captools:capglo',
+                            'caprom= capasm.captools:caprom',
+                            'capconv= capasm.captools:capconv',
+                            'caplif= capasm.captools:caplif',
+                            'capbench= capasm.capbench:capbench',
+                            'capasmc= capasm.capserver:capasmc',
+                            'ncasc= capasm.capserver:ncasc',
+                            'caplexc= capasm.capserver:caplexc',
+                            'caplifc= capasm.capserver:caplifc',
+                            'capromc= capasm.capserver:capromc' ] ,
     }
 )
@@ -9,17 +9,20 @@
 #
 import sys
 import os
+import importlib
 PYTHON_REQUIRED_MAJOR=3
 PYTHON_REQUIRED_MINOR=6
 
-from capasm import capasm, caplif, caplex, capglo, caprom, capconv, ncas
-entryPointDict= { "capasm": capasm,
-                  "caplex": caplex,
-                  "caplif": caplif,
-                  "capglo": capglo,
-                  "caprom": caprom,
-                  "capconv":capconv,
-                  "ncas": ncas,
+#
+# module and function of the entry points (see the console scripts)
+#
+entryPointDict= { "capasm": ("capasm.assembler","capasm"),
+                  "caplex": ("capasm.captools","caplex"),
+                  "caplif": ("capasm.captools","caplif"),
+                  "capglo": ("capasm.captools","capglo"),
+                  "caprom": ("capasm.captools","caprom"),
+                  "capconv":("capasm.captools","capconv"),
+                  "ncas": ("capasm.ncas","ncas"),
                 }
 def usage():
    print("Usage:")
@@ -50,6 +53,7 @@ else:
    sys.argv=sys.argv[1:]
 #  try:
    if True:
-      entryPointDict[progName]()
+      moduleName,functionName=entryPointDict[progName]
+      getattr(importlib.import_module(moduleName),functionName)()
 #  except KeyError:
 #     usage()
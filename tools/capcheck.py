@@ -0,0 +1,640 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Equivalence checks of the CAPASM assemblers against the former
+# implementations. This script is not part of the installed package, run it
+# from the repository:
+#
+#   python3 tools/capcheck.py --scannercheck [SOURCEFILE ...]
+#   python3 tools/capcheck.py --micro -n 10000
+#
+# - a differential check of the line scanner against the character based
+#   reference scanner
+# - micro benchmarks which time single functions of the assemblers against
+#   the former implementations and check that the results are the same
+#
+# (c) 2020 Joachim Siebold
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place - Suite 330, Boston, MA  02111-1307, USA.
+#
+#--------------------------------------------------------------------------
+#
+import argparse,sys,os,re,json,time,random,platform,tempfile
+import importlib.util
+#
+# import capasm from this repository
+#
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import capasm
+from capasm.capcommon import capasmError, CAPASM_VERSION, clsLineScanner, \
+   clsToken, clsLabelValidator, parseFunc, MESSAGE, clsGlobVar, clsSymDict, \
+   clsGlobalSymbolTable
+from capasm.capbench import clsCapasmGenerator, clsNcasGenerator, \
+   compareResults, BENCHMARK_FORMAT_VERSION
+from capasm.assembler import clsAssembler
+from capasm.ncas import clsNcas, clsExpression
+
+#
+# Reference line scanner ---------------------------------------------------
+#
+# This is the former character based implementation of the line scanner.
+# It is used to check the regular expression based clsLineScanner.
+#
+class clsReferenceLineScanner(clsLineScanner):
+#
+#  Get one character, returns a tripel of [character, position, next character]
+#
+   def scanChar(self):
+      oldposition= self.__position__
+      oldch= self.__gch__
+      oldnxtch= self.__nxtChar__
+      if self.__gch__ != "":
+         self.__position__+=1
+         self.__gch__=self.__nxtChar__
+         if (self.__position__) >= len(self.__line__)-1:
+            self.__nxtChar__= ""
+         else:
+            self.__nxtChar__=self.__line__[self.__position__+1]
+      return [oldch, oldposition,oldnxtch]
+#
+#  Get Token, returns a token object
+#
+   def scanTok(self,termSyms=None):
+      while True:
+         char, pos, nxtChar=self.scanChar()
+         if char!=" ":
+            break
+      token=""
+      position= -1
+      termchar= ""
+      termString=" "
+      inString=False
+      if termSyms is not None:
+         termString+=termSyms
+         if char in termSyms:
+            return clsToken(char, pos, nxtChar)
+      while char!="":
+         if not inString and char in termString:
+               termchar= char
+               break
+         if char in self.__stringDelimiters__:
+            if not inString:
+               quote=char
+               inString=True
+            else:
+               if char==quote:
+                  inString=False
+         if len(token)==0:
+            position= pos
+         token+=char
+         char, pos, nxtChar=self.scanChar()
+      return clsToken(token, position, termchar)
+#
+#  Scan input line and return scanned line number, label, opcode and a list
+#  of operands. Missing items are None
+#
+   def scanLine(self,line):
+
+      scannedLineNumber=None
+      scannedLabel=None
+      scannedOpcode=None
+      scannedOperand=[]
+
+      self.__line__= line
+      self.__position__= -1
+      self.__gch__= ""
+      self.__nxtChar__= ""
+      if self.__line__!="":
+         self.__gch__=self.__line__[0]
+         self.__position__= 0
+      if len(line) > 1:
+         self.__nxtChar__= self.__line__[1]
+      tok=self.scanTok()
+      if tok.string=="":
+         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+      lineBegin=0
+      if tok.string[0] in "0123456789":
+         scannedLineNumber=tok
+         lineBegin=len(scannedLineNumber.string)+tok.position
+         tok=self.scanTok()
+      if tok.string=="":
+         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+      if tok.position <= lineBegin+2:
+         if tok.string[0] not in self.__commentLineChar__:
+            scannedLabel= tok
+            tok= self.scanTok()
+      if tok.string=="":
+         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+      if tok.string[0] in self.__commentLineChar__ \
+         or tok.string[0] in self.__commentTrailerChar__:
+         return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+      scannedOpcode= tok
+      scannedOpcode.string=scannedOpcode.string.upper()
+      tok= self.scanTok(",")
+      while True:
+         if tok.string=="":
+            break
+         if tok.string[0] in self.__commentTrailerChar__:
+            break
+         if tok.string!=",":
+            scannedOperand.append(tok)
+         tok= self.scanTok(",")
+      return [scannedLineNumber,scannedLabel,scannedOpcode,scannedOperand]
+
+#
+# Scanner differential check -----------------------------------------------
+#
+# Scan all lines of the source files with the line scanner and the reference
+# line scanner for both dialects and compare the results. Additional
+# lines cover blanks and terminating symbols within strings and
+# unterminated strings. Returns the number of differences.
+#
+SCANNER_DIALECTS= [ ("capasm", ("!","!",'"')),
+                    ("ncas",   ("*",";","'`^"+'"')) ]
+
+SCANNER_CHECK_LINES= [ "", " ", "1", "10 LBL", "LBL", " LBL LDB R32,=1",
+   'LBL  ASC "A, B"', "     ASC 'A, B' ; comment", 'X  BYT 1,,2 , 3,',
+   ' DRP !32 ! comment', "  LDM R40,=`A;`,^B ^", 'ASC "unterminated, x',
+   "ASC 'a\"b', \"c'd\"", "LBL\tLDB R32 ,R33", "  , ,", "  ,",
+   "* comment", "! comment", "100 * comment", "100 LBL * x", "   LBL JMP X",
+   ]
+
+def tokenTuple(tok):
+   if tok is None:
+      return None
+   return (tok.string,tok.position,tok.termChar)
+
+def scannedLineTuple(scannedLine):
+   return (tokenTuple(scannedLine[0]),tokenTuple(scannedLine[1]), \
+      tokenTuple(scannedLine[2]), \
+      tuple(tokenTuple(tok) for tok in scannedLine[3]))
+
+def checkScanner(sourceFiles,verbose=True):
+   lines=list(SCANNER_CHECK_LINES)
+   for sourceFile in sourceFiles:
+      try:
+         with open(sourceFile,"r") as f:
+            for line in f:
+               lines.append(line.strip("\r\n"))
+      except (OSError,UnicodeDecodeError):
+         raise capasmError("cannot read source file "+sourceFile)
+   numDifferences=0
+   for dialect,args in SCANNER_DIALECTS:
+      scanner=clsLineScanner(*args)
+      reference=clsReferenceLineScanner(*args)
+      startTime=time.perf_counter()
+      for line in lines:
+         scanner.scanLine(line)
+      scannerTime=time.perf_counter()-startTime
+      startTime=time.perf_counter()
+      for line in lines:
+         reference.scanLine(line)
+      referenceTime=time.perf_counter()-startTime
+      for line in lines:
+         result=scannedLineTuple(scanner.scanLine(line))
+         expected=scannedLineTuple(reference.scanLine(line))
+         if result!=expected:
+            numDifferences+=1
+            if verbose:
+               print("{:s}: difference in line {!r}".format(dialect,line))
+               print("   scanner:   {!r}".format(result))
+               print("   reference: {!r}".format(expected))
+      if verbose:
+         print("{:s}: {:d} lines, scanner {:.3f} ms, reference scanner {:.3f} ms".format(dialect,len(lines), \
+            scannerTime*1000.0,referenceTime*1000.0))
+   return numDifferences
+#
+# Get the bundled sample sources of the repository, if available
+#
+def getBundledSources():
+   packageDir=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+   sourceFiles=[]
+   for directory in ["lex75","lex85","ncas"]:
+      path=os.path.join(packageDir,directory)
+      if not os.path.isdir(path):
+         continue
+      for fileName in sorted(os.listdir(path)):
+         if fileName.endswith((".asm",".inc")):
+            sourceFiles.append(os.path.join(path,fileName))
+   return sourceFiles
+
+#
+# Reference number parser ---------------------------------------------------
+#
+# This is the former number parser with a chain of type attribute checks.
+# It is used by the micro benchmarks to check the results of the
+# table driven number parser.
+#
+def referenceParseNumber(string):
+   if string[-1] in "Dd":
+      return parseFunc.parseDecimal(string[:-1])
+   elif string[-1] in "Cc":
+      return parseFunc.parseBCD(string[:-1])
+   elif string[-1] in "Hh#":
+      return parseFunc.parseHex(string[:-1])
+   elif string[-1] in "Bb":
+      return parseFunc.parseBin(string[:-1])
+   elif string[-1] in "OoQq":
+      return parseFunc.parseOctal(string[:-1])
+   elif string[-1] in "Kk":
+      return parseFunc.parseKB(string[:-1])
+   elif string[-1] in "0123456789":
+      return parseFunc.parseOctal(string)
+   else:
+      return None
+
+NUMBER_CHECK_STRINGS= [ "0", "7", "8", "17", "177777", "C", "0C", "12C",
+   "1AC", "9c", "-1D", "-0D", "1_0D", " 12D", "12D ", "FFH", "0FFH", "12#",
+   "0fh", "101B", "102B", "1b", "17O", "17Q", "18o", "1K", "-1K", "2k",
+   "X", "1Z", "+7", "1.5D", "D", "H", "K", "0x1FH", "1E" ]
+
+MICRO_NUM_SYMBOLS=16
+MICRO_TABLE_LOADS=5
+MICRO_NUMBER_PATTERN=re.compile(r"(?<![\w$.#])[0-9][\w#]*")
+
+#
+# Load a Python global symbol table without the module cache, as the former
+# global symbol handling did for each assembly in a new process. Returns
+# the globalSymbols class
+#
+def loadGlobalSymbolModule(fileName):
+   spec=importlib.util.spec_from_file_location(".globals",fileName)
+   module=importlib.util.module_from_spec(spec)
+   spec.loader.exec_module(module)
+   return module.globalSymbols
+#
+# Reference expression interpreter -------------------------------------------
+#
+# This is the former stack interpreter of the byte code of ncas expressions.
+# It is used by the micro benchmarks to check the compiled expressions.
+#
+def referenceExecute(expression,symDict,parsedExpression,lineInfo):
+   cls=type(expression)
+   stack=[]
+   errors= []
+   size=parsedExpression.size
+   for typ,op in parsedExpression.byteCode:
+      if typ== cls.EX_NUM:
+         stack.append(op)
+      elif typ==cls.EX_SYM:
+         ret=symDict.get(op,lineInfo)
+         if ret is None:
+            errors.append(MESSAGE.E_SYMNOTFOUND)
+            return None, None, errors
+         stack.append(ret[1])
+      elif typ==cls.EX_OP:
+         if op==cls.OP_PLUS:
+            stack[-2]+=stack[-1]
+            stack.pop()
+         elif op==cls.OP_MINUS:
+            stack[-2]-=stack[-1]
+            stack.pop()
+         elif op==cls.OP_MULT:
+            stack[-2]*=stack[-1]
+            stack.pop()
+         elif op==cls.OP_DIV:
+            if stack[-1]==0:
+               errors.append(MESSAGE.E_DIVBYZERO)
+               return None, None, errors
+            stack[-2]//=stack[-1]
+            stack.pop()
+         elif op==cls.OP_MOD:
+            if stack[-1]==0:
+               errors.append(MESSAGE.E_DIVBYZERO)
+               return None, None, errors
+            stack[-2]%=stack[-1]
+            stack.pop()
+         elif op==cls.OP_AND:
+            stack[-2]&=stack[-1]
+            stack.pop()
+         elif op==cls.OP_OR:
+            stack[-2]|=stack[-1]
+            stack.pop()
+         elif op==cls.OP_CHS:
+            stack[-1]=-stack[-1]
+         elif op==cls.OP_RESIZE:
+            value=expression.resize(stack[-2],stack[-1])
+            if value== None:
+               errors.append(MESSAGE.E_VALTOOLARGE)
+               return None, None,errors
+            else:
+               stack[-2]=value
+               stack.pop()
+   result=stack [0]
+   if size is None:
+      return result,None,errors
+   value=result
+   byteResult= [0]* size
+   for i in range(0,size):
+      byteResult[i]= value & 0xFF
+      value=value>>8
+   return result,byteResult,errors
+
+#
+# Micro benchmarks ---------------------------------------------------------
+#
+# Micro benchmarks run in process and time a single function of the
+# assemblers with the operands of generated sources. The former
+# implementation is timed as reference, both implementations must return
+# the same results. The results have the format of the benchmark runner
+# results, the median is the time of the current implementation.
+#
+class clsMicroBenchmark(object):
+
+   def __init__(self,workDirectory,repeat=3,verbose=True):
+      super().__init__()
+      self.__workDirectory__=workDirectory
+      self.__repeat__=repeat
+      self.__verbose__=verbose
+      self.__results__=[]
+#
+#  Time a function which is called for each argument, returns the sorted
+#  times of all repetitions and the results of the last repetition. The
+#  setup function is called before each repetition, e.g. to clear caches
+#
+   def timeFunction(self,func,arguments,setup=None):
+      times=[]
+      for i in range(self.__repeat__):
+         if setup is not None:
+            setup()
+         startTime=time.perf_counter()
+         results=[func(arg) for arg in arguments]
+         times.append(time.perf_counter()-startTime)
+      times.sort()
+      return times,results
+#
+#  Run a micro benchmark and record the result. The current function is
+#  called with currentArguments, if they differ from the arguments of the
+#  former function
+#
+   def benchmark(self,name,formerFunc,currentFunc,arguments,setup=None, \
+      currentArguments=None):
+      if currentArguments is None:
+         currentArguments=arguments
+      formerTimes,expected=self.timeFunction(formerFunc,arguments)
+      times,results=self.timeFunction(currentFunc,currentArguments,setup)
+      if results!=expected:
+         raise capasmError("Micro benchmark "+name+ \
+            ": results differ from the former implementation")
+      result= { "name": name, "tool": "micro", "lines": len(arguments), \
+         "runs": len(times), "min": times[0], \
+         "median": times[len(times)//2], "max": times[-1] }
+      self.__results__.append(result)
+      if self.__verbose__:
+         print("{:24s} {:10.3f} {:10.3f} {:9.1f}x".format(name, \
+            formerTimes[0]*1000.0,times[0]*1000.0, \
+            formerTimes[0]/max(times[0],1e-9)))
+      return result
+#
+#  Get the symbol names and numbers of a source file. Symbol names are
+#  labels and operands which begin with a letter. Numbers are register
+#  numbers and numbers in operands and expressions
+#
+   def getOperands(self,sourceFile,dialect):
+      scanner=clsLineScanner(dialect.commentLineChar, \
+         dialect.commentTrailerChar,dialect.stringDelimiters)
+      names=[]
+      numbers=[]
+      try:
+         with open(sourceFile,"r") as f:
+            for line in f:
+               scannedLine=scanner.scanLine(line.strip("\r\n"))
+               if scannedLine[1] is not None:
+                  names.append(scannedLine[1].string)
+               for tok in scannedLine[3]:
+                  name=tok.string.lstrip("=")
+                  if name[:1].isalpha():
+                     names.append(name)
+                  if re.fullmatch("[RX][0-9]+",name):
+                     numbers.append(name[1:])
+                  else:
+                     numbers+=MICRO_NUMBER_PATTERN.findall(name)
+      except (OSError,UnicodeDecodeError):
+         raise capasmError("cannot read source file "+sourceFile)
+      return names,numbers
+#
+#  Generate random ncas expressions with numbers, symbols, the location
+#  counter, parentheses and size specifiers. Symbols are enclosed in
+#  parentheses, because a symbol name is only terminated by a blank, a
+#  right parenthesis or the end of the expression
+#
+   def generateExpression(self,rnd,depth=0):
+      choice=rnd.random()
+      if depth >= 2 or choice < 0.4:
+         item=rnd.random()
+         if item < 0.45:
+            return "(S{:d})".format(rnd.randrange(MICRO_NUM_SYMBOLS))
+         elif item < 0.9:
+            return "{:o}".format(rnd.randrange(64))
+         else:
+            return "$"
+      if choice < 0.45:
+         return "-"+"("+self.generateExpression(rnd,depth+1)+")"
+      if choice < 0.5:
+         return "("+self.generateExpression(rnd,depth+1)+").{:d}".format( \
+            rnd.randrange(1,4))
+      return self.generateExpression(rnd,depth+1)+ \
+         rnd.choice("+-*/%&|")+self.generateExpression(rnd,depth+1)
+#
+#  Create the expression object of ncas with a symbol table, returns the
+#  expression object and the symbol table
+#
+   def createExpression(self,rnd):
+      globVar=clsGlobVar()
+      globVar.dialect=clsNcas().getDialect()
+      globVar.symNamLen=32
+      globVar.PC=0o40000
+      globVar.symDict=clsSymDict(False,"none",globVar.dialect.symTypes)
+      for i in range(MICRO_NUM_SYMBOLS):
+         value=rnd.randrange(-4,1000)
+         globVar.symDict.enter("S{:d}".format(i),clsSymDict.SYM_EQU,value, \
+            2,None)
+      return clsExpression(globVar),globVar.symDict
+#
+#  Run all micro benchmarks
+#
+   def run(self,numLines,includeDepth=3,seed=1):
+      if self.__verbose__:
+         print("{:24s} {:>10s} {:>10s} {:>10s}".format("micro benchmark", \
+            "former ms","current ms","speedup"))
+      sourceNames=[]
+      for tool,generator,dialect,length in [ \
+         ("capasm",clsCapasmGenerator,clsAssembler().getDialect(),6), \
+         ("ncas",clsNcasGenerator,clsNcas().getDialect(),32)]:
+         name="{:s}micro{:d}".format(tool[0],numLines)
+         generator(numLines,includeDepth,seed).generate( \
+            self.__workDirectory__,name)
+         names=[]
+         numbers=list(NUMBER_CHECK_STRINGS)
+         for fileName in [name+".asm"]+["{:s}{:d}.inc".format(name,i+1) \
+            for i in range(includeDepth)]:
+            fileNames,fileNumbers=self.getOperands(os.path.join( \
+               self.__workDirectory__,fileName),dialect)
+            names+=fileNames
+            numbers+=fileNumbers
+#
+#        label validation with the precompiled label validators
+#
+         labelMatchString=dialect.labelMatchString
+         validator=clsLabelValidator(labelMatchString,length)
+         self.benchmark("label-"+tool, \
+            lambda n: parseFunc.parseLabel(n,length,labelMatchString), \
+            validator.parseLabel,names)
+#
+#        table driven number parser, the cache is cleared before each
+#        repetition
+#
+         self.benchmark("number-"+tool,referenceParseNumber, \
+            parseFunc.parseNumber,numbers, \
+            parseFunc.__numberCache__.clear)
+#
+#        symbol lookup by slot index
+#
+         symDict=clsSymDict(False,"none",dialect.symTypes)
+         for symName in sorted(set(names)):
+            symDict.enter(symName,clsSymDict.SYM_LCL,len(symName),2,None)
+         slots=[symDict.bind(symName) for symName in names]
+         symDict.bindLocals()
+         lineInfo=[name+".asm",1]
+         self.benchmark("symbol-"+tool, \
+            lambda n: symDict.get(n,lineInfo), \
+            lambda slot: symDict.getSlot(slot,lineInfo),names,None, \
+            slots)
+         sourceNames+=names
+#
+#     compiled ncas expressions
+#
+      rnd=random.Random(seed)
+      expression,symDict=self.createExpression(rnd)
+      parsedExpressions=[]
+      while len(parsedExpressions) < numLines:
+         parsedExpression,errors=expression.parse( \
+            self.generateExpression(rnd),2)
+         if not errors:
+            parsedExpressions.append(parsedExpression)
+      self.benchmark("expression-ncas", \
+         lambda p: referenceExecute(expression,symDict,p,None), \
+         lambda p: tuple(expression.execute(p,None)),parsedExpressions)
+#
+#     global symbol tables: load the Python and the binary tables, look up
+#     the symbols of the HP-75 table and the symbol names of the sources.
+#     The lookup cache of the binary table is cleared before each repetition
+#
+      baseName=os.path.join(os.path.dirname(os.path.abspath( \
+         capasm.__file__)),"globals")
+      tableNames=[baseName+globalSymbolFile for globalSymbolFile in \
+         ["75","85","87","none"]]*MICRO_TABLE_LOADS
+      self.benchmark("globals-load", \
+         lambda n: len(loadGlobalSymbolModule(n+".py").symbols), \
+         lambda n: len(clsGlobalSymbolTable(n+clsGlobalSymbolTable.SUFFIX)), \
+         tableNames)
+      globalSymbols=loadGlobalSymbolModule(baseName+"75.py")
+      table=clsGlobalSymbolTable.load(baseName+"75"+ \
+         clsGlobalSymbolTable.SUFFIX,baseName+"75.py")
+      self.benchmark("globals-lookup",globalSymbols.get,table.get, \
+         sorted(globalSymbols.symbols.keys())+sourceNames, \
+         table.__results__.clear)
+      return { "format": BENCHMARK_FORMAT_VERSION, \
+         "capasmVersion": CAPASM_VERSION, \
+         "python": platform.python_version(), \
+         "platform": platform.platform(), \
+         "benchmarks": sorted(self.__results__,key=lambda r: r["name"]) }
+
+#
+# Main program ---------------------------------------------------------------
+#
+def capcheck():
+
+   argparser=argparse.ArgumentParser(description=\
+   "Equivalence checks of the capasm and ncas assemblers against the former implementations")
+   argparser.add_argument("--scannercheck",nargs="*",default=None, \
+      metavar="SOURCEFILE", \
+      help="compare the line scanner with the reference scanner for the source files, the bundled sample sources and generated sources")
+   argparser.add_argument("--micro",action='store_true', \
+      help="run the in process micro benchmarks")
+   argparser.add_argument("-n","--lines",type=int,default=10000, \
+      help="number of lines of the generated sources (default: 10000)")
+   argparser.add_argument("-r","--repeat",type=int,default=3, \
+      help="number of runs of each micro benchmark (default: 3)")
+   argparser.add_argument("-i","--includedepth",type=int,default=3, \
+      choices=[0,1,2,3],help="depth of the include file chain (default: 3)")
+   argparser.add_argument("-s","--seed",type=int,default=1, \
+      help="seed of the source generator (default: 1)")
+   argparser.add_argument("-d","--directory",default="", \
+      help="directory for the generated files (default: temporary directory)")
+   argparser.add_argument("-o","--output",default="", \
+      help="write the micro benchmark results to this JSON file")
+   argparser.add_argument("-c","--compare",default="", \
+      help="compare the micro benchmark results with this JSON file of a previous run")
+   argparser.add_argument("--threshold",type=float,default=10.0, \
+      help="exit with error if a micro benchmark is slower than the previous run by this percentage (default: 10)")
+   args= argparser.parse_args()
+   if args.scannercheck is None and not args.micro:
+      argparser.error("specify --scannercheck or --micro")
+
+   if args.scannercheck is not None:
+      sourceFiles=list(args.scannercheck)+getBundledSources()
+      try:
+         with tempfile.TemporaryDirectory() as directory:
+            clsCapasmGenerator(args.lines,args.includedepth,args.seed). \
+               generate(directory,"cbench{:d}".format(args.lines))
+            clsNcasGenerator(args.lines,args.includedepth,args.seed). \
+               generate(directory,"nbench{:d}".format(args.lines))
+            for fileName in sorted(os.listdir(directory)):
+               sourceFiles.append(os.path.join(directory,fileName))
+            numDifferences=checkScanner(sourceFiles)
+      except capasmError as e:
+         print(e.msg)
+         sys.exit(1)
+      print("{:d} difference(s)".format(numDifferences))
+      if numDifferences:
+         sys.exit(1)
+      return
+
+   previous=None
+   if args.compare!="":
+      try:
+         with open(args.compare,"r") as f:
+            previous=json.load(f)
+      except (OSError,ValueError):
+         print("cannot read benchmark results "+args.compare)
+         sys.exit(1)
+   try:
+      if args.directory=="":
+         with tempfile.TemporaryDirectory() as directory:
+            runner=clsMicroBenchmark(directory,args.repeat)
+            results=runner.run(args.lines,args.includedepth,args.seed)
+      else:
+         os.makedirs(args.directory,exist_ok=True)
+         runner=clsMicroBenchmark(args.directory,args.repeat)
+         results=runner.run(args.lines,args.includedepth,args.seed)
+   except capasmError as e:
+      print(e.msg)
+      sys.exit(1)
+   if args.output!="":
+      try:
+         with open(args.output,"w") as f:
+            json.dump(results,f,indent=3,sort_keys=True)
+            f.write("\n")
+      except OSError:
+         print("cannot write benchmark results "+args.output)
+         sys.exit(1)
+   if previous is not None:
+      print("")
+      if compareResults(previous,results,args.threshold):
+         sys.exit(1)
+
+if __name__ == '__main__':
+   capcheck()